@@ -0,0 +1,139 @@
+"""
+发帖频率计数器的性能测试
+
+模拟若干轮审查 每轮产出最近一段时间内的全部对象 其中大部分已在之前的轮次中出现过
+发布者服从长尾分布 少数用户在短时间内集中发帖
+比较ActivityTracker与按用户保存全部发布时间的朴素实现的计入与查询耗时 内存占用 并校验两者的查询结果
+朴素实现的内存随审查时长线性增长 计数器的内存只取决于用户数与去重集合的大小
+
+python benchmarks/bench_activity.py --users 50000 --rate 50 --cycles 60 240
+"""
+
+from __future__ import annotations
+
+import argparse
+import bisect
+import random
+import sys
+import time
+from collections import defaultdict
+
+from aiotieba_reviewer.activity import ActivityTracker
+
+
+class NaiveTracker:
+    def __init__(self) -> None:
+        self.history: defaultdict[int, list[float]] = defaultdict(list)
+        self.seen: set[int] = set()
+
+    def add(self, user_id: int, pid: int, ts: float) -> None:
+        if pid in self.seen:
+            return
+        self.seen.add(pid)
+        bisect.insort(self.history[user_id], ts)
+
+    def count(self, user_id: int, within: float, now: float) -> int:
+        history = self.history.get(user_id, ())
+        return len(history) - bisect.bisect_left(history, now - within)
+
+
+def gen_stream(args: argparse.Namespace) -> list[tuple[int, int, float]]:
+    """
+    Returns:
+        list[tuple[int, int, float]]: 按发布时间排序的(user_id, pid, 发布时间)
+    """
+
+    rng = random.Random(args.seed)
+    duration = args.cycles * args.interval
+    total = int(args.rate * duration)
+    weights = [1.0 / (i + 1) for i in range(args.users)]
+    users = rng.choices(range(1, args.users + 1), weights=weights, k=total)
+    stream = [(user_id, pid, rng.uniform(0, duration)) for pid, user_id in enumerate(users, 1)]
+    # 刷屏用户在两分钟内集中发帖
+    for burst in range(args.bursts):
+        user_id = args.users + burst + 1
+        start = rng.uniform(0, duration - 120)
+        stream.extend((user_id, total + burst * 1000 + i, start + rng.uniform(0, 120)) for i in range(args.burst_size))
+    stream.sort(key=lambda x: x[2])
+    return stream
+
+
+def main(args: argparse.Namespace) -> None:
+    stream = gen_stream(args)
+    tracker = ActivityTracker(args.resolution, args.num_buckets, args.users * 2)
+    naive = NaiveTracker()
+
+    tracker_add = naive_add = tracker_query = naive_query = 0.0
+    fed = queries = mismatches = 0
+    lo = 0
+    checks = []
+    for cycle in range(1, args.cycles + 1):
+        now = cycle * args.interval
+        hi = bisect.bisect_right(stream, now, key=lambda x: x[2])
+        # 每轮产出最近lookback秒内发布的对象
+        lo = bisect.bisect_left(stream, now - args.lookback, key=lambda x: x[2])
+        batch = stream[lo:hi]
+        fed += len(batch)
+
+        start = time.perf_counter()
+        for user_id, pid, ts in batch:
+            tracker.add(user_id, pid, ts, now)
+        tracker_add += time.perf_counter() - start
+
+        start = time.perf_counter()
+        for user_id, pid, ts in batch:
+            naive.add(user_id, pid, ts)
+        naive_add += time.perf_counter() - start
+
+        # 对本轮产出的新对象的发布者查询两分钟内的发帖数
+        new_users = [user_id for user_id, _, ts in batch if ts > now - args.interval]
+        start = time.perf_counter()
+        res = [tracker.count(user_id, 120.0, now) for user_id in new_users]
+        tracker_query += time.perf_counter() - start
+        start = time.perf_counter()
+        expected = [naive.count(user_id, 120.0, now) for user_id in new_users]
+        naive_query += time.perf_counter() - start
+        queries += len(new_users)
+        checks.extend(zip(res, expected, strict=True))
+
+    # 计数器以桶为粒度 允许多统计最早一个桶内的对象
+    mismatches = sum(a < b for a, b in checks)
+    over = sum(a - b for a, b in checks if a > b) / max(sum(b for _, b in checks), 1)
+    flagged = sum(1 for a, _ in checks if a >= args.burst_size)
+    expected_flagged = sum(1 for _, b in checks if b >= args.burst_size)
+
+    naive_mem = naive_size(naive)
+    print(f"objects={len(stream)} fed={fed} queries={queries} tracked users={len(tracker)} evicted={tracker.evicted}")
+    print(
+        f"  undercounts={mismatches} overcount ratio={over:.4f} "
+        f"queries over {args.burst_size}/2min={flagged} (exact {expected_flagged})"
+    )
+    print(
+        f"  add naive={naive_add / fed * 1e6:.2f}us ActivityTracker={tracker_add / fed * 1e6:.2f}us "
+        f"count naive={naive_query / queries * 1e6:.2f}us ActivityTracker={tracker_query / queries * 1e6:.2f}us"
+    )
+    print(f"  memory naive={naive_mem / 2**20:.1f}MiB ActivityTracker={tracker.footprint() / 2**20:.1f}MiB")
+
+
+def naive_size(naive: NaiveTracker) -> int:
+    size = sys.getsizeof(naive.history) + sys.getsizeof(naive.seen)
+    size += sum(sys.getsizeof(h) + 24 * len(h) for h in naive.history.values())
+    return size
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=50000)
+    parser.add_argument("--rate", type=float, default=50.0, help="全吧每秒的发帖数")
+    parser.add_argument("--cycles", type=int, nargs="+", default=[60, 240])
+    parser.add_argument("--interval", type=float, default=30.0, help="两轮审查之间的秒数")
+    parser.add_argument("--lookback", type=float, default=300.0, help="每轮产出的对象的最大发布时长")
+    parser.add_argument("--bursts", type=int, default=20, help="刷屏用户数")
+    parser.add_argument("--burst_size", type=int, default=30, help="每个刷屏用户两分钟内的发帖数")
+    parser.add_argument("--resolution", type=float, default=10.0)
+    parser.add_argument("--num_buckets", type=int, default=90)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    for cycles in args.cycles:
+        main(argparse.Namespace(**{**vars(args), "cycles": cycles}))
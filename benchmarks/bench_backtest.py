@@ -0,0 +1,113 @@
+"""
+归档与回测的性能测试
+
+先在合成吧上以示例检查函数运行若干轮审查 并在生产者阶段归档所有对象
+再用进程池以同一套规则(基准)和追加了一条规则的版本(候选)分别回放档案 输出吞吐量与处罚差异
+
+python benchmarks/bench_backtest.py --threads 60 --mean_posts 40 --cycles 10 --processes 4
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import functools
+import logging
+import os
+import tempfile
+import time
+
+import aiotieba as tb
+from bench_e2e import install_checkers
+from synthetic import FakeClient, FakeDB, ForumSpec, SyntheticForum
+
+import aiotieba_reviewer as tbr
+from aiotieba_reviewer import Ops, Punish
+from aiotieba_reviewer.reviewer import posts, threads
+from aiotieba_reviewer.typing import Post
+
+
+def _setup(spec: ForumSpec, candidate: bool = False) -> None:
+    """
+    在回测的工作进程中注册规则 同一spec生成的合成吧具有相同的违规图片哈希
+    """
+
+    tb.get_logger().setLevel(logging.WARNING)
+    install_checkers(SyntheticForum(spec))
+
+    if candidate:
+
+        @posts.append_filter(side_effect_free=True)
+        async def _low_level_image(post_list: list[Post]) -> list[Punish]:
+            # 候选规则: 1级用户的图片回复
+            return [
+                Punish(p, Ops.DELETE, note="低等级图片") for p in post_list if p.user.level <= 1 and p.contents.imgs
+            ]
+
+
+async def archive(args: argparse.Namespace, spec: ForumSpec, path: str) -> tbr.ArchiveWriter:
+    forum = SyntheticForum(spec)
+    fake_client = FakeClient(forum, seed=args.seed)
+
+    async def _client_generator():
+        while 1:
+            yield fake_client
+
+    tbr.client.client_generator = _client_generator()
+    tbr.set_forum(tbr.Forum(spec.fname, FakeDB(forum)))
+    install_checkers(forum)
+
+    writer = tbr.enable_archive(path, args.segment_size)
+    for _ in range(args.cycles):
+        await threads.runner.ori_runner(spec.fname)
+        forum.evolve(args.churn, args.new_threads)
+    writer.close()
+    return writer
+
+
+def main(args: argparse.Namespace) -> None:
+    spec = ForumSpec(
+        num_threads=args.threads,
+        mean_posts=args.mean_posts,
+        comment_ratio=args.comment_ratio,
+        mean_comments=args.mean_comments,
+        spam_ratio=args.spam_ratio,
+        image_ratio=args.image_ratio,
+        seed=args.seed,
+    )
+    path = os.path.join(os.getcwd(), "archive")
+
+    start = time.perf_counter()
+    writer = asyncio.run(archive(args, spec, path))
+    elapsed = time.perf_counter() - start
+    size = sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+    print(f"archived records={writer.records} skipped={writer.skipped} segments={writer.segments}")
+    print(f"archive size={size / 2**20:.2f}MiB time={elapsed:.2f}s")
+
+    baseline = tbr.backtest(path, functools.partial(_setup, spec), processes=args.processes)
+    print(baseline.report())
+    candidate = tbr.backtest(path, functools.partial(_setup, spec, True), processes=args.processes)
+    print(candidate.report(baseline))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threads", type=int, default=60)
+    parser.add_argument("--mean_posts", type=float, default=20.0)
+    parser.add_argument("--comment_ratio", type=float, default=0.3)
+    parser.add_argument("--mean_comments", type=float, default=5.0)
+    parser.add_argument("--spam_ratio", type=float, default=0.02)
+    parser.add_argument("--image_ratio", type=float, default=0.2)
+    parser.add_argument("--cycles", type=int, default=10)
+    parser.add_argument("--churn", type=int, default=200, help="两次审查之间的新回复数")
+    parser.add_argument("--new_threads", type=int, default=5, help="两次审查之间的新主题帖数")
+    parser.add_argument("--segment_size", type=int, default=1 << 20, help="段文件大小上限 以字节为单位")
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    tb.get_logger().setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        main(args)
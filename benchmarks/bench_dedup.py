@@ -0,0 +1,127 @@
+"""
+近似重复文本索引的性能测试
+
+生成正常文本与若干组刷屏文本 刷屏文本由同一模板经少量字符的插入 删除与替换得到 并由不同用户发布
+比较NearDupIndex与逐对计算精确Jaccard相似度的单条耗时 并以逐对计算的结果为准统计召回率与精确率
+
+python benchmarks/bench_dedup.py --texts 5000 20000 --floods 50 --copies 20
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import time
+import tracemalloc
+
+from synthetic import NORMAL_WORDS
+
+from aiotieba_reviewer.dedup import NearDupIndex, normalize
+
+CHARS = "的一是了我不人在他有这个上们来到时大地为子中你说生国年着就那和要她出也得里后自以会家可下而过天去能对小多然于心学么之都好看起发当没成只如事把还用第样道想作种开美总从无情己面最女但现前些所同日手又行意动方期它头经长儿回位分爱老因很给名法间斯知世什两次使身者被高已亲其进此话常与活正感"
+
+
+def mutate(rng: random.Random, text: str, edits: int) -> str:
+    chars = list(text)
+    for _ in range(edits):
+        i = rng.randrange(len(chars))
+        op = rng.random()
+        if op < 0.4:
+            chars.insert(i, rng.choice(CHARS + " ,.!~"))
+        elif op < 0.7 and len(chars) > 1:
+            del chars[i]
+        else:
+            chars[i] = rng.choice(CHARS)
+    return "".join(chars)
+
+
+def gen_texts(rng: random.Random, num: int, floods: int, copies: int, edits: int) -> list[tuple[str, int, int]]:
+    """
+    Returns:
+        list[tuple[str, int, int]]: (文本, user_id, 刷屏组号) 正常文本的组号为-1
+    """
+
+    texts = []
+    for _ in range(num - floods * copies):
+        parts = rng.choices(NORMAL_WORDS, k=rng.randint(2, 10))
+        parts += ["".join(rng.choices(CHARS, k=rng.randint(1, 4))) for _ in range(rng.randint(2, 15))]
+        rng.shuffle(parts)
+        text = "".join(parts)
+        texts.append((text, rng.randint(1, num), -1))
+    for group in range(floods):
+        template = "".join(rng.choices(CHARS, k=rng.randint(15, 40))) + "加微信" + str(rng.randint(10**6, 10**9))
+        texts.extend((mutate(rng, template, rng.randint(0, edits)), rng.randint(1, num), group) for _ in range(copies))
+    rng.shuffle(texts)
+    return texts
+
+
+def shingles(text: str, ngram: int) -> set[str]:
+    text = normalize(text)
+    return {text[i : i + ngram] for i in range(len(text) - ngram + 1)}
+
+
+def bench(num: int, args: argparse.Namespace) -> None:
+    rng = random.Random(args.seed)
+    texts = gen_texts(rng, num, args.floods, args.copies, args.edits)
+    index_args = {"threshold": args.threshold, "num_perm": args.num_perm, "rows": args.rows}
+
+    index = NearDupIndex(**index_args)
+    start = time.perf_counter()
+    res = [index.observe_text(text, user_id, pid) for pid, (text, user_id, _) in enumerate(texts, 1)]
+    index_time = time.perf_counter() - start
+
+    # 逐对计算精确的Jaccard相似度 作为近似副本数的真值
+    sets = [
+        s if len(normalize(text)) >= index.min_length else None for text, _, _ in texts for s in [shingles(text, 2)]
+    ]
+    start = time.perf_counter()
+    naive = []
+    for i, a in enumerate(sets):
+        copies = 0
+        if a is not None:
+            for b in sets[:i]:
+                if b is not None and len(a & b) >= args.threshold * len(a | b):
+                    copies += 1
+        naive.append(copies)
+    naive_time = time.perf_counter() - start
+
+    found = sum(min(stat.copies, copies) for stat, copies in zip(res, naive, strict=True))
+    reported = sum(stat.copies for stat in res)
+    expected = sum(naive)
+    flagged = sum(stat.copies > 0 for stat, (_, _, group) in zip(res, texts, strict=True) if group >= 0)
+    floods = sum(group >= 0 for _, _, group in texts) - args.floods
+    false_pos = sum(stat.copies > 0 for stat, (_, _, group) in zip(res, texts, strict=True) if group < 0)
+    normal = sum(group < 0 for _, _, group in texts)
+
+    tracemalloc.start()
+    index = NearDupIndex(**index_args)
+    for pid, (text, user_id, _) in enumerate(texts, 1):
+        index.observe_text(text, user_id, pid)
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    print(
+        f"texts={num} entries={len(index)} memory={memory / len(index):.0f}B/entry "
+        f"copy recall={found / max(expected, 1):.3f} copy precision={found / max(reported, 1):.3f} "
+        f"flood flagged={flagged / max(floods, 1):.3f} normal flagged={false_pos / max(normal, 1):.4f}"
+    )
+    print(
+        f"  pairwise jaccard={naive_time / num * 1e6:.1f}us/text NearDupIndex={index_time / num * 1e6:.1f}us/text "
+        f"speedup={naive_time / index_time:.1f}x"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--texts", type=int, nargs="+", default=[5000, 20000])
+    parser.add_argument("--floods", type=int, default=50, help="刷屏组数")
+    parser.add_argument("--copies", type=int, default=20, help="每组刷屏文本数")
+    parser.add_argument("--edits", type=int, default=3, help="每条刷屏文本相对模板的最大编辑次数")
+    parser.add_argument("--threshold", type=float, default=0.5)
+    parser.add_argument("--num_perm", type=int, default=64)
+    parser.add_argument("--rows", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    for num in args.texts:
+        bench(num, args)
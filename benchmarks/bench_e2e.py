@@ -0,0 +1,180 @@
+"""
+端到端审查流程的性能测试
+
+在合成吧上以示例检查函数驱动threads.runner 经posts.runner与comments.runner完成完整的审查循环
+输出每秒检查的对象数 每个对象的API调用数与数据库查询数 内存峰值与审查循环耗时的p99
+
+完全离线运行 SQLite缓存写入临时目录
+
+python benchmarks/bench_e2e.py --threads 30 --mean_posts 40 --latency 0.02 --cycles 20
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+import time
+import tracemalloc
+
+import aiotieba as tb
+from synthetic import SPAM_WORDS, FakeClient, FakeDB, ForumSpec, SyntheticForum, create_local_db
+
+import aiotieba_reviewer as tbr
+from aiotieba_reviewer import Ops, Punish, executor
+from aiotieba_reviewer.perf_stat import aperf_stat
+from aiotieba_reviewer.reviewer import comment, post, thread, threads
+from aiotieba_reviewer.typing import Comment, Post, Thread
+
+
+def install_checkers(forum: SyntheticForum) -> None:
+    """
+    注册示例检查函数 覆盖关键词 图片哈希 等级与刷屏四类常见规则
+    """
+
+    banned_hashes = forum.banned_hashes
+
+    def _spam(text: str) -> bool:
+        return any(word in text for word in SPAM_WORDS)
+
+    @threads.append_filter(side_effect_free=True)
+    async def _flood(thread_list: list[Thread]) -> list[Punish]:
+        # 同一用户在一页内发布超过3个主题帖
+        by_user: dict[int, list[Thread]] = {}
+        for t in thread_list:
+            by_user.setdefault(t.author_id, []).append(t)
+        return [Punish(t, Ops.DELETE, note="刷屏") for ts in by_user.values() if len(ts) > 3 for t in ts[3:]]
+
+    @thread.set_checker()
+    async def _check_thread(t: Thread) -> Punish | None:
+        if _spam(t.text):
+            return Punish(t, Ops.DELETE, 1, note="广告")
+        if any(img.hash in banned_hashes for img in t.contents.imgs):
+            return Punish(t, Ops.DELETE, 10, note="违规图片")
+
+    @post.set_checker()
+    async def _check_post(p: Post) -> Punish | None:
+        if _spam(p.text):
+            return Punish(p, Ops.DELETE, 1 if p.user.level < 4 else 0, note="广告")
+        if any(img.hash in banned_hashes for img in p.contents.imgs):
+            return Punish(p, Ops.DELETE, 10, note="违规图片")
+
+    @comment.set_checker()
+    async def _check_comment(c: Comment) -> Punish | None:
+        if _spam(c.text):
+            return Punish(c, Ops.DELETE, note="广告")
+
+
+def install_shadow(forum: SyntheticForum, sample_rate: float) -> None:
+    """
+    注册候选规则: 对低等级用户更严格的回复检查
+    """
+
+    banned_hashes = forum.banned_hashes
+    tbr.get_shadow_set().sample_rate = sample_rate
+
+    @post.set_checker(shadow=True)
+    async def _check_post_v2(p: Post) -> Punish | None:
+        if any(word in p.text for word in SPAM_WORDS):
+            return Punish(p, Ops.DELETE, 1 if p.user.level < 7 else 0, note="广告")
+        if any(img.hash in banned_hashes for img in p.contents.imgs):
+            return Punish(p, Ops.DELETE, 10, note="违规图片")
+
+    @comment.set_checker(shadow=True)
+    async def _check_comment_v2(c: Comment) -> Punish | None:
+        if any(word in c.text for word in SPAM_WORDS) or len(c.text) > 40:
+            return Punish(c, Ops.DELETE, note="广告")
+
+
+async def main(args: argparse.Namespace) -> None:
+    spec = ForumSpec(
+        num_threads=args.threads,
+        mean_posts=args.mean_posts,
+        post_dist=args.post_dist,
+        comment_ratio=args.comment_ratio,
+        mean_comments=args.mean_comments,
+        spam_ratio=args.spam_ratio,
+        image_ratio=args.image_ratio,
+        seed=args.seed,
+    )
+    forum = SyntheticForum(spec)
+    fake_client = FakeClient(forum, args.latency, error_rate=args.error_rate, seed=args.seed)
+    if args.db == "local":
+        fake_db = await create_local_db(forum, args.db_latency, args.db_latency_p99)
+    else:
+        fake_db = FakeDB(forum, args.db_latency)
+
+    async def _client_generator():
+        while 1:
+            yield fake_client
+
+    tbr.client.client_generator = _client_generator()
+    tbr.set_forum(tbr.Forum(spec.fname, fake_db))
+
+    install_checkers(forum)
+    if args.shadow_rate:
+        install_shadow(forum, args.shadow_rate)
+    if args.no_test:
+        executor.punish_executor = executor.default_punish_executor
+
+    cycle_stat = aperf_stat(args.cycles, window=3600.0, num_windows=1)
+    runner = cycle_stat(threads.runner.ori_runner)
+
+    print(f"forum: threads={len(forum.threads)} objs={forum.num_objs()} spec={spec}")
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    for _ in range(args.cycles):
+        await runner(spec.fname)
+        forum.evolve(args.churn, args.new_threads)
+    await tbr.get_retry_scheduler().join()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    num_objs = sum(tbr.metrics.checked.values())
+    num_calls = sum(fake_client.calls.values())
+    num_queries = sum(fake_db.queries.values())
+    print(f"checked={dict(tbr.metrics.checked)} punished={sum(tbr.metrics.punished.values())}")
+    print(f"api_calls={dict(fake_client.calls)} injected_errors={sum(fake_client.errors.values())}")
+    print(f"objs/s={num_objs / elapsed:.1f}")
+    print(f"api_calls/obj={num_calls / max(num_objs, 1):.4f}")
+    print(f"db_queries/obj={num_queries / max(num_objs, 1):.4f}")
+    print(f"peak_memory={peak / 2**20:.2f}MiB")
+    print(f"cycle avg={cycle_stat.avg_time:.2f}ms p50={cycle_stat.p50:.2f}ms p99={cycle_stat.p99:.2f}ms")
+    if args.shadow_rate:
+        tbr.get_shadow_set().stop()
+        print(tbr.get_shadow_set().report())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threads", type=int, default=30)
+    parser.add_argument("--mean_posts", type=float, default=20.0)
+    parser.add_argument("--post_dist", choices=["geometric", "pareto"], default="geometric")
+    parser.add_argument("--comment_ratio", type=float, default=0.3)
+    parser.add_argument("--mean_comments", type=float, default=5.0)
+    parser.add_argument("--spam_ratio", type=float, default=0.02)
+    parser.add_argument("--image_ratio", type=float, default=0.2)
+    parser.add_argument("--latency", type=float, default=0.0, help="平均API延迟 以秒为单位")
+    parser.add_argument("--db_latency", type=float, default=0.0, help="数据库查询延迟 以秒为单位")
+    parser.add_argument("--db_latency_p99", type=float, default=0.0, help="数据库查询延迟的p99 仅用于--db local")
+    parser.add_argument("--db", choices=["fake", "local"], default="fake", help="local表示经由LocalDB执行真实的SQL查询")
+    parser.add_argument("--error_rate", type=float, default=0.0)
+    parser.add_argument("--cycles", type=int, default=10)
+    parser.add_argument("--churn", type=int, default=50, help="两次审查之间的新回复数")
+    parser.add_argument("--new_threads", type=int, default=2, help="两次审查之间的新主题帖数")
+    parser.add_argument("--no_test", action="store_true", help="实际执行删封 删封会修改合成吧的状态")
+    parser.add_argument("--shadow_rate", type=float, default=0.0, help="以该比例抽样评估候选规则 0表示不启用")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true", help="输出审查日志")
+    args = parser.parse_args()
+
+    if not args.verbose:
+        tb.get_logger().setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        asyncio.run(main(args))
@@ -0,0 +1,83 @@
+"""
+过滤器结果处理的性能测试
+
+对比逐条list.remove与按id集合原地压缩两种实现在大页面与大量过滤器下的耗时
+
+python benchmarks/bench_filters.py --page_size 5000 --num_filters 64
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import random
+import time
+
+from aiotieba_reviewer import Ops, Punish
+from aiotieba_reviewer.reviewer.filter_runner import apply_filters
+
+
+class FakeObj:
+    __slots__ = ["pid"]
+
+    def __init__(self, pid: int) -> None:
+        self.pid = pid
+
+    def __eq__(self, rhs: FakeObj) -> bool:
+        return self.pid == rhs.pid
+
+    def __hash__(self) -> int:
+        return self.pid
+
+
+def make_filter(ratio: float, seed: int):
+    async def _filter(objs: list[FakeObj]) -> list[Punish]:
+        rng = random.Random(seed)
+        return [Punish(obj, Ops.DELETE) for obj in objs if rng.random() < ratio]
+
+    return _filter
+
+
+async def legacy_apply(filters, objs: list[FakeObj]) -> list[Punish]:
+    res = []
+    for filt in filters:
+        punishes = await filt(objs)
+        if punishes is None:
+            continue
+        for punish in punishes:
+            if punish:
+                objs.remove(punish.obj)
+                res.append(punish)
+    return res
+
+
+async def main(page_size: int, num_filters: int, ratio: float, repeat: int) -> None:
+    filters = [make_filter(ratio, i) for i in range(num_filters)]
+
+    for name, side_effect_free in [("sequential", set()), ("concurrent", set(filters))]:
+        best = float("inf")
+        for _ in range(repeat):
+            objs = [FakeObj(i) for i in range(page_size)]
+            start = time.perf_counter()
+            punishes = await apply_filters(filters, side_effect_free, objs)
+            best = min(best, time.perf_counter() - start)
+        print(f"apply_filters[{name}] best={best * 1e3:.2f}ms punished={len(punishes)} left={len(objs)}")
+
+    best = float("inf")
+    for _ in range(repeat):
+        objs = [FakeObj(i) for i in range(page_size)]
+        start = time.perf_counter()
+        punishes = await legacy_apply(filters, objs)
+        best = min(best, time.perf_counter() - start)
+    print(f"list.remove best={best * 1e3:.2f}ms punished={len(punishes)} left={len(objs)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--page_size", type=int, default=5000)
+    parser.add_argument("--num_filters", type=int, default=64)
+    parser.add_argument("--ratio", type=float, default=0.01)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    asyncio.run(main(args.page_size, args.num_filters, args.ratio, args.repeat))
@@ -0,0 +1,135 @@
+"""
+经由本地替身服务的端到端审查流程性能测试
+
+在独立线程的事件循环中启动贴吧接口的替身服务 真实的aiotieba.Client通过StandInConnector连接该服务
+审查流程因此包含protobuf序列化 连接池与http解析等真实的I/O开销
+删封请求会修改替身服务背后的合成吧
+
+python benchmarks/bench_http.py --threads 30 --mean_posts 40 --cycles 20 --no_test
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import aiotieba as tb
+from bench_e2e import install_checkers
+from standin import StandInServer, bench_account, redirect_client
+from synthetic import FakeDB, ForumSpec, SyntheticForum, create_local_db
+
+import aiotieba_reviewer as tbr
+from aiotieba_reviewer import executor
+from aiotieba_reviewer.perf_stat import aperf_stat
+from aiotieba_reviewer.reviewer import threads
+
+
+def start_server(server: StandInServer) -> asyncio.AbstractEventLoop:
+    """
+    在独立线程的事件循环中启动替身服务 使其不与审查流程争用同一个事件循环
+    """
+
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name="stand-in", daemon=True).start()
+    asyncio.run_coroutine_threadsafe(server.start(), loop).result()
+    return loop
+
+
+async def main(args: argparse.Namespace) -> None:
+    spec = ForumSpec(
+        num_threads=args.threads,
+        mean_posts=args.mean_posts,
+        post_dist=args.post_dist,
+        comment_ratio=args.comment_ratio,
+        mean_comments=args.mean_comments,
+        spam_ratio=args.spam_ratio,
+        image_ratio=args.image_ratio,
+        seed=args.seed,
+    )
+    forum = SyntheticForum(spec)
+    server = StandInServer(forum, args.latency, args.error_rate, args.seed)
+    server_loop = start_server(server)
+    if args.db == "local":
+        fake_db = await create_local_db(forum, args.db_latency, args.db_latency_p99)
+    else:
+        fake_db = FakeDB(forum, args.db_latency)
+
+    async with tb.Client(account=bench_account()) as client:
+        await redirect_client(client, server.port)
+
+        async def _client_generator():
+            while 1:
+                yield client
+
+        tbr.client.client_generator = _client_generator()
+        tbr.set_forum(tbr.Forum(spec.fname, fake_db))
+
+        install_checkers(forum)
+        if args.no_test:
+            executor.punish_executor = executor.default_punish_executor
+
+        cycle_stat = aperf_stat(args.cycles, window=3600.0, num_windows=1)
+        runner = cycle_stat(threads.runner.ori_runner)
+
+        print(f"forum: threads={len(forum.threads)} objs={forum.num_objs()} port={server.port}")
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        for _ in range(args.cycles):
+            await runner(spec.fname)
+            forum.evolve(args.churn, args.new_threads)
+        await tbr.get_retry_scheduler().join()
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    asyncio.run_coroutine_threadsafe(server.stop(), server_loop).result()
+    server_loop.call_soon_threadsafe(server_loop.stop)
+
+    num_objs = sum(tbr.metrics.checked.values())
+    num_requests = sum(server.requests.values())
+    print(f"checked={dict(tbr.metrics.checked)} punished={sum(tbr.metrics.punished.values())}")
+    print(f"requests={dict(server.requests)}")
+    print(f"blocked={len(forum.blocked)} deleted={len(forum.deleted)} hidden={len(forum.hidden)}")
+    print(f"objs/s={num_objs / elapsed:.1f}")
+    print(f"requests/obj={num_requests / max(num_objs, 1):.4f}")
+    print(f"bytes/obj={server.bytes_sent / max(num_objs, 1):.1f}")
+    print(f"db_queries/obj={sum(fake_db.queries.values()) / max(num_objs, 1):.4f}")
+    print(f"peak_memory={peak / 2**20:.2f}MiB")
+    print(f"cycle avg={cycle_stat.avg_time:.2f}ms p50={cycle_stat.p50:.2f}ms p99={cycle_stat.p99:.2f}ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threads", type=int, default=30)
+    parser.add_argument("--mean_posts", type=float, default=20.0)
+    parser.add_argument("--post_dist", choices=["geometric", "pareto"], default="geometric")
+    parser.add_argument("--comment_ratio", type=float, default=0.3)
+    parser.add_argument("--mean_comments", type=float, default=5.0)
+    parser.add_argument("--spam_ratio", type=float, default=0.02)
+    parser.add_argument("--image_ratio", type=float, default=0.2)
+    parser.add_argument("--latency", type=float, default=0.0, help="替身服务的平均处理延迟 以秒为单位")
+    parser.add_argument("--db_latency", type=float, default=0.0, help="数据库查询延迟 以秒为单位")
+    parser.add_argument("--db_latency_p99", type=float, default=0.0, help="数据库查询延迟的p99 仅用于--db local")
+    parser.add_argument("--db", choices=["fake", "local"], default="fake", help="local表示经由LocalDB执行真实的SQL查询")
+    parser.add_argument("--error_rate", type=float, default=0.0, help="替身服务返回503的概率")
+    parser.add_argument("--cycles", type=int, default=10)
+    parser.add_argument("--churn", type=int, default=50, help="两次审查之间的新回复数")
+    parser.add_argument("--new_threads", type=int, default=2, help="两次审查之间的新主题帖数")
+    parser.add_argument("--no_test", action="store_true", help="实际执行删封")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true", help="输出审查日志")
+    args = parser.parse_args()
+
+    if not args.verbose:
+        tb.get_logger().setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        asyncio.run(main(args))
@@ -0,0 +1,142 @@
+"""
+检查函数记忆化的性能测试
+
+生成一批回复 其中包含大量复制粘贴的广告 表情回复 常见短回复与重复的表情包图片
+检查函数模拟一次`get_homepage`的网络延迟与少量计算 结果只取决于内容与用户等级
+按posts runner的方式每50条并发检查 检查函数内的请求受并发上限约束 比较直接执行与经由CheckerMemo执行的检查函数调用次数与耗时 并校验两者的处罚结果一致
+
+python benchmarks/bench_memo.py --posts 5000 --latency 0.02 --concurrency 8
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import hashlib
+import random
+import time
+
+from aiotieba.api._classdef.contents import FragEmoji, FragText
+from aiotieba.api.get_posts._classdef import Contents_p, FragImage_p, Post, UserInfo_p
+from synthetic import NORMAL_WORDS, SPAM_WORDS
+
+from aiotieba_reviewer import Ops, Punish
+from aiotieba_reviewer.reviewer.memo import CheckerMemo
+
+SHORT_REPLIES = ["顶", "好帖", "mark", "dd", "前排", "支持一下", "哈哈哈哈", "来了"]
+EMOJIS = [f"image_emoticon{i}" for i in range(1, 30)]
+
+
+def gen_posts(rng: random.Random, num: int, args: argparse.Namespace) -> list[Post]:
+    templates = [
+        "".join(rng.choices(NORMAL_WORDS, k=rng.randint(3, 8)))
+        + rng.choice(SPAM_WORDS)
+        + str(rng.randint(10**6, 10**9))
+        for _ in range(args.templates)
+    ]
+    memes = [f"{rng.getrandbits(160):040x}" for _ in range(args.memes)]
+
+    posts = []
+    for pid in range(1, num + 1):
+        user_id = rng.randint(1, 10**6)
+        level = min(int(rng.expovariate(0.25)) + 1, 18)
+        x = rng.random()
+        imgs = []
+        if x < args.ad_ratio:
+            objs = [FragText(rng.choice(templates))]
+        elif x < args.ad_ratio + args.short_ratio:
+            objs = [FragText(rng.choice(SHORT_REPLIES))]
+            if rng.random() < 0.5:
+                objs = [FragEmoji(id=rng.choice(EMOJIS), desc="")]
+        elif x < args.ad_ratio + args.short_ratio + args.meme_ratio:
+            hash_ = rng.choice(memes)
+            src = f"http://tiebapic.baidu.com/forum/pic/item/{hash_}.jpg"
+            imgs = [FragImage_p(src=src, big_src=src, origin_src=src, hash=hash_)]
+            objs = list(imgs)
+        else:
+            objs = [FragText("".join(rng.choices(NORMAL_WORDS, k=rng.randint(3, 30))) + str(pid))]
+        texts = [o for o in objs if isinstance(o, FragText)]
+        user = UserInfo_p(user_id=user_id, portrait=f"tb.1.{user_id:08x}", user_name=f"user{user_id}", level=level)
+        posts.append(
+            Post(
+                contents=Contents_p(objs=objs, texts=texts, imgs=imgs),
+                tid=1,
+                pid=pid,
+                user=user,
+                author_id=user_id,
+                floor=pid + 1,
+            )
+        )
+    return posts
+
+
+def make_checker(latency: float, concurrency: int, banned: set[str]):
+    calls = [0]
+    # 模拟速率控制下的并发上限
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def _check_post(p: Post) -> Punish | None:
+        calls[0] += 1
+        # 模拟get_homepage等网络请求与图片分析
+        async with semaphore:
+            await asyncio.sleep(latency)
+        for img in p.contents.imgs:
+            hashlib.sha256(img.hash.encode() * 64).digest()
+            if img.hash in banned:
+                return Punish(p, Ops.DELETE, 10, note="违规图片", rule="image")
+        if any(word in p.text for word in SPAM_WORDS):
+            return Punish(p, Ops.DELETE, 1 if p.user.level < 4 else 0, note="广告", rule="spam")
+
+    return _check_post, calls
+
+
+async def run(posts: list[Post], checker) -> tuple[dict[int, tuple], float]:
+    res = {}
+    start = time.perf_counter()
+    for i in range(0, len(posts), 50):
+        batch = posts[i : i + 50]
+        punishes = await asyncio.gather(*[checker(p) for p in batch])
+        for p, punish in zip(batch, punishes, strict=True):
+            res[p.pid] = None if punish is None else (punish.obj.pid, punish.op, punish.day, punish.note, punish.rule)
+    return res, time.perf_counter() - start
+
+
+async def main(args: argparse.Namespace) -> None:
+    rng = random.Random(args.seed)
+    posts = gen_posts(rng, args.posts, args)
+    banned = {img.hash for p in posts[:200] for img in p.contents.imgs}
+
+    checker, calls = make_checker(args.latency, args.concurrency, banned)
+    expected, base_time = await run(posts, checker)
+    base_calls = calls[0]
+
+    memo = CheckerMemo(maxsize=args.maxsize, ttl=args.ttl)
+    checker, calls = make_checker(args.latency, args.concurrency, banned)
+    res, memo_time = await run(posts, memo.wrap("post", checker))
+    stat = memo.stats["post"]
+
+    mismatches = sum(res[pid] != expected[pid] for pid in expected)
+    print(f"posts={len(posts)} mismatches={mismatches} cached entries={len(memo._caches['post'])}")
+    print(
+        f"  checker calls direct={base_calls} memo={calls[0]} "
+        f"hits={stat.hits} coalesced={stat.coalesced} hit_ratio={stat.hit_ratio:.2%}"
+    )
+    print(f"  time direct={base_time:.2f}s memo={memo_time:.2f}s speedup={base_time / memo_time:.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--posts", type=int, default=5000)
+    parser.add_argument("--latency", type=float, default=0.02, help="检查函数的模拟延迟 以秒为单位")
+    parser.add_argument("--concurrency", type=int, default=8, help="检查函数内网络请求的并发上限")
+    parser.add_argument("--ad_ratio", type=float, default=0.15, help="复制粘贴广告的比例")
+    parser.add_argument("--short_ratio", type=float, default=0.2, help="短回复与纯表情回复的比例")
+    parser.add_argument("--meme_ratio", type=float, default=0.1, help="重复表情包图片的比例")
+    parser.add_argument("--templates", type=int, default=20, help="广告模板数")
+    parser.add_argument("--memes", type=int, default=50, help="表情包图片数")
+    parser.add_argument("--maxsize", type=int, default=10000)
+    parser.add_argument("--ttl", type=float, default=600.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    asyncio.run(main(args))
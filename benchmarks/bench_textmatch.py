@@ -0,0 +1,102 @@
+"""
+多模式文本匹配器的性能测试
+
+随机生成关键词与正则表达式规则 比较TextMatcher与逐条re.search的单条文本耗时 并校验两者的匹配结果一致
+
+python benchmarks/bench_textmatch.py --rules 1000 10000 --texts 2000
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import re
+import time
+
+from synthetic import NORMAL_WORDS, SPAM_WORDS
+
+from aiotieba_reviewer.textmatch import TextMatcher
+
+CHARS = "的一是了我不人在他有这个上们来到时大地为子中你说生国年着就那和要她出也得里后自以会家可下而过天去能对小多然于心学么之都好看起发当没成只如事把还用第样道想作种开美总从无情己面最女但现前些所同日手又行意动方期它头经长儿回位分爱老因很给名法间斯知世什两次使身者被高已亲其进此话常与活正感"
+
+
+def gen_rules(rng: random.Random, num: int, regex_ratio: float, atomless_ratio: float) -> list[tuple[str, str, bool]]:
+    rules = []
+    for i in range(num):
+        x = rng.random()
+        a = "".join(rng.choices(CHARS, k=rng.randint(2, 3)))
+        b = "".join(rng.choices(CHARS, k=rng.randint(1, 2)))
+        if x < atomless_ratio:
+            rules.append((f"r{i}", f"[{a}]\\d{{{rng.randint(4, 8)}}}", True))
+        elif x < regex_ratio:
+            rules.append((f"r{i}", rng.choice([f"{a}.?{b}", f"{a}\\d+", f"{a}[^,]{{0,3}}{b}"]), True))
+        else:
+            rules.append((f"r{i}", a, False))
+    rules.extend((f"spam{i}", word, False) for i, word in enumerate(SPAM_WORDS))
+    return rules
+
+
+def gen_texts(rng: random.Random, num: int) -> list[str]:
+    texts = []
+    for _ in range(num):
+        parts = rng.choices(NORMAL_WORDS, k=rng.randint(3, 30))
+        parts += ["".join(rng.choices(CHARS, k=rng.randint(1, 4))) for _ in range(rng.randint(0, 10))]
+        if rng.random() < 0.05:
+            parts.append(rng.choice(SPAM_WORDS))
+        if rng.random() < 0.05:
+            parts.append(str(rng.randint(10**5, 10**9)))
+        rng.shuffle(parts)
+        texts.append("".join(parts))
+    return texts
+
+
+def bench(num_rules: int, texts: list[str], args: argparse.Namespace) -> None:
+    rng = random.Random(args.seed)
+    rules = gen_rules(rng, num_rules, args.regex_ratio, args.atomless_ratio)
+
+    start = time.perf_counter()
+    matcher = TextMatcher()
+    for rule_id, rule, is_regex in rules:
+        if is_regex:
+            matcher.add_regex(rule_id, rule)
+        else:
+            matcher.add_keyword(rule_id, rule)
+    matcher.compile()
+    compile_time = time.perf_counter() - start
+
+    naive = [(rule_id, re.compile(rule if is_regex else re.escape(rule))) for rule_id, rule, is_regex in rules]
+    normalized = [matcher.normalize(t) for t in texts]
+
+    start = time.perf_counter()
+    naive_res = [{rule_id for rule_id, pattern in naive if pattern.search(t)} for t in normalized]
+    naive_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    res = [matcher.match(t) for t in texts]
+    matcher_time = time.perf_counter() - start
+
+    mismatches = sum(a != b for a, b in zip(naive_res, res, strict=True))
+    hits = sum(len(r) for r in res)
+    num = len(texts)
+    print(
+        f"rules={len(rules)} compile={compile_time * 1e3:.1f}ms states={len(matcher._goto)} "
+        f"atomless={len(matcher._atomless)} hits/text={hits / num:.2f} mismatches={mismatches}"
+    )
+    print(
+        f"  re.search loop={naive_time / num * 1e6:.1f}us/text TextMatcher={matcher_time / num * 1e6:.1f}us/text "
+        f"speedup={naive_time / matcher_time:.1f}x"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rules", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--texts", type=int, default=2000)
+    parser.add_argument("--regex_ratio", type=float, default=0.1, help="正则表达式规则的比例")
+    parser.add_argument("--atomless_ratio", type=float, default=0.01, help="不含必需字面量的正则表达式的比例")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    texts = gen_texts(random.Random(args.seed + 1), args.texts)
+    for num_rules in args.rules:
+        bench(num_rules, texts, args)
@@ -0,0 +1,352 @@
+"""
+贴吧接口的本地替身服务
+
+以aiohttp实现审查流程用到的贴吧接口 数据来自合成吧
+读接口与真实服务端一样返回protobuf 写接口返回json 删帖 屏蔽与封禁会真实修改合成吧的状态
+
+StandInConnector将客户端的所有连接重定向到替身服务 并以明文http代替https
+因此真实的aiotieba.Client可以不经修改地完成序列化 连接池与http解析的全部流程
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import random
+import socket
+from collections import Counter
+
+import aiohttp
+import aiotieba as tb
+from aiohttp import web
+from aiotieba.api.get_comments.protobuf import PbFloorReqIdl_pb2, PbFloorResIdl_pb2
+from aiotieba.api.get_posts.protobuf import PbPageReqIdl_pb2, PbPageResIdl_pb2
+from aiotieba.api.get_threads.protobuf import FrsPageReqIdl_pb2, FrsPageResIdl_pb2
+from aiotieba.enums import PostSortType
+from synthetic import SyntheticForum
+
+TBS = "0123456789abcdef0123456789"
+
+
+def _fill_contents(content_protos, objs) -> None:
+    for frag in objs:
+        proto = content_protos.add()
+        if hasattr(frag, "hash"):
+            proto.type = 3
+            proto.cdn_src = frag.src
+            proto.big_cdn_src = frag.big_src
+            proto.origin_src = frag.origin_src
+            proto.bsize = f"{frag.show_width},{frag.show_height}"
+        else:
+            proto.type = 0
+            proto.text = frag.text
+
+
+def _fill_user(user_proto, user) -> None:
+    user_proto.id = user.user_id
+    user_proto.portrait = user.portrait
+    user_proto.name = user.user_name
+    user_proto.name_show = user.nick_name_new or user.user_name
+    user_proto.level_id = user.level
+
+
+class StandInServer:
+    """
+    贴吧接口的本地替身服务
+
+    Args:
+        forum (SyntheticForum): 合成吧
+        latency (float, optional): 每个请求的平均服务端处理延迟 以秒为单位. Defaults to 0.0.
+        error_rate (float, optional): 请求返回http 503的概率. Defaults to 0.0.
+        seed (int, optional): 随机种子. Defaults to 0.
+
+    Attributes:
+        requests (Counter[str]): 各接口的请求次数
+        bytes_sent (int): 响应体的总字节数
+        port (int): 监听端口 启动后可用
+    """
+
+    def __init__(self, forum: SyntheticForum, latency: float = 0.0, error_rate: float = 0.0, seed: int = 0) -> None:
+        self.forum = forum
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.requests: Counter[str] = Counter()
+        self.bytes_sent = 0
+        self.port = 0
+        self._runner: web.AppRunner | None = None
+
+        app = web.Application(middlewares=[self._middleware])
+        app.router.add_post("/c/f/frs/page", self._frs_page)
+        app.router.add_post("/c/f/pb/page", self._pb_page)
+        app.router.add_post("/c/f/pb/floor", self._pb_floor)
+        app.router.add_post("/c/s/login", self._login)
+        app.router.add_get("/f/commit/share/fnameShareApi", self._fid)
+        app.router.add_post("/c/c/bawu/commitprison", self._block)
+        app.router.add_post("/mo/q/bawublockclear", self._unblock)
+        app.router.add_post("/c/c/bawu/delpost", self._del_post)
+        app.router.add_post("/c/c/bawu/multiDelPost", self._del_posts)
+        app.router.add_post("/c/c/bawu/delthread", self._del_thread)
+        self.app = app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> None:
+        """
+        启动替身服务
+
+        Args:
+            host (str, optional): 监听地址. Defaults to "127.0.0.1".
+            port (int, optional): 监听端口 0表示随机端口. Defaults to 0.
+        """
+
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    @web.middleware
+    async def _middleware(self, request: web.Request, handler) -> web.StreamResponse:
+        self.requests[request.path] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency * (0.5 + self.rng.random()))
+        if self.error_rate and self.rng.random() < self.error_rate:
+            return web.Response(status=503)
+        response = await handler(request)
+        self.bytes_sent += len(response.body)
+        return response
+
+    @staticmethod
+    async def _read_proto(request: web.Request, req_proto):
+        reader = await request.multipart()
+        part = await reader.next()
+        req_proto.ParseFromString(await part.read())
+        return req_proto.data
+
+    @staticmethod
+    def _json(data: dict) -> web.Response:
+        return web.Response(body=json.dumps(data).encode(), content_type="application/json")
+
+    def _ok(self) -> web.Response:
+        return self._json({"error_code": "0", "error_msg": ""})
+
+    async def _frs_page(self, request: web.Request) -> web.Response:
+        data = await self._read_proto(request, FrsPageReqIdl_pb2.FrsPageReqIdl())
+        forum = self.forum
+        pn = data.pn or 1
+        threads = forum.get_threads(pn, data.rn or 30)
+
+        res = FrsPageResIdl_pb2.FrsPageResIdl()
+        res_data = res.data
+        res_data.forum.id = forum.fid
+        res_data.forum.name = forum.spec.fname
+        page = threads.page
+        res_data.page.page_size = page.page_size
+        res_data.page.current_page = page.current_page
+        res_data.page.total_page = page.total_page
+        res_data.page.total_count = page.total_count
+        res_data.page.has_more = int(page.has_more)
+        res_data.page.has_prev = int(page.has_prev)
+
+        users = {}
+        for thread in threads:
+            proto = res_data.thread_list.add()
+            proto.id = thread.tid
+            proto.first_post_id = thread.pid
+            proto.title = thread.title
+            proto.author_id = thread.author_id
+            proto.is_frs_mask = int(thread.tid in forum.hidden)
+            proto.reply_num = thread.reply_num
+            proto.create_time = thread.create_time
+            proto.last_time_int = thread.last_time
+            _fill_contents(proto.first_post_content, thread.contents.objs)
+            users[thread.author_id] = thread.user
+        for user in users.values():
+            _fill_user(res_data.user_list.add(), user)
+
+        return web.Response(body=res.SerializeToString())
+
+    async def _pb_page(self, request: web.Request) -> web.Response:
+        data = await self._read_proto(request, PbPageReqIdl_pb2.PbPageReqIdl())
+        forum = self.forum
+        tid = data.kz
+        comment_rn = data.floor_rn if data.with_floor else 0
+        posts = forum.get_posts(tid, data.pn or 1, data.rn, PostSortType(data.r), comment_rn)
+
+        res = PbPageResIdl_pb2.PbPageResIdl()
+        if (thread := forum.threads.get(tid)) is None:
+            res.error.errorno = 4
+            res.error.errmsg = "贴子可能已被删除"
+            return web.Response(body=res.SerializeToString())
+
+        res_data = res.data
+        res_data.forum.id = forum.fid
+        res_data.forum.name = forum.spec.fname
+        res_data.page.page_size = posts.page.page_size
+        res_data.page.current_page = posts.page.current_page
+        res_data.page.total_page = posts.page.total_page
+        res_data.page.has_more = int(posts.page.has_more)
+        res_data.page.has_prev = int(posts.page.has_prev)
+
+        thread_proto = res_data.thread
+        thread_proto.id = tid
+        thread_proto.post_id = thread.pid
+        thread_proto.title = thread.title
+        thread_proto.reply_num = thread.reply_num
+        thread_proto.create_time = thread.create_time
+        _fill_user(thread_proto.author, thread.user)
+        _fill_contents(thread_proto.origin_thread_info.content, thread.contents.objs)
+
+        users = {thread.author_id: thread.user}
+        for post in posts:
+            proto = res_data.post_list.add()
+            proto.id = post.pid
+            proto.floor = post.floor
+            proto.author_id = post.author_id
+            proto.time = post.create_time
+            proto.agree.agree_num = post.agree
+            proto.sub_post_number = post.reply_num
+            _fill_contents(proto.content, post.contents.objs)
+            users[post.author_id] = post.user
+            for comment in post.comments if comment_rn else ():
+                sub_proto = proto.sub_post_list.sub_post_list.add()
+                sub_proto.id = comment.pid
+                sub_proto.author_id = comment.author_id
+                sub_proto.time = comment.create_time
+                _fill_contents(sub_proto.content, comment.contents.objs)
+                users[comment.author_id] = comment.user
+        for user in users.values():
+            _fill_user(res_data.user_list.add(), user)
+
+        return web.Response(body=res.SerializeToString())
+
+    async def _pb_floor(self, request: web.Request) -> web.Response:
+        data = await self._read_proto(request, PbFloorReqIdl_pb2.PbFloorReqIdl())
+        forum = self.forum
+        tid = data.kz
+        comments = forum.get_comments(tid, data.pid, data.pn or 1)
+
+        res = PbFloorResIdl_pb2.PbFloorResIdl()
+        res_data = res.data
+        res_data.forum.id = forum.fid
+        res_data.forum.name = forum.spec.fname
+        res_data.thread.id = tid
+        res_data.post.id = data.pid
+        res_data.page.page_size = comments.page.page_size
+        res_data.page.current_page = comments.page.current_page
+        res_data.page.total_page = comments.page.total_page
+        res_data.page.total_count = comments.page.total_count
+
+        for comment in comments:
+            proto = res_data.subpost_list.add()
+            proto.id = comment.pid
+            proto.time = comment.create_time
+            _fill_user(proto.author, comment.user)
+            _fill_contents(proto.content, comment.contents.objs)
+
+        return web.Response(body=res.SerializeToString())
+
+    async def _login(self, request: web.Request) -> web.Response:
+        return self._json(
+            {"error_code": "0", "user": {"id": "1", "portrait": "tb.1.bench", "name": "bench"}, "anti": {"tbs": TBS}}
+        )
+
+    async def _fid(self, request: web.Request) -> web.Response:
+        if request.query.get("fname") != self.forum.spec.fname:
+            return self._json({"no": 0, "error": "", "data": {"fid": 0}})
+        return self._json({"no": 0, "error": "", "data": {"fid": self.forum.fid}})
+
+    async def _block(self, request: web.Request) -> web.Response:
+        form = await request.post()
+        forum = self.forum
+        portrait = form["portrait"]
+        forum.blocked[portrait] = max(int(form["day"]), forum.blocked.get(portrait, 0))
+        return self._ok()
+
+    async def _unblock(self, request: web.Request) -> web.Response:
+        return self._json({"no": 0, "error": ""})
+
+    async def _del_post(self, request: web.Request) -> web.Response:
+        form = await request.post()
+        self.forum.delete(int(form["z"]), int(form["pid"]))
+        return self._ok()
+
+    async def _del_posts(self, request: web.Request) -> web.Response:
+        form = await request.post()
+        tid = int(form["thread_id"])
+        for pid in form["post_ids"].split(","):
+            self.forum.delete(tid, int(pid))
+        return self._ok()
+
+    async def _del_thread(self, request: web.Request) -> web.Response:
+        form = await request.post()
+        tid = int(form["z"])
+        if int(form["is_frs_mask"]):
+            self.forum.hidden.add(tid)
+        elif (thread := self.forum.threads.get(tid)) is not None:
+            self.forum.delete(tid, thread.pid)
+        return self._ok()
+
+
+class StandInConnector(aiohttp.TCPConnector):
+    """
+    将所有连接重定向到替身服务的连接器
+
+    Args:
+        port (int): 替身服务的端口
+        host (str, optional): 替身服务的地址. Defaults to "127.0.0.1".
+        **kwargs: 传递给aiohttp.TCPConnector
+
+    Note:
+        连接池仍按请求的原始host与scheme区分连接 与访问真实服务端时一致
+    """
+
+    def __init__(self, port: int, host: str = "127.0.0.1", **kwargs) -> None:
+        super().__init__(**kwargs)
+        self._stand_in = (host, port)
+
+    async def _resolve_host(self, host: str, port: int, traces=None) -> list[dict]:
+        stand_in_host, stand_in_port = self._stand_in
+        return [
+            {
+                "hostname": host,
+                "host": stand_in_host,
+                "port": stand_in_port,
+                "family": socket.AF_INET,
+                "proto": 0,
+                "flags": 0,
+            }
+        ]
+
+    def _get_ssl_context(self, req: aiohttp.ClientRequest) -> None:
+        return None
+
+
+async def redirect_client(client: tb.Client, port: int, host: str = "127.0.0.1") -> None:
+    """
+    使已进入上下文的客户端连接替身服务
+
+    Args:
+        client (tb.Client): 已进入上下文的客户端
+        port (int): 替身服务的端口
+        host (str, optional): 替身服务的地址. Defaults to "127.0.0.1".
+    """
+
+    ori_connector = client._connector
+    connector = StandInConnector(port, host, keepalive_timeout=client._timeout.http_keepalive, limit=0)
+    # 各核心共享同一个NetCore 替换其连接器即可
+    client._connector = connector
+    client._http_core.net_core.connector = connector
+    await ori_connector.close()
+
+
+def bench_account() -> tb.Account:
+    """
+    用于替身服务的假账号
+    """
+
+    return tb.Account("0" * 192)
@@ -0,0 +1,555 @@
+"""
+合成吧与假客户端
+
+按给定的主题帖数 楼层数分布 楼中楼扇出 广告比例与图片比例生成一个可演化的吧
+假客户端以注入的延迟与错误率提供get_threads/get_posts/get_comments等接口 删帖与封禁会真实修改吧的状态
+假数据库提供黑白名单查询 并统计查询次数 也可改用写入了黑白名单的LocalDB
+
+供bench_e2e.py与standin.py使用 可离线运行
+"""
+
+from __future__ import annotations
+
+import asyncio
+import dataclasses as dcs
+import random
+import time
+from collections import Counter
+
+import aiotieba as tb
+from aiotieba.api._classdef.contents import FragText
+from aiotieba.api.get_comments._classdef import Comment, Comments, Contents_c, Page_c, UserInfo_c
+from aiotieba.api.get_posts._classdef import (
+    Comment_p,
+    Contents_p,
+    Contents_pc,
+    FragImage_p,
+    Page_p,
+    Post,
+    Posts,
+    Thread_p,
+    UserInfo_p,
+)
+from aiotieba.api.get_threads._classdef import Contents_t, FragImage_t, Page_t, Thread, Threads, UserInfo_t
+from aiotieba.enums import PostSortType
+
+from aiotieba_reviewer.database import LocalDB
+
+SPAM_WORDS = ["加微信", "兼职日结", "扣扣群", "代刷", "低价出号", "私聊领取"]
+NORMAL_WORDS = ["今天", "版本", "角色", "强度", "剧情", "抽卡", "攻略", "求助", "分享", "吐槽", "这个", "感觉", "还是"]
+
+
+@dcs.dataclass
+class ForumSpec:
+    """
+    合成吧的参数
+
+    Attributes:
+        fname (str): 吧名
+        num_threads (int): 初始主题帖数
+        mean_posts (float): 每个主题帖的平均楼层数 不含首楼
+        post_dist (str): 楼层数分布 geometric/pareto pareto为长尾分布
+        comment_ratio (float): 带楼中楼的楼层比例
+        mean_comments (float): 带楼中楼的楼层的平均楼中楼数
+        spam_ratio (float): 含广告词的内容比例
+        image_ratio (float): 带图片的主题帖与楼层比例
+        banned_image_ratio (float): 图片中属于违规图片的比例
+        num_users (int): 用户数
+        blacklist_ratio (float): 黑名单用户比例
+        whitelist_ratio (float): 白名单用户比例
+        seed (int): 随机种子
+    """
+
+    fname: str = "bench"
+    num_threads: int = 30
+    mean_posts: float = 20.0
+    post_dist: str = "geometric"
+    comment_ratio: float = 0.3
+    mean_comments: float = 5.0
+    spam_ratio: float = 0.02
+    image_ratio: float = 0.2
+    banned_image_ratio: float = 0.05
+    num_users: int = 2000
+    blacklist_ratio: float = 0.01
+    whitelist_ratio: float = 0.05
+    seed: int = 0
+
+
+class SyntheticForum:
+    """
+    可演化的合成吧
+
+    Args:
+        spec (ForumSpec): 参数
+
+    Attributes:
+        threads (dict[int, Thread]): tid到主题帖
+        posts (dict[int, list[Post]]): tid到按楼层升序的楼层 首楼在内
+        comments (dict[int, list[Comment]]): pid到按楼层升序的楼中楼
+        permissions (dict[int, int]): user_id到黑白名单权限
+        banned_hashes (set[str]): 违规图片的哈希
+        blocked (dict[str, int]): 被封禁用户的portrait到封禁天数
+        deleted (set[int]): 被删除的pid
+        hidden (set[int]): 被屏蔽的tid
+    """
+
+    def __init__(self, spec: ForumSpec) -> None:
+        self.spec = spec
+        self.fid = 10000
+        self.rng = random.Random(spec.seed)
+        self.now = int(time.time()) - 86400
+
+        self.threads: dict[int, Thread] = {}
+        self.posts: dict[int, list[Post]] = {}
+        self.comments: dict[int, list[Comment]] = {}
+        self.blocked: dict[str, int] = {}
+        self.deleted: set[int] = set()
+        self.hidden: set[int] = set()
+
+        self.permissions: dict[int, int] = {}
+        for user_id in range(1, spec.num_users + 1):
+            x = self.rng.random()
+            if x < spec.blacklist_ratio:
+                self.permissions[user_id] = -50
+            elif x < spec.blacklist_ratio + spec.whitelist_ratio:
+                self.permissions[user_id] = 10
+
+        self.banned_hashes = {f"{self.rng.getrandbits(160):040x}" for _ in range(16)}
+        self._banned_list = sorted(self.banned_hashes)
+        self._next_id = 1
+
+        for _ in range(spec.num_threads):
+            self.new_thread()
+
+    def _id(self) -> int:
+        self._next_id += 1
+        return self._next_id
+
+    def _tick(self) -> int:
+        self.now += self.rng.randint(1, 30)
+        return self.now
+
+    def _text(self) -> str:
+        words = self.rng.choices(NORMAL_WORDS, k=self.rng.randint(3, 30))
+        if self.rng.random() < self.spec.spam_ratio:
+            words.insert(self.rng.randrange(len(words) + 1), self.rng.choice(SPAM_WORDS))
+        return "".join(words)
+
+    def _image_hash(self) -> str:
+        if self.rng.random() < self.spec.banned_image_ratio:
+            return self.rng.choice(self._banned_list)
+        return f"{self.rng.getrandbits(160):040x}"
+
+    def _image(self, cls: type) -> object:
+        hash_ = self._image_hash()
+        src = f"http://tiebapic.baidu.com/forum/pic/item/{hash_}.jpg"
+        return cls(src=src, big_src=src, origin_src=src, show_width=560, show_height=560, hash=hash_)
+
+    def _user(self, cls: type) -> tuple[int, object]:
+        user_id = self.rng.randint(1, self.spec.num_users)
+        level = min(int(self.rng.expovariate(0.25)) + 1, 18)
+        return user_id, cls(user_id=user_id, portrait=f"tb.1.{user_id:08x}", user_name=f"user{user_id}", level=level)
+
+    def _num_posts(self) -> int:
+        mean = self.spec.mean_posts
+        if mean <= 0:
+            return 0
+        if self.spec.post_dist == "pareto":
+            # alpha=1.5时均值为3倍的尺度
+            return int((self.rng.paretovariate(1.5) - 1) * mean / 2)
+        return int(self.rng.expovariate(1 / mean))
+
+    def new_thread(self) -> Thread:
+        """
+        发布一个新主题帖 并按楼层数分布为其生成回复
+        """
+
+        tid = self._id()
+        pid = self._id()
+        user_id, user = self._user(UserInfo_t)
+        text = self._text()
+        imgs = []
+        if self.rng.random() < self.spec.image_ratio:
+            imgs = [self._image(FragImage_t)]
+        create_time = self._tick()
+
+        thread = Thread(
+            contents=Contents_t(objs=[FragText(text), *imgs], texts=[FragText(text)], imgs=imgs),
+            title=text[:16],
+            fid=self.fid,
+            fname=self.spec.fname,
+            tid=tid,
+            pid=pid,
+            user=user,
+            author_id=user_id,
+            create_time=create_time,
+            last_time=create_time,
+        )
+        self.threads[tid] = thread
+
+        first = self._post(thread, floor=1, pid=pid, text=text)
+        first.user = UserInfo_p(**dcs.asdict(user))
+        first.author_id = user_id
+        first.is_thread_author = True
+        self.posts[tid] = [first]
+        for _ in range(self._num_posts()):
+            self.new_post(tid)
+
+        return thread
+
+    def _post(self, thread: Thread, floor: int, pid: int = 0, text: str = "") -> Post:
+        pid = pid or self._id()
+        user_id, user = self._user(UserInfo_p)
+        text = text or self._text()
+        imgs = []
+        if self.rng.random() < self.spec.image_ratio:
+            imgs = [self._image(FragImage_p)]
+        return Post(
+            contents=Contents_p(objs=[FragText(text), *imgs], texts=[FragText(text)], imgs=imgs),
+            fid=self.fid,
+            fname=self.spec.fname,
+            tid=thread.tid,
+            pid=pid,
+            user=user,
+            author_id=user_id,
+            floor=floor,
+            agree=int(self.rng.expovariate(0.2)),
+            create_time=self.now,
+            is_thread_author=user_id == thread.author_id,
+        )
+
+    def new_post(self, tid: int) -> Post:
+        """
+        在主题帖下发布一个新楼层 并按扇出参数为其生成楼中楼
+        """
+
+        thread = self.threads[tid]
+        posts = self.posts[tid]
+        self._tick()
+        post = self._post(thread, floor=posts[-1].floor + 1)
+        posts.append(post)
+        self.comments[post.pid] = []
+
+        if self.rng.random() < self.spec.comment_ratio:
+            for _ in range(int(self.rng.expovariate(1 / self.spec.mean_comments)) + 1):
+                self.new_comment(tid, post.pid)
+
+        thread.reply_num = len(posts) - 1
+        thread.last_time = self.now
+        return post
+
+    def new_comment(self, tid: int, ppid: int) -> Comment:
+        """
+        在楼层下发布一条新楼中楼
+        """
+
+        comments = self.comments[ppid]
+        user_id, user = self._user(UserInfo_c)
+        text = self._text()
+        comment = Comment(
+            contents=Contents_c(objs=[FragText(text)], texts=[FragText(text)]),
+            fid=self.fid,
+            fname=self.spec.fname,
+            tid=tid,
+            ppid=ppid,
+            pid=self._id(),
+            user=user,
+            floor=len(comments) + 1,
+            create_time=self._tick(),
+        )
+        comments.append(comment)
+        self.threads[tid].last_time = self.now
+        return comment
+
+    def evolve(self, num_posts: int, num_threads: int = 0) -> None:
+        """
+        模拟两次审查之间的新回复与新主题帖
+
+        Args:
+            num_posts (int): 新回复数 其中约四分之一为楼中楼
+            num_threads (int, optional): 新主题帖数. Defaults to 0.
+        """
+
+        for _ in range(num_threads):
+            self.new_thread()
+
+        tids = self.page_tids(1, 30)
+        if not tids:
+            return
+        for _ in range(num_posts):
+            tid = self.rng.choice(tids)
+            posts = self.posts[tid]
+            if len(posts) > 1 and self.rng.random() < 0.25:
+                self.new_comment(tid, self.rng.choice(posts[1:]).pid)
+            else:
+                self.new_post(tid)
+
+    def page_tids(self, pn: int, rn: int) -> list[int]:
+        """
+        按最后回复时间降序排列的第pn页主题帖
+        """
+
+        tids = sorted(
+            (tid for tid in self.threads if tid not in self.hidden),
+            key=lambda tid: self.threads[tid].last_time,
+            reverse=True,
+        )
+        return tids[(pn - 1) * rn : pn * rn]
+
+    def live_posts(self, tid: int) -> list[Post]:
+        return [p for p in self.posts.get(tid, ()) if p.pid not in self.deleted]
+
+    def live_comments(self, ppid: int) -> list[Comment]:
+        return [c for c in self.comments.get(ppid, ()) if c.pid not in self.deleted]
+
+    def delete(self, tid: int, pid: int) -> bool:
+        """
+        删除主题帖 楼层或楼中楼 删除首楼即删除主题帖
+        """
+
+        if (thread := self.threads.get(tid)) is None:
+            return False
+        if pid == thread.pid:
+            del self.threads[tid]
+            for post in self.posts.pop(tid, ()):
+                self.comments.pop(post.pid, None)
+        self.deleted.add(pid)
+        return True
+
+    def num_objs(self) -> int:
+        """
+        吧内尚未被删除的主题帖 楼层与楼中楼总数
+        """
+
+        num = 0
+        for tid in self.threads:
+            posts = self.live_posts(tid)
+            num += len(posts) + sum(len(self.live_comments(p.pid)) for p in posts)
+        return num
+
+    def get_threads(self, pn: int = 1, rn: int = 30) -> Threads:
+        threads = [self.threads[tid] for tid in self.page_tids(pn, rn)]
+        total = len(self.threads) - len(self.hidden & self.threads.keys())
+        page = Page_t(page_size=rn, current_page=pn, total_page=(total + rn - 1) // rn, total_count=total)
+        page.has_more = pn < page.total_page
+        page.has_prev = pn > 1
+        return Threads(threads, page)
+
+    def get_posts(
+        self,
+        tid: int,
+        pn: int = 1,
+        rn: int = 30,
+        sort: PostSortType = PostSortType.ASC,
+        comment_rn: int = 0,
+    ) -> Posts:
+        posts = self.live_posts(tid)
+        total_page = max((len(posts) + rn - 1) // rn, 1) if rn else 1
+
+        if sort == PostSortType.DESC:
+            posts = posts[::-1]
+            # 倒序时越界页码视为第一页 与服务端一致
+            if pn > total_page:
+                pn = 1
+        elif sort == PostSortType.HOT:
+            posts = sorted(posts, key=lambda p: p.agree, reverse=True)
+        pn = min(pn, total_page)
+        page_posts = posts[(pn - 1) * rn : pn * rn] if rn else []
+
+        if comment_rn:
+            for post in page_posts:
+                comments = self.live_comments(post.pid)[:comment_rn]
+                post.comments = [
+                    Comment_p(
+                        contents=Contents_pc(objs=c.contents.objs, texts=c.contents.texts),
+                        fid=c.fid,
+                        fname=c.fname,
+                        tid=c.tid,
+                        ppid=c.ppid,
+                        pid=c.pid,
+                        user=UserInfo_p(**dcs.asdict(c.user)),
+                        author_id=c.user.user_id,
+                        floor=c.floor,
+                        create_time=c.create_time,
+                    )
+                    for c in comments
+                ]
+                post.reply_num = len(self.live_comments(post.pid))
+
+        thread = self.threads.get(tid)
+        thread_p = Thread_p()
+        if thread is not None:
+            thread_p = Thread_p(
+                contents=thread.contents,
+                title=thread.title,
+                fid=self.fid,
+                fname=self.spec.fname,
+                tid=tid,
+                pid=thread.pid,
+                user=thread.user,
+                reply_num=thread.reply_num,
+                create_time=thread.create_time,
+            )
+        page = Page_p(page_size=rn, current_page=pn, total_page=total_page)
+        page.has_more = pn < total_page
+        page.has_prev = pn > 1
+        return Posts(page_posts, page, thread=thread_p)
+
+    def get_comments(self, tid: int, pid: int, pn: int = 1) -> Comments:
+        comments = self.live_comments(pid)
+        rn = 30
+        total_page = max((len(comments) + rn - 1) // rn, 1)
+        page = Page_c(page_size=rn, current_page=pn, total_page=total_page, total_count=len(comments))
+        page.has_more = pn < total_page
+        page.has_prev = pn > 1
+        return Comments(comments[(pn - 1) * rn : pn * rn], page)
+
+
+class FakeClient:
+    """
+    由合成吧提供数据的假客户端
+
+    Args:
+        forum (SyntheticForum): 合成吧
+        latency (float, optional): 每次请求的平均延迟 以秒为单位. Defaults to 0.0.
+        jitter (float, optional): 延迟的随机波动比例. Defaults to 0.5.
+        error_rate (float, optional): 请求返回超时错误的概率. Defaults to 0.0.
+        seed (int, optional): 随机种子. Defaults to 0.
+
+    Attributes:
+        calls (Counter[str]): 各方法的调用次数
+        errors (Counter[str]): 各方法被注入错误的次数
+    """
+
+    def __init__(
+        self, forum: SyntheticForum, latency: float = 0.0, jitter: float = 0.5, error_rate: float = 0.0, seed: int = 0
+    ) -> None:
+        self.forum = forum
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.calls: Counter[str] = Counter()
+        self.errors: Counter[str] = Counter()
+
+    async def __aenter__(self) -> FakeClient:
+        return self
+
+    async def __aexit__(self, exc_type=None, exc_val=None, exc_tb=None) -> None:
+        pass
+
+    async def _io(self, name: str) -> bool:
+        self.calls[name] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency * (1 + self.jitter * (2 * self.rng.random() - 1)))
+        if self.error_rate and self.rng.random() < self.error_rate:
+            self.errors[name] += 1
+            return False
+        return True
+
+    @staticmethod
+    def _fail(res):
+        res.err = TimeoutError("injected")
+        return res
+
+    async def get_threads(self, fname_or_fid, /, pn: int = 1, *, rn: int = 30, **kwargs) -> Threads:
+        if not await self._io("get_threads"):
+            return self._fail(Threads())
+        return self.forum.get_threads(pn, rn)
+
+    async def get_posts(
+        self,
+        tid: int,
+        /,
+        pn: int = 1,
+        *,
+        rn: int = 30,
+        sort: PostSortType = PostSortType.ASC,
+        with_comments: bool = False,
+        comment_rn: int = 4,
+        **kwargs,
+    ) -> Posts:
+        if not await self._io("get_posts"):
+            return self._fail(Posts())
+        return self.forum.get_posts(tid, pn, rn, sort, comment_rn if with_comments else 0)
+
+    async def get_comments(self, tid: int, pid: int, /, pn: int = 1, **kwargs) -> Comments:
+        if not await self._io("get_comments"):
+            return self._fail(Comments())
+        return self.forum.get_comments(tid, pid, pn)
+
+    async def del_post(self, fname_or_fid, /, tid: int, pid: int) -> tb.exception.BoolResponse:
+        if not await self._io("del_post"):
+            return self._fail(tb.exception.BoolResponse())
+        self.forum.delete(tid, pid)
+        return tb.exception.BoolResponse()
+
+    async def del_posts(self, fname_or_fid, /, tid: int, pids: list[int], *, block: bool = False):
+        if not await self._io("del_posts"):
+            return self._fail(tb.exception.BoolResponse())
+        for pid in pids:
+            self.forum.delete(tid, pid)
+        return tb.exception.BoolResponse()
+
+    async def hide_thread(self, fname_or_fid, /, tid: int) -> tb.exception.BoolResponse:
+        if not await self._io("hide_thread"):
+            return self._fail(tb.exception.BoolResponse())
+        self.forum.hidden.add(tid)
+        return tb.exception.BoolResponse()
+
+    async def block(self, fname_or_fid, /, id_, *, day: int = 1, reason: str = "") -> tb.exception.BoolResponse:
+        if not await self._io("block"):
+            return self._fail(tb.exception.BoolResponse())
+        self.forum.blocked[id_] = max(day, self.forum.blocked.get(id_, 0))
+        return tb.exception.BoolResponse()
+
+    async def unblock(self, fname_or_fid, /, id_) -> tb.exception.BoolResponse:
+        if not await self._io("unblock"):
+            return self._fail(tb.exception.BoolResponse())
+        return tb.exception.BoolResponse()
+
+
+class FakeDB:
+    """
+    由合成吧提供黑白名单的假数据库
+
+    Args:
+        forum (SyntheticForum): 合成吧
+        latency (float, optional): 每次查询的延迟 以秒为单位. Defaults to 0.0.
+
+    Attributes:
+        queries (Counter[str]): 各方法的查询次数
+    """
+
+    def __init__(self, forum: SyntheticForum, latency: float = 0.0) -> None:
+        self.forum = forum
+        self.latency = latency
+        self.queries: Counter[str] = Counter()
+
+    async def get_user_id(self, user_id: int) -> int:
+        self.queries["get_user_id"] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self.forum.permissions.get(user_id, 0)
+
+
+async def create_local_db(forum: SyntheticForum, latency: float = 0.0, latency_p99: float = 0.0) -> LocalDB:
+    """
+    创建一个写入了合成吧黑白名单的LocalDB
+
+    与FakeDB不同 查询会经过真实的SQL执行与异常处理装饰器 延迟服从对数正态分布
+
+    Args:
+        forum (SyntheticForum): 合成吧
+        latency (float, optional): 查询延迟的中位数 以秒为单位. Defaults to 0.0.
+        latency_p99 (float, optional): 查询延迟的p99 以秒为单位. Defaults to 0.0.
+
+    Returns:
+        LocalDB: 内存数据库 随进程退出释放
+    """
+
+    db = LocalDB(forum.spec.fname, ":memory:", latency, latency_p99)
+    for user_id, permission in forum.permissions.items():
+        await db.add_user_id(user_id, permission)
+    db.queries.clear()
+    return db
@@ -88,6 +88,10 @@ async def _check_post(post: Post) -> Punish | None:
         if at.user_id == 4928198503:
             return Punish(post, Ops.DELETE, note="作图广告")
 
+    # 两分钟内发布了15条以上的主题帖 回复或楼中楼
+    if tbr.get_activity_tracker().count(post.author_id, 120.0) >= 15:
+        return Punish(post, Ops.DELETE, note="刷屏", rule="burst")
+
 
 @tbr.reviewer.comments.append_filter
 async def comments_conti_filter(comments: list[Comment]) -> list[Punish]:
@@ -112,8 +116,21 @@ async def _check_comment(comment: Comment) -> Punish | None:
     pass
 
 
+# 将关键词与正则规则编译为一个匹配器 每条文本只需扫描一遍
+# 全角字符 大小写与常见形近字符会被自动规范化
+text_matcher = tbr.TextMatcher()
+text_matcher.add_keyword("引流", "加微信", "扣扣群", "私聊领取")
+text_matcher.add_regex("联系方式", r"(?:qq|vx|v):?\d{6,}")
+
+
 async def check_text(obj: TypeObj) -> Punish | None:
-    pass
+    if rule_ids := text_matcher.match(obj.text):
+        return Punish(obj, Ops.DELETE, 1, note="引流", rule=min(rule_ids))
+
+    # 最近半小时内已有3个以上不同用户发布过近似文本 视为刷屏
+    stat = tbr.get_neardup_index().observe(obj, within=1800.0)
+    if stat.users >= 3:
+        return Punish(obj, Ops.DELETE, note="刷屏", rule="neardup")
 
 
 if __name__ == "__main__":
@@ -1,19 +1,62 @@
-from . import executor, imgproc, reviewer
+from . import executor, imgproc, metrics, reviewer
 from .__version__ import __version__
+from .activity import ActivityTracker, enable_activity_tracker, get_activity_tracker
+from .archive import ArchiveWriter, enable_archive
+from .backtest import BacktestResult, PunishDiff, backtest
 from .client import (
+    Forum,
     client_generator,
     db_generator,
     get_client,
     get_db,
     get_db_sqlite,
     get_fname,
+    get_forum,
     set_BDUSS_key,
     set_fname,
+    set_forum,
+    wrap_client,
 )
+from .client_pool import ClientPool, enable_client_pool
 from .config import get_account
-from .database import PostgreDB, SQLiteDB
+from .database import LocalDB, PostgreDB, SQLiteDB, create_db
+from .dedup import NearDupIndex, NearDupStat, enable_neardup_index, get_neardup_index
 from .enums import Ops
-from .perf_stat import aperf_stat
+from .loop_monitor import LoopMonitor, start_loop_monitor
+from .metrics import MetricFamily, add_collector, remove_collector, start_metrics_server
+from .perf_stat import Histogram, aperf_stat
+from .proxy import ClientProxy
 from .punish import Punish
-from .reviewer import no_test, run, run_multi_pn, run_multi_pn_with_time_threshold, run_with_dyn_interval, test
+from .punish_queue import (
+    PunishAggregator,
+    PunishJob,
+    PunishQueue,
+    flush_punishes,
+    use_punish_aggregator,
+    use_punish_queue,
+)
+from .ratelimit import AIMDLimiter, RateGovernor, TokenBucket, enable_rate_governor
+from .replay import Recorder, ReplayClient, enable_recording, enable_replay
+from .reviewer import (
+    AdaptiveInterval,
+    CheckerMemo,
+    ShadowSet,
+    Supervisor,
+    get_checker_memo,
+    get_shadow_set,
+    no_test,
+    run,
+    run_multi_forum,
+    run_multi_pn,
+    run_multi_pn_with_time_threshold,
+    run_sharded,
+    run_with_adaptive_interval,
+    run_with_dyn_interval,
+    test,
+)
+from .rule_stat import RuleBook, enable_rule_accounting, get_rulebook
+from .scheduler import RetryScheduler, TimerWheel, get_retry_scheduler
+from .singleflight import SingleFlight, enable_singleflight
+from .textmatch import TextMatcher
+from .tracing import Span, Tracer, enable_tracing, get_tracer, span
 from .typing import TypeObj
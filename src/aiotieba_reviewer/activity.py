@@ -0,0 +1,404 @@
+from __future__ import annotations
+
+import atexit
+import os
+import pickle
+import sys
+import time
+from collections import OrderedDict
+from collections.abc import Iterable
+from pathlib import Path
+
+from aiotieba import get_logger as LOG
+
+from .metrics import MetricFamily, add_collector
+from .typing import TypeObj
+
+
+class _Ring:
+    """
+    单个用户的环形计数器
+
+    Attributes:
+        head (int): 最新一个桶的绝对序号 即时间戳整除桶宽
+        counts (bytearray): 长度为桶数的计数 绝对序号为b的桶位于counts[b % 桶数]
+    """
+
+    __slots__ = ["head", "counts"]
+
+    def __init__(self, head: int, num_buckets: int) -> None:
+        self.head = head
+        self.counts = bytearray(num_buckets)
+
+
+class ActivityTracker:
+    """
+    按用户统计发帖频率的滑动窗口计数器
+
+    时间按resolution秒分桶 每个用户持有一个num_buckets个桶的环形计数器 可回溯resolution*num_buckets秒
+    计入只需更新一个桶 查询只需累加within秒内的桶 两者的耗时与内存都不随用户的发帖数增长
+    对象按其发布时间计入对应的桶 并以pid去重 因此同一对象在多轮审查中被反复产出时只计入一次
+
+    用户按最近一次计入的顺序排列 超过max_users或窗口内已无计数的用户被逐出
+    pid按计入的顺序排列 所在的桶滑出窗口或超过max_pids时被移出去重集合 内存占用因此有界
+
+    Args:
+        resolution (float, optional): 桶宽 以秒为单位. Defaults to 10.0.
+        num_buckets (int, optional): 每个用户的桶数. Defaults to 90.
+        max_users (int, optional): 用户数上限. Defaults to 100000.
+        max_pids (int, optional): 去重集合的容量上限. Defaults to 1000000.
+
+    Attributes:
+        added (int): 计入的对象数
+        evicted (int): 被逐出的用户数
+
+    Note:
+        计数器以精度换取固定的内存 每个用户占用num_buckets字节 与其发帖数无关
+        查询的时间粒度为一个桶 统计的时长向前取整到桶的边界 因此至多多统计一个桶
+        单个桶的计数在255处饱和 即每resolution秒至多计入255个对象 超出的部分被忽略
+        被提前移出去重集合的对象若被再次产出会被重复计入
+    """
+
+    __slots__ = [
+        "resolution",
+        "num_buckets",
+        "max_users",
+        "max_pids",
+        "added",
+        "evicted",
+        "_users",
+        "_pids",
+        "_now_bucket",
+    ]
+
+    def __init__(
+        self, resolution: float = 10.0, num_buckets: int = 90, max_users: int = 100000, max_pids: int = 1000000
+    ) -> None:
+        self.resolution = resolution
+        self.num_buckets = num_buckets
+        self.max_users = max_users
+        self.max_pids = max_pids
+
+        self.added = 0
+        self.evicted = 0
+
+        self._users: OrderedDict[int, _Ring] = OrderedDict()
+        # 已计入的pid到其所在的桶的序号
+        self._pids: dict[int, int] = {}
+        self._now_bucket = 0
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+    @property
+    def span(self) -> float:
+        """
+        可回溯的时长 以秒为单位
+        """
+
+        return self.resolution * self.num_buckets
+
+    def _advance(self, now_bucket: int) -> None:
+        self._now_bucket = now_bucket
+        oldest = now_bucket - self.num_buckets + 1
+
+        # pid大致按发布时间计入 从最早计入的一端移除 直到遇到仍在窗口内的pid
+        pids = self._pids
+        expired = []
+        for pid, bucket in pids.items():
+            if bucket >= oldest:
+                break
+            expired.append(pid)
+        for pid in expired:
+            del pids[pid]
+
+        # 最久未计入的用户在最前 其最新的桶若已滑出窗口则整个计数器都已失效
+        users = self._users
+        while users:
+            if next(iter(users.values())).head >= oldest:
+                break
+            users.popitem(last=False)
+            self.evicted += 1
+
+    def add(self, user_id: int, pid: int, ts: float, now: float | None = None) -> bool:
+        """
+        计入一个对象
+
+        Args:
+            user_id (int): 发布者的user_id
+            pid (int): 对象的pid 用于去重
+            ts (float): 对象的发布时间
+            now (float, optional): 当前时间. Defaults to None即time.time().
+
+        Returns:
+            bool: 是否被计入 已计入过或发布时间早于窗口的对象不会被计入
+        """
+
+        pids = self._pids
+        if pid in pids:
+            return False
+        now_bucket = int((time.time() if now is None else now) // self.resolution)
+        if now_bucket != self._now_bucket:
+            self._advance(now_bucket)
+        num_buckets = self.num_buckets
+        # 发布时间晚于当前时间时视为当前时间
+        bucket = int(ts // self.resolution)
+        if bucket > now_bucket:
+            bucket = now_bucket
+        elif bucket <= now_bucket - num_buckets:
+            return False
+
+        users = self._users
+        if (ring := users.get(user_id)) is None:
+            ring = users[user_id] = _Ring(bucket, num_buckets)
+            if len(users) > self.max_users:
+                users.popitem(last=False)
+                self.evicted += 1
+        else:
+            users.move_to_end(user_id)
+            head = ring.head
+            if bucket > head:
+                # 清空从head之后到新桶之间的过期槽位
+                counts = ring.counts
+                if bucket - head >= num_buckets:
+                    counts[:] = bytes(num_buckets)
+                else:
+                    i = (head + 1) % num_buckets
+                    j = bucket % num_buckets + 1
+                    if i < j:
+                        counts[i:j] = bytes(j - i)
+                    else:
+                        counts[i:] = bytes(num_buckets - i)
+                        counts[:j] = bytes(j)
+                ring.head = bucket
+            elif bucket <= head - num_buckets:
+                return False
+
+        counts = ring.counts
+        idx = bucket % num_buckets
+        if counts[idx] < 0xFF:
+            counts[idx] += 1
+
+        pids[pid] = bucket
+        if len(pids) > self.max_pids:
+            del pids[next(iter(pids))]
+        self.added += 1
+        return True
+
+    def feed(self, objs: Iterable[TypeObj]) -> int:
+        """
+        计入一组主题帖 回复或楼中楼
+
+        Args:
+            objs (Iterable[TypeObj])
+
+        Returns:
+            int: 被计入的对象数
+        """
+
+        now = time.time()
+        added = 0
+        for obj in objs:
+            if obj.author_id and self.add(obj.author_id, obj.pid, obj.create_time, now):
+                added += 1
+        return added
+
+    def count(self, user_id: int, within: float = 60.0, now: float | None = None) -> int:
+        """
+        用户在最近within秒内发布的对象数
+
+        Args:
+            user_id (int)
+            within (float, optional): 以秒为单位 超过span时按span计. Defaults to 60.0.
+            now (float, optional): 当前时间. Defaults to None即time.time().
+
+        Returns:
+            int
+        """
+
+        if (ring := self._users.get(user_id)) is None:
+            return 0
+
+        num_buckets = self.num_buckets
+        if now is None:
+            now = time.time()
+        resolution = self.resolution
+        # 包含起点所在的桶 因此统计的时长不短于within
+        first = int((now - within) // resolution)
+        last = int(now // resolution)
+        # 早于较新的一端num_buckets个桶的槽位已被复用
+        if (head := ring.head) > last:
+            oldest = head - num_buckets + 1
+        else:
+            oldest = last - num_buckets + 1
+            last = head
+        if first < oldest:
+            first = oldest
+        if first > last:
+            return 0
+        counts = ring.counts
+        i = first % num_buckets
+        j = last % num_buckets
+        if i <= j:
+            return sum(counts[i : j + 1])
+        return sum(counts[i:]) + sum(counts[: j + 1])
+
+    def rate(self, user_id: int, within: float = 60.0, now: float | None = None) -> float:
+        """
+        用户在最近within秒内的发帖频率
+
+        Args:
+            user_id (int)
+            within (float, optional): 以秒为单位 超过span时按span计. Defaults to 60.0.
+            now (float, optional): 当前时间. Defaults to None即time.time().
+
+        Returns:
+            float: 每分钟发布的对象数
+        """
+
+        within = min(within, self.span)
+        return self.count(user_id, within, now) * 60.0 / within
+
+    def footprint(self) -> int:
+        """
+        估算计数器占用的内存
+
+        Returns:
+            int: 以字节为单位
+        """
+
+        size = sys.getsizeof(self._users) + sys.getsizeof(self._pids)
+        if self._users:
+            ring = next(iter(self._users.values()))
+            size += len(self._users) * (sys.getsizeof(ring) + sys.getsizeof(ring.counts))
+        return size
+
+    def save(self, path: str | Path) -> None:
+        """
+        保存计数器 以便重启后恢复
+
+        Args:
+            path (str | Path)
+        """
+
+        state = (
+            self.resolution,
+            self.num_buckets,
+            [(user_id, ring.head, bytes(ring.counts)) for user_id, ring in self._users.items()],
+            self._pids,
+        )
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as fp:
+            pickle.dump(state, fp, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    def restore(self, path: str | Path) -> bool:
+        """
+        从文件中恢复计数器 已过期的计数在下一次计入时被清理
+
+        Args:
+            path (str | Path)
+
+        Returns:
+            bool: 是否成功恢复 文件不存在或分桶参数不一致时为False
+        """
+
+        try:
+            with open(path, "rb") as fp:
+                resolution, num_buckets, users, pids = pickle.load(fp)
+        except FileNotFoundError:
+            return False
+        except (pickle.UnpicklingError, EOFError, ValueError) as err:
+            LOG().warning(f"Failed to restore activity. path={path} err={err!r}")
+            return False
+
+        if resolution != self.resolution or num_buckets != self.num_buckets or any(len(u) != 3 for u in users):
+            LOG().warning(f"Activity bucket layout changed. path={path}")
+            return False
+
+        self._users.clear()
+        for user_id, head, counts in users[-self.max_users :]:
+            ring = self._users[user_id] = _Ring(head, num_buckets)
+            ring.counts[:] = counts
+        self._pids = pids
+        while len(pids) > self.max_pids:
+            del pids[next(iter(pids))]
+        self._now_bucket = 0
+        return True
+
+    def collect(self) -> list[MetricFamily]:
+        """
+        以指标的形式输出计数器的规模与内存占用
+
+        Returns:
+            list[MetricFamily]
+        """
+
+        return [
+            MetricFamily("activity_users", "gauge", "Users tracked by the activity counters", [("", {}, len(self))]),
+            MetricFamily(
+                "activity_memory_bytes",
+                "gauge",
+                "Estimated memory of the activity counters",
+                [("", {}, self.footprint())],
+            ),
+            MetricFamily(
+                "activity_ops_total",
+                "counter",
+                "Activity counter operations",
+                [("", {"op": "add"}, self.added), ("", {"op": "evict"}, self.evicted)],
+            ),
+        ]
+
+
+_tracker = ActivityTracker()
+
+
+def _collect() -> list[MetricFamily]:
+    return _tracker.collect()
+
+
+add_collector(_collect)
+
+
+def get_activity_tracker() -> ActivityTracker:
+    """
+    获取全局的发帖频率计数器 主题帖 回复与楼中楼在生产者产出后被自动计入
+
+    Returns:
+        ActivityTracker
+
+    Note:
+        可在检查函数中调用`get_activity_tracker().count(obj.author_id, 120.0)`
+    """
+
+    return _tracker
+
+
+def enable_activity_tracker(
+    resolution: float = 10.0,
+    num_buckets: int = 90,
+    max_users: int = 100000,
+    path: str | Path | None = None,
+    max_pids: int = 1000000,
+) -> ActivityTracker:
+    """
+    以指定参数重建全局的发帖频率计数器
+
+    Args:
+        resolution (float, optional): 桶宽 以秒为单位. Defaults to 10.0.
+        num_buckets (int, optional): 每个用户的桶数. Defaults to 90.
+        max_users (int, optional): 用户数上限. Defaults to 100000.
+        path (str | Path, optional): 持久化文件路径 启用时从中恢复 并在进程退出时写回. Defaults to None.
+        max_pids (int, optional): 去重集合的容量上限. Defaults to 1000000.
+
+    Returns:
+        ActivityTracker
+    """
+
+    global _tracker
+    _tracker = ActivityTracker(resolution, num_buckets, max_users, max_pids)
+    if path is not None:
+        _tracker.restore(path)
+        atexit.register(_tracker.save, path)
+    return _tracker
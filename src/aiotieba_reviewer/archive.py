@@ -0,0 +1,227 @@
+from __future__ import annotations
+
+import pickle
+import struct
+import zlib
+from collections.abc import Callable, Hashable, Iterator
+from pathlib import Path
+from typing import Any, BinaryIO
+
+from aiotieba import get_logger as LOG
+
+from .reviewer import comments, posts, threads
+from .typing import Comment, Post, Thread
+
+_MAGIC = b"TBAR\x01"
+_LEN = struct.Struct(">I")
+_SUFFIX = ".seg"
+
+# (层级, 键, 对象列表) 层级为threads/posts/comments 键分别为(fname, pn)/tid/pid
+# 层级为parent时是仅用于关联parent的上层对象 键为该对象所属的层级threads/posts
+TypeArchiveRecord = tuple[str, Any, list]
+
+
+def list_segments(path: str | Path) -> list[Path]:
+    """
+    按写入顺序列出档案目录中的段文件
+
+    Args:
+        path (str | Path): 档案目录
+
+    Returns:
+        list[Path]
+    """
+
+    return sorted(Path(path).glob(f"*{_SUFFIX}"))
+
+
+def read_segment(path: str | Path) -> Iterator[TypeArchiveRecord]:
+    """
+    依次读取段文件中的记录
+
+    Args:
+        path (str | Path): 段文件路径
+
+    Yields:
+        TypeArchiveRecord: (层级, 键, 对象列表)
+    """
+
+    with open(path, "rb") as fp:
+        if fp.read(len(_MAGIC)) != _MAGIC:
+            raise ValueError(f"Not an archive segment. path={path}")
+        while header := fp.read(_LEN.size):
+            (length,) = _LEN.unpack(header)
+            payload = fp.read(length)
+            if len(payload) != length:
+                LOG().warning(f"Truncated archive segment. path={path}")
+                return
+            yield pickle.loads(zlib.decompress(payload))
+
+
+def _write(fp: BinaryIO, record: TypeArchiveRecord) -> int:
+    payload = zlib.compress(pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL))
+    fp.write(_LEN.pack(len(payload)) + payload)
+    return _LEN.size + len(payload)
+
+
+class ArchiveWriter:
+    """
+    以追加写入的段文件归档经过审查的主题帖 回复与楼中楼
+
+    档案是一个目录 其中的段文件按序号命名 每条记录经pickle序列化后以zlib压缩并加上长度前缀
+    段文件超过segment_size后切换到下一个段文件 已存在的段文件不会被改写
+
+    同一段文件内 对象集合未发生变化的记录只写入一次
+    主题帖以(tid, last_time)判断变化 回复与楼中楼以pid判断
+    回复与楼中楼的上层对象未出现在当前段文件中时 先写入一条parent记录 使每个段文件都能独立关联parent
+
+    Args:
+        path (str | Path): 档案目录 不存在时自动创建
+        segment_size (int, optional): 单个段文件的大小上限 以字节为单位. Defaults to 16 MiB.
+
+    Attributes:
+        records (int): 已写入的记录数
+        skipped (int): 因重复而跳过的记录数
+        segments (int): 本实例写入过的段文件数
+    """
+
+    __slots__ = [
+        "path",
+        "segment_size",
+        "records",
+        "skipped",
+        "segments",
+        "_fp",
+        "_size",
+        "_index",
+        "_seen",
+        "_parents",
+    ]
+
+    def __init__(self, path: str | Path, segment_size: int = 16 << 20) -> None:
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.segment_size = segment_size
+        self.records = 0
+        self.skipped = 0
+        self.segments = 0
+
+        segs = list_segments(self.path)
+        self._index = int(segs[-1].stem) + 1 if segs else 0
+        self._fp: BinaryIO | None = None
+        self._size = 0
+        self._seen: set[Hashable] = set()
+        self._parents: set[Hashable] = set()
+
+    def _rotate(self) -> None:
+        if self._fp is not None:
+            self._fp.close()
+        seg_path = self.path / f"{self._index:08d}{_SUFFIX}"
+        self._index += 1
+        self._fp = open(seg_path, "xb")  # noqa: SIM115
+        self._fp.write(_MAGIC)
+        self._size = len(_MAGIC)
+        self._seen.clear()
+        self._parents.clear()
+        self.segments += 1
+
+    def write(
+        self,
+        level: str,
+        key: Any,
+        objs: list,
+        signatures: list[Hashable],
+        parent: tuple[str, Any, Hashable] | None = None,
+    ) -> None:
+        """
+        写入一条记录
+
+        Args:
+            level (str): 层级 threads/posts/comments
+            key (Any): 记录的键
+            objs (list): 对象列表
+            signatures (list[Hashable]): 各对象的签名 全部已写入过时跳过该记录
+            parent (tuple[str, Any, Hashable], optional): 上层对象的(层级, 对象, 签名). Defaults to None.
+        """
+
+        if not objs:
+            return
+        if self._fp is not None and all(s in self._seen for s in signatures):
+            self.skipped += 1
+            return
+
+        if self._fp is None or self._size >= self.segment_size:
+            self._rotate()
+
+        try:
+            if parent is not None:
+                parent_level, parent_obj, parent_signature = parent
+                if parent_signature not in self._seen and parent_signature not in self._parents:
+                    self._size += _write(self._fp, ("parent", parent_level, [parent_obj]))
+                    self._parents.add(parent_signature)
+            self._size += _write(self._fp, (level, key, objs))
+        except (pickle.PicklingError, TypeError, AttributeError) as err:
+            LOG().debug(f"Skip unpicklable record. level={level} err={err!r}")
+            return
+
+        self._fp.flush()
+        self._seen.update(signatures)
+        self.records += 1
+
+    def close(self) -> None:
+        if self._fp is not None:
+            self._fp.close()
+            self._fp = None
+
+    def wrap_threads(self, producer: Callable) -> Callable:
+        async def _(fname: str, pn: int = 1) -> list[Thread]:
+            thread_list = await producer(fname, pn)
+            self.write("threads", (fname, pn), thread_list, [(t.tid, t.last_time) for t in thread_list])
+            return thread_list
+
+        return _
+
+    def wrap_posts(self, producer: Callable) -> Callable:
+        async def _(thread: Thread) -> list[Post]:
+            post_list = await producer(thread)
+            self.write(
+                "posts",
+                thread.tid,
+                post_list,
+                [p.pid for p in post_list],
+                ("threads", thread, (thread.tid, thread.last_time)),
+            )
+            return post_list
+
+        return _
+
+    def wrap_comments(self, producer: Callable) -> Callable:
+        async def _(post: Post) -> list[Comment]:
+            comment_list = await producer(post)
+            self.write("comments", post.pid, comment_list, [c.pid for c in comment_list], ("posts", post, post.pid))
+            return comment_list
+
+        return _
+
+
+def enable_archive(path: str | Path, segment_size: int = 16 << 20) -> ArchiveWriter:
+    """
+    在生产者阶段归档主题帖 回复与楼中楼 以供`backtest`离线回放
+
+    Args:
+        path (str | Path): 档案目录
+        segment_size (int, optional): 单个段文件的大小上限 以字节为单位. Defaults to 16 MiB.
+
+    Returns:
+        ArchiveWriter
+
+    Note:
+        归档发生在过滤器与检查函数之前 因此包含本轮产出的全部对象
+        自定义的生产者须在本函数之前设置
+    """
+
+    writer = ArchiveWriter(path, segment_size)
+    threads.producer.set_producer(writer.wrap_threads(threads.producer.producer))
+    posts.producer.set_producer(writer.wrap_posts(posts.producer.producer))
+    comments.producer.set_producer(writer.wrap_comments(comments.producer.producer))
+    return writer
@@ -0,0 +1,335 @@
+from __future__ import annotations
+
+import asyncio
+import multiprocessing
+import pickle
+import time
+from collections import Counter
+from collections.abc import Callable
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from aiotieba import get_logger as LOG
+
+from . import executor
+from .archive import list_segments, read_segment
+from .punish import Punish
+from .reviewer import comment, comments, post, posts, thread, threads
+from .reviewer.filter_runner import apply_filters
+from .rule_stat import CheckerStat, RuleStat, enable_rule_accounting, get_rulebook, op_name
+
+# (层级, id) -> (处罚类型, 封禁天数, 规则)
+TypePunishMap = dict[tuple[str, int], tuple[str, int, str]]
+
+_LEVELS = {
+    "threads": ("thread", lambda t: t.tid),
+    "posts": ("post", lambda p: p.pid),
+    "comments": ("comment", lambda c: c.pid),
+}
+
+
+class PunishDiff:
+    """
+    两次回测的处罚差异
+
+    Attributes:
+        added (TypePunishMap): 仅在本次回测中出现的处罚
+        removed (TypePunishMap): 仅在基准回测中出现的处罚
+        changed (dict[tuple[str, int], tuple[tuple[str, int, str], tuple[str, int, str]]]): 处罚类型 天数或规则发生变化的对象 值为(基准, 本次)
+    """
+
+    __slots__ = ["added", "removed", "changed"]
+
+    def __init__(self, current: TypePunishMap, baseline: TypePunishMap) -> None:
+        self.added = {k: v for k, v in current.items() if k not in baseline}
+        self.removed = {k: v for k, v in baseline.items() if k not in current}
+        self.changed = {k: (baseline[k], v) for k, v in current.items() if k in baseline and baseline[k][:2] != v[:2]}
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.removed or self.changed)
+
+    def __repr__(self) -> str:
+        return str({"added": len(self.added), "removed": len(self.removed), "changed": len(self.changed)})
+
+
+class BacktestResult:
+    """
+    回测结果
+
+    Attributes:
+        segments (int): 回放的段文件数
+        objs (Counter[str]): 各层级回放的对象数
+        errors (Counter[str]): 各层级检查时抛出异常的次数
+        orphans (Counter[str]): 各层级因找不到parent而跳过的对象数
+        elapsed (float): 回测的墙钟耗时 以秒为单位
+        cpu_time (float): 所有工作进程的CPU耗时之和 以秒为单位
+        checkers (dict[str, CheckerStat]): 各检查函数与过滤器的耗时统计
+        rules (dict[str, RuleStat]): 各规则的命中统计
+        punishes (TypePunishMap): 各对象的处罚
+    """
+
+    __slots__ = ["segments", "objs", "errors", "orphans", "elapsed", "cpu_time", "checkers", "rules", "punishes"]
+
+    def __init__(self) -> None:
+        self.segments = 0
+        self.objs: Counter[str] = Counter()
+        self.errors: Counter[str] = Counter()
+        self.orphans: Counter[str] = Counter()
+        self.elapsed = 0.0
+        self.cpu_time = 0.0
+        self.checkers: dict[str, CheckerStat] = {}
+        self.rules: dict[str, RuleStat] = {}
+        self.punishes: TypePunishMap = {}
+
+    @property
+    def throughput(self) -> float:
+        """
+        每秒回放的对象数
+        """
+
+        return self.objs.total() / self.elapsed if self.elapsed else 0.0
+
+    def merge(self, other: BacktestResult) -> None:
+        self.segments += other.segments
+        self.objs.update(other.objs)
+        self.errors.update(other.errors)
+        self.orphans.update(other.orphans)
+        self.cpu_time += other.cpu_time
+        self.punishes.update(other.punishes)
+
+        for name, stat in other.checkers.items():
+            if (mine := self.checkers.get(name)) is None:
+                self.checkers[name] = stat
+                continue
+            mine.calls += stat.calls
+            mine.cost_ns += stat.cost_ns
+            mine.hits += stat.hits
+
+        for rule, stat in other.rules.items():
+            if (mine := self.rules.get(rule)) is None:
+                self.rules[rule] = stat
+                continue
+            mine.hits += stat.hits
+            mine.cost_ns += stat.cost_ns
+            mine.ops.update(stat.ops)
+            mine.days.update(stat.days)
+
+    def diff(self, baseline: BacktestResult) -> PunishDiff:
+        """
+        与基准回测比较处罚
+
+        Args:
+            baseline (BacktestResult): 基准回测 通常是修改规则前在同一档案上的回测
+
+        Returns:
+            PunishDiff
+        """
+
+        return PunishDiff(self.punishes, baseline.punishes)
+
+    def report(self, baseline: BacktestResult | None = None, limit: int = 10) -> str:
+        """
+        输出吞吐量 最耗时的检查函数 各规则的命中率与处罚差异
+
+        Args:
+            baseline (BacktestResult, optional): 基准回测. Defaults to None即不输出处罚差异.
+            limit (int, optional): 每一类最多输出的条数. Defaults to 10.
+
+        Returns:
+            str
+        """
+
+        num_objs = self.objs.total()
+        lines = [
+            f"Replayed {num_objs} objs from {self.segments} segments in {self.elapsed:.2f}s "
+            f"throughput={self.throughput:.1f}/s cpu={self.cpu_time:.2f}s objs={dict(self.objs)} "
+            f"errors={dict(self.errors)} orphans={dict(self.orphans)}"
+        ]
+
+        lines.append("Most expensive checkers:")
+        checkers = sorted(self.checkers.items(), key=lambda item: item[1].cost_ns, reverse=True)[:limit]
+        for name, stat in checkers:
+            avg = stat.cost_ns / (1e3 * stat.calls) if stat.calls else 0.0
+            lines.append(
+                f"  {name} calls={stat.calls} total={stat.cost_ns / 1e6:.1f}ms avg={avg:.1f}us hits={stat.hits}"
+            )
+
+        lines.append("Rules:")
+        rules = sorted(self.rules.items(), key=lambda item: item[1].hits, reverse=True)[:limit]
+        for rule, stat in rules:
+            rate = stat.hits / num_objs if num_objs else 0.0
+            lines.append(f"  {rule} hits={stat.hits} rate={rate:.4%} ops={dict(stat.ops)}")
+
+        if baseline is not None:
+            punish_diff = self.diff(baseline)
+            lines.append(f"Punish diff against baseline: {punish_diff}")
+            for title, items in (("added", punish_diff.added), ("removed", punish_diff.removed)):
+                for (level, _id), (op, day, rule) in list(items.items())[:limit]:
+                    lines.append(f"  {title} {level} id={_id} op={op} day={day} rule={rule}")
+            for (level, _id), (prev, curr) in list(punish_diff.changed.items())[:limit]:
+                lines.append(f"  changed {level} id={_id} {prev[:2]} -> {curr[:2]} rule={curr[2]}")
+
+        return "\n".join(lines)
+
+    def save(self, path: str | Path) -> None:
+        """
+        保存回测结果 以便之后作为基准
+
+        Args:
+            path (str | Path)
+        """
+
+        with open(path, "wb") as fp:
+            pickle.dump(self, fp, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def load(path: str | Path) -> BacktestResult:
+        with open(path, "rb") as fp:
+            return pickle.load(fp)
+
+
+async def __null_executor(_):
+    pass
+
+
+_level_funcs: dict[str, tuple[list, set, Callable]] = {}
+
+
+def _init_worker(setup: Callable[[], None] | None) -> None:
+    """
+    在工作进程中注册检查函数与过滤器
+
+    检查函数只包装规则统计 不经过黑白名单检查与历史状态缓存 以使每个对象都被检查
+    """
+
+    # 回测从不执行处罚
+    executor.punish_executor = __null_executor
+    # 规则统计须在注册过滤器之前启用
+    rulebook = enable_rule_accounting(report_interval=0.0)
+    if setup is not None:
+        setup()
+
+    _level_funcs["threads"] = (threads.filter._filters, threads.filter._side_effect_free, thread.checker.ori_checker)
+    _level_funcs["posts"] = (posts.filter._filters, posts.filter._side_effect_free, post.checker.ori_checker)
+    _level_funcs["comments"] = (
+        comments.filter._filters,
+        comments.filter._side_effect_free,
+        comment.checker.ori_checker,
+    )
+    for level, (filters, side_effect_free, checker) in _level_funcs.items():
+        _level_funcs[level] = (filters, side_effect_free, rulebook.account(checker, level[:-1]))
+
+
+def _record(result: BacktestResult, level: str, punish: Punish) -> None:
+    name, get_id = _LEVELS[level]
+    result.punishes[name, get_id(punish.obj)] = (op_name(punish.op), punish.day, punish.rule)
+
+
+async def _replay_segment(path: Path, result: BacktestResult) -> None:
+    parents = {}
+
+    for level, key, objs in read_segment(path):
+        if level == "parent":
+            for obj in objs:
+                parents[obj.tid if key == "threads" else obj.pid] = obj
+            continue
+
+        filters, side_effect_free, checker = _level_funcs[level]
+        name, get_id = _LEVELS[level]
+
+        # 按段内先前出现的上层对象恢复parent
+        if level == "threads":
+            for obj in objs:
+                parents[obj.tid] = obj
+        else:
+            if (parent := parents.get(key)) is None:
+                # 旧档案中可能缺少parent记录 跳过而不是计为检查函数的异常
+                result.orphans[name] += len(objs)
+                continue
+            for obj in objs:
+                obj.parent = parent
+            if level == "posts":
+                for obj in objs:
+                    parents[obj.pid] = obj
+        result.objs[name] += len(objs)
+
+        try:
+            for punish in await apply_filters(filters, side_effect_free, objs):
+                _record(result, level, punish)
+        except Exception as err:
+            result.errors[name] += 1
+            LOG().debug(f"Filter failed. level={level} key={key} err={err!r}")
+            continue
+
+        for obj in objs:
+            try:
+                punish = await checker(obj)
+            except Exception as err:
+                result.errors[name] += 1
+                LOG().debug(f"Checker failed. level={level} id={get_id(obj)} err={err!r}")
+                continue
+            if punish:
+                _record(result, level, punish)
+
+
+def _run_segment(path: Path) -> BacktestResult:
+    result = BacktestResult()
+    start = time.process_time()
+    asyncio.run(_replay_segment(path, result))
+    result.cpu_time = time.process_time() - start
+    result.segments = 1
+
+    # 取走本段的统计并清零 以便下一个段重新累计
+    rulebook = get_rulebook()
+    result.rules, rulebook.rules = rulebook.rules, {}
+    for name, stat in rulebook.checkers.items():
+        snapshot = result.checkers[name] = CheckerStat(stat.rules)
+        snapshot.calls, snapshot.cost_ns, snapshot.hits = stat.calls, stat.cost_ns, stat.hits
+        stat.calls = stat.cost_ns = stat.hits = 0
+
+    return result
+
+
+def backtest(
+    path: str | Path,
+    setup: Callable[[], None] | None = None,
+    *,
+    processes: int | None = None,
+) -> BacktestResult:
+    """
+    在进程池中以当前的规则回放档案
+
+    每个段文件由一个工作进程独立回放 依次执行各层级的过滤器与检查函数 处罚只被记录 从不执行
+
+    Args:
+        path (str | Path): `enable_archive`写入的档案目录
+        setup (Callable[[], None], optional): 在每个工作进程中注册检查函数与过滤器的函数 须可被pickle 通常是定义在模块顶层的函数. Defaults to None.
+        processes (int, optional): 工作进程数. Defaults to None即CPU核数.
+
+    Returns:
+        BacktestResult
+
+    Note:
+        工作进程以spawn方式启动 调用方的主模块须以`if __name__ == "__main__":`保护入口
+        检查函数不经过黑白名单检查与历史状态缓存 需要访问客户端或数据库的检查函数应在setup中配置`enable_replay`与LocalDB
+        不同段之间没有顺序保证 每个段文件都包含其中回复与楼中楼的上层对象 缺少上层对象的对象被跳过并计入orphans
+    """
+
+    segs = list_segments(path)
+    result = BacktestResult()
+    if not segs:
+        LOG().warning(f"No archive segment found. path={path}")
+        return result
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(
+        max_workers=processes,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(setup,),
+    ) as pool:
+        for seg_result in pool.map(_run_segment, segs):
+            result.merge(seg_result)
+    result.elapsed = time.perf_counter() - start
+
+    return result
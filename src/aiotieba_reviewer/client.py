@@ -1,15 +1,76 @@
-from collections.abc import AsyncGenerator
+from __future__ import annotations
+
+import contextvars
+from collections.abc import AsyncGenerator, Callable
+from pathlib import Path
 
 import aiotieba as tb
 
 from .config import get_account
-from .database import PostgreDB, SQLiteDB
+from .database import LocalDB, PostgreDB, SQLiteDB, create_db
 
 _fname = ""
 _db_sqlite = None
 
 client_generator: AsyncGenerator[tb.Client, None] = None
-db_generator: AsyncGenerator[PostgreDB, None] = None
+db_generator: AsyncGenerator[PostgreDB | LocalDB, None] = None
+
+
+class Forum:
+    """
+    单个待管理吧的审查上下文
+
+    Args:
+        fname (str): 待管理吧的吧名
+        db (PostgreDB | LocalDB): 该吧使用的数据库客户端 可与其他吧共享连接池
+
+    Attributes:
+        fname (str): 待管理吧的吧名
+        db (PostgreDB | LocalDB): 数据库客户端
+        db_sqlite (SQLiteDB): 该吧独占的SQLite客户端
+
+    Note:
+        通过`set_forum`进入上下文后 `get_fname` `get_db` `get_db_sqlite`都将返回该吧的状态
+        上下文基于contextvars实现 因此同一事件循环中的不同任务可以分别审查不同的吧
+    """
+
+    __slots__ = ["fname", "db", "db_sqlite"]
+
+    def __init__(self, fname: str, db: PostgreDB | LocalDB) -> None:
+        self.fname = fname
+        self.db = db
+        self.db_sqlite = SQLiteDB(fname)
+
+    def __repr__(self) -> str:
+        return f"Forum(fname={self.fname!r})"
+
+
+_forum: contextvars.ContextVar[Forum | None] = contextvars.ContextVar("forum", default=None)
+
+
+def set_forum(forum: Forum | None) -> contextvars.Token:
+    """
+    在当前任务的上下文中设置待管理吧
+
+    Args:
+        forum (Forum | None): 审查上下文 None表示回退到`set_fname`设置的全局状态
+
+    Returns:
+        contextvars.Token: 可用于恢复先前上下文的令牌
+    """
+
+    return _forum.set(forum)
+
+
+def get_forum() -> Forum | None:
+    """
+    获取当前任务的审查上下文
+
+    Returns:
+        Forum | None: None表示当前使用`set_fname`设置的全局状态
+    """
+
+    return _forum.get()
 
 
 def set_BDUSS_key(BDUSS_key: str) -> None:
@@ -30,6 +91,33 @@ def set_BDUSS_key(BDUSS_key: str) -> None:
     client_generator = _client_generator()
 
 
+def wrap_client(wrapper: Callable[[tb.Client], tb.Client]) -> None:
+    """
+    使用代理包装`get_client`返回的客户端
+
+    Args:
+        wrapper (Callable[[tb.Client], tb.Client]): 代理构造函数 对同一个客户端只会调用一次
+
+    Note:
+        须在`set_BDUSS_key`之后调用
+        多次调用时后包装的代理位于外层
+    """
+
+    global client_generator
+    ori_generator = client_generator
+
+    async def _client_generator():
+        ori_client = None
+        wrapped = None
+        async for client in ori_generator:
+            if client is not ori_client:
+                ori_client = client
+                wrapped = wrapper(client)
+            yield wrapped
+
+    client_generator = _client_generator()
+
+
 async def get_client() -> tb.Client:
     """
     获取一个客户端
@@ -41,19 +129,23 @@ async def get_client() -> tb.Client:
     return await client_generator.__anext__()
 
 
-def set_fname(fname: str) -> None:
+def set_fname(fname: str, sqlite_path: str | Path | None = None) -> None:
     """
     设置待管理吧的吧名
 
     Args:
         fname (str)
+        sqlite_path (str | Path, optional): SQLite缓存的文件路径. Defaults to None即.cache/{fname}.sqlite.
+
+    Note:
+        多个进程审查同一个吧时应当各自使用不同的sqlite_path
     """
 
     global _fname
     _fname = fname
 
     async def _db_generator():
-        async with PostgreDB(fname) as db:
+        async with create_db(fname) as db:
             while 1:
                 yield db
 
@@ -61,21 +153,25 @@ def set_fname(fname: str) -> None:
     db_generator = _db_generator()
 
     global _db_sqlite
-    _db_sqlite = SQLiteDB(fname)
+    _db_sqlite = SQLiteDB(fname, sqlite_path)
 
 
 def get_fname() -> str:
+    if (forum := _forum.get()) is not None:
+        return forum.fname
     return _fname
 
 
-async def get_db() -> PostgreDB:
+async def get_db() -> PostgreDB | LocalDB:
     """
-    获取一个PostgreSQL客户端
+    获取一个数据库客户端
 
     Returns:
-        PostgreDB
+        PostgreDB | LocalDB
     """
 
+    if (forum := _forum.get()) is not None:
+        return forum.db
     return await db_generator.__anext__()
 
 
@@ -87,4 +183,6 @@ def get_db_sqlite() -> SQLiteDB:
         SQLiteDB
     """
 
+    if (forum := _forum.get()) is not None:
+        return forum.db_sqlite
     return _db_sqlite
@@ -0,0 +1,240 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import itertools
+import time
+from collections.abc import AsyncGenerator, Callable
+from typing import Any, Literal
+
+import aiotieba as tb
+from aiotieba import get_logger as LOG
+
+from .client import wrap_client
+from .config import get_account
+from .proxy import ClientProxy
+from .ratelimit import THROTTLE_CODES, get_err_code, is_read_method
+
+TypePoolPolicy = Literal["least_inflight", "round_robin"]
+
+# 依赖吧务权限或当前账号身份的读请求 不能分发给其他账号
+_PRIVILEGED_PREFIXES = (
+    "get_self_",
+    "get_bawu_",
+    "get_blocks",
+    "get_blacklist",
+    "get_recover",
+    "get_unblock_appeals",
+    "get_statistics",
+)
+
+
+class PoolMember:
+    """
+    客户端池中的单个账号
+
+    Attributes:
+        client (tb.Client): 客户端
+        key (str): BDUSS_key 吧务账号为空字符串
+        inflight (int): 进行中的请求数
+        requests (int): 累计请求数
+        ejections (int): 累计被逐出的次数
+        ejected_until (float): 逐出状态的结束时刻 基于time.monotonic
+    """
+
+    __slots__ = ["client", "key", "inflight", "requests", "ejections", "ejected_until"]
+
+    def __init__(self, client: tb.Client, key: str) -> None:
+        self.client = client
+        self.key = key
+        self.inflight = 0
+        self.requests = 0
+        self.ejections = 0
+        self.ejected_until = 0.0
+
+    def __repr__(self) -> str:
+        return str(
+            {
+                "key": self.key,
+                "inflight": self.inflight,
+                "requests": self.requests,
+                "ejections": self.ejections,
+            }
+        )
+
+
+class ClientPool:
+    """
+    多账号读请求客户端池
+
+    读请求在吧务账号与各读账号间负载均衡 写请求始终使用吧务账号
+    被服务端限流的账号将被暂时逐出 并在逐出时间结束后自动重新加入
+
+    Args:
+        BDUSS_keys (list[str]): 额外用于读请求的账号的BDUSS_key
+        policy (TypePoolPolicy, optional): 负载均衡策略. Defaults to "least_inflight".
+        eject_time (float, optional): 被限流账号的逐出时间 以秒为单位. Defaults to 300.0.
+        throttle_codes (frozenset[int], optional): 视为限流的服务端错误码. Defaults to THROTTLE_CODES.
+
+    Attributes:
+        members (list[PoolMember]): 池中的账号 第一个为吧务账号
+
+    Note:
+        读账号的客户端在第一次读请求时全部打开 任一账号打开失败时已打开的客户端会被关闭
+        客户端由异步生成器持有 事件循环关闭时随生成器一并退出 也可以调用`close`主动关闭
+    """
+
+    __slots__ = [
+        "BDUSS_keys",
+        "policy",
+        "eject_time",
+        "throttle_codes",
+        "members",
+        "_rr",
+        "_open_lock",
+        "_members_gen",
+    ]
+
+    def __init__(
+        self,
+        BDUSS_keys: list[str],
+        policy: TypePoolPolicy = "least_inflight",
+        eject_time: float = 300.0,
+        throttle_codes: frozenset[int] = THROTTLE_CODES,
+    ) -> None:
+        self.BDUSS_keys = BDUSS_keys
+        self.policy = policy
+        self.eject_time = eject_time
+        self.throttle_codes = throttle_codes
+
+        self.members: list[PoolMember] = []
+        self._rr = itertools.count()
+        self._open_lock = asyncio.Lock()
+        self._members_gen: AsyncGenerator[list[PoolMember], None] | None = None
+
+    def wrap(self, client: tb.Client) -> PooledClient:
+        """
+        使用该客户端池代理吧务账号的客户端
+
+        Args:
+            client (tb.Client): 吧务账号的客户端
+
+        Returns:
+            PooledClient
+        """
+
+        # 保留已打开的读账号
+        self.members[:1] = [PoolMember(client, "")]
+        return PooledClient(client, self)
+
+    async def _member_generator(self) -> AsyncGenerator[list[PoolMember], None]:
+        async with contextlib.AsyncExitStack() as stack:
+            members = []
+            for key in self.BDUSS_keys:
+                client = await stack.enter_async_context(tb.Client(account=get_account(key), try_ws=True))
+                members.append(PoolMember(client, key))
+            while 1:
+                yield members
+
+    async def _open(self) -> None:
+        async with self._open_lock:
+            if self._members_gen is not None:
+                return
+            members_gen = self._member_generator()
+            # 打开失败时AsyncExitStack已关闭先前打开的客户端 池保持只有吧务账号的状态
+            members = await members_gen.__anext__()
+            self._members_gen = members_gen
+            self.members.extend(members)
+
+    async def close(self) -> None:
+        """
+        关闭各读账号的客户端 之后的读请求会重新打开它们
+        """
+
+        async with self._open_lock:
+            if self._members_gen is None:
+                return
+            members_gen, self._members_gen = self._members_gen, None
+            del self.members[1:]
+            await members_gen.aclose()
+
+    def _pick(self) -> PoolMember:
+        now = time.monotonic()
+        available = [m for m in self.members if m.ejected_until <= now]
+        if not available:
+            return min(self.members, key=lambda m: m.ejected_until)
+
+        if self.policy == "round_robin":
+            return available[next(self._rr) % len(available)]
+        return min(available, key=lambda m: m.inflight)
+
+    async def read(self, name: str, args: tuple, kwargs: dict) -> Any:
+        """
+        从池中选择一个账号发起读请求
+        """
+
+        if self._members_gen is None and self.BDUSS_keys:
+            await self._open()
+
+        member = self._pick()
+        member.inflight += 1
+        member.requests += 1
+        try:
+            res = await getattr(member.client, name)(*args, **kwargs)
+        finally:
+            member.inflight -= 1
+
+        if get_err_code(res) in self.throttle_codes:
+            member.ejected_until = time.monotonic() + self.eject_time
+            member.ejections += 1
+            LOG().warning(f"Eject throttled account. key={member.key!r} eject_time={self.eject_time}s")
+
+        return res
+
+
+class PooledClient(ClientProxy):
+    """
+    将读请求分发到客户端池的客户端代理
+
+    Args:
+        client (tb.Client): 吧务账号的客户端
+        pool (ClientPool): 客户端池
+    """
+
+    __slots__ = ["_pool"]
+
+    def __init__(self, client: tb.Client, pool: ClientPool) -> None:
+        super().__init__(client)
+        self._pool = pool
+
+    def _wrap(self, name: str, method: Callable) -> Callable:
+        if not is_read_method(name) or name.startswith(_PRIVILEGED_PREFIXES):
+            return method
+
+        pool = self._pool
+
+        async def _(*args, **kwargs):
+            return await pool.read(name, args, kwargs)
+
+        return _
+
+
+def enable_client_pool(BDUSS_keys: list[str], policy: TypePoolPolicy = "least_inflight") -> ClientPool:
+    """
+    使用多个账号分担读请求
+
+    Args:
+        BDUSS_keys (list[str]): 额外用于读请求的账号的BDUSS_key 须在account.toml中配置
+        policy (TypePoolPolicy, optional): 负载均衡策略. Defaults to "least_inflight".
+
+    Returns:
+        ClientPool
+
+    Note:
+        须在`set_BDUSS_key`之后 其他客户端代理之前调用
+        删帖 封禁等吧务操作仍由`set_BDUSS_key`设置的账号执行
+    """
+
+    pool = ClientPool(BDUSS_keys, policy)
+    wrap_client(pool.wrap)
+    return pool
@@ -1,2 +1,22 @@
+from __future__ import annotations
+
+from ..config import DB_CONFIG
+from .local import LocalDB
 from .postgre import PostgreDB
 from .sqlite import SQLiteDB
+
+
+def create_db(fname: str = "") -> PostgreDB | LocalDB:
+    """
+    按配置文件`database.toml`中的`backend`字段创建数据库客户端
+
+    Args:
+        fname (str): 操作的目标贴吧名. Defaults to ''.
+
+    Returns:
+        PostgreDB | LocalDB: `backend = "local"`时返回LocalDB 否则返回PostgreDB
+    """
+
+    if DB_CONFIG.get("backend", "postgres") == "local":
+        return LocalDB(fname)
+    return PostgreDB(fname)
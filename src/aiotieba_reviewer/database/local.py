@@ -0,0 +1,476 @@
+from __future__ import annotations
+
+import asyncio
+import datetime
+import logging
+import math
+import random
+import sqlite3
+from collections import Counter
+from collections.abc import Callable
+from typing import Any
+
+from aiotieba import get_logger
+
+from ..config import DB_CONFIG
+from ..tracing import span
+
+
+def _handle_exception(
+    null_factory: Callable[[], Any],
+    ok_log_level: int = logging.NOTSET,
+    err_log_level: int = logging.WARNING,
+):
+    """
+    模拟查询延迟并处理SQL操作抛出的异常 只能用于装饰类成员函数
+
+    Args:
+        null_factory (Callable[[], Any]): 空构造工厂 用于返回一个默认值
+        ok_log_level (int, optional): 正常日志等级. Defaults to logging.NOTSET.
+        err_log_level (int, optional): 异常日志等级. Defaults to logging.WARNING.
+    """
+
+    def wrapper(func):
+        name = func.__name__
+        span_name = f"local.{name}"
+
+        async def awrapper(self: LocalDB, *args, **kwargs):
+            def _log(log_level: int, err: Exception | None = None) -> None:
+                logger = get_logger()
+                if logger.isEnabledFor(err_log_level):
+                    if err is None:
+                        err = "Suceeded"
+                    log_str = f"{err}. fname={self.fname} args={args} kwargs={kwargs}"
+                    record = logger.makeRecord(logger.name, log_level, None, 0, log_str, None, None, name)
+                    logger.handle(record)
+
+            self.queries[name] += 1
+            try:
+                with span(span_name):
+                    if delay := self._store.sample_latency():
+                        await asyncio.sleep(delay)
+                    ret = func(self, *args, **kwargs)
+
+                if ok_log_level:
+                    _log(ok_log_level)
+
+            except Exception as err:
+                _log(err_log_level, err)
+                return null_factory()
+
+            else:
+                return ret
+
+        return awrapper
+
+    return wrapper
+
+
+class _LocalStore:
+    """
+    由同一个LocalDB派生的所有实例共享的连接与延迟配置
+    """
+
+    __slots__ = ["conn", "latency", "sigma", "rng", "tables"]
+
+    def __init__(self, path: str, latency: float, latency_p99: float) -> None:
+        self.conn = sqlite3.connect(path, isolation_level=None, cached_statements=64)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=OFF")
+        # 以64位补码计算海明距离 与ahash按有符号整数存储的方式一致
+        self.conn.create_function(
+            "hamming", 2, lambda a, b: ((a ^ b) & 0xFFFFFFFFFFFFFFFF).bit_count(), deterministic=True
+        )
+
+        self.latency = latency
+        # 延迟服从对数正态分布 以中位数与p99确定其形状
+        self.sigma = math.log(latency_p99 / latency) / 2.326 if latency and latency_p99 > latency else 0.0
+        self.rng = random.Random()
+        self.tables: set[str] = set()
+
+    def sample_latency(self) -> float:
+        if not self.latency:
+            return 0.0
+        if not self.sigma:
+            return self.latency
+        return self.latency * math.exp(self.rng.gauss(0.0, self.sigma))
+
+
+class LocalDB:
+    """
+    进程内的数据库 与PostgreDB接口一致
+
+    数据保存在SQLite中 默认为内存数据库 可通过配置文件指定文件路径以持久化
+    每次查询前按配置的延迟分布等待 以便基准测试复现生产环境的数据库延迟
+
+    Args:
+        fname (str): 操作的目标贴吧名. Defaults to ''.
+        path (str, optional): SQLite数据库路径 ":memory:"表示内存数据库. 默认读取配置文件.
+        latency (float, optional): 查询延迟的中位数 以秒为单位. 默认读取配置文件.
+        latency_p99 (float, optional): 查询延迟的p99 以秒为单位 不大于latency时延迟固定. 默认读取配置文件.
+
+    Attributes:
+        fname (str): 操作的目标贴吧名
+        queries (Counter[str]): 各方法的调用次数 由派生的实例共享
+
+    Note:
+        在`database.toml`中设置`backend = "local"`即可在`set_fname`与`run_multi_forum`中替代PostgreDB
+        `[local]`表中的`path` `latency` `latency_p99`字段对应同名参数
+    """
+
+    __slots__ = ["fname", "queries", "_store"]
+
+    def __init__(
+        self,
+        fname: str = "",
+        path: str | None = None,
+        latency: float | None = None,
+        latency_p99: float | None = None,
+    ) -> None:
+        self.fname = fname
+        self.queries: Counter[str] = Counter()
+
+        local_config = DB_CONFIG.get("local", {})
+        if path is None:
+            path = local_config.get("path", ":memory:")
+        if latency is None:
+            latency = local_config.get("latency", 0.0)
+        if latency_p99 is None:
+            latency_p99 = local_config.get("latency_p99", 0.0)
+        self._store = _LocalStore(path, latency, latency_p99)
+
+    async def __aenter__(self) -> LocalDB:
+        return self
+
+    async def __aexit__(self, exc_type=None, exc_val=None, exc_tb=None) -> None:
+        self._store.conn.close()
+
+    def fork(self, fname: str) -> LocalDB:
+        """
+        创建一个共享连接的实例
+
+        Args:
+            fname (str): 新实例操作的目标贴吧名
+
+        Returns:
+            LocalDB
+
+        Note:
+            连接的生命周期由原实例管理 不应对返回的实例调用`__aexit__`
+        """
+
+        db = object.__new__(LocalDB)
+        db.fname = fname
+        db.queries = self.queries
+        db._store = self._store
+        return db
+
+    def _table(self, prefix: str) -> str:
+        # 首次访问时建表 与PostgreDB在表不存在时自动建表的行为一致
+        table = f"{prefix}_{self.fname}" if prefix != "forum_score" else prefix
+        store = self._store
+        if table not in store.tables:
+            getattr(self, f"_create_table_{prefix}")(table)
+            store.tables.add(table)
+        return table
+
+    async def create_database(self) -> bool:
+        return True
+
+    def _create_table_forum_score(self, table: str) -> None:
+        self._store.conn.execute(
+            f'CREATE TABLE IF NOT EXISTS "{table}" '
+            "(fid INTEGER PRIMARY KEY, fname TEXT NOT NULL DEFAULT '', post INTEGER NOT NULL DEFAULT 0, follow INTEGER NOT NULL DEFAULT 0, record_time TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP)"
+        )
+
+    def _create_table_user_id(self, table: str) -> None:
+        conn = self._store.conn
+        conn.execute(
+            f'CREATE TABLE IF NOT EXISTS "{table}" '
+            "(user_id INTEGER PRIMARY KEY, permission INTEGER NOT NULL DEFAULT 0, note TEXT NOT NULL DEFAULT '', record_time TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP)"
+        )
+        conn.execute(f'CREATE INDEX IF NOT EXISTS "{table}_permission" ON "{table}"(permission)')
+
+    def _create_table_imghash(self, table: str) -> None:
+        self._store.conn.execute(
+            f'CREATE TABLE IF NOT EXISTS "{table}" '
+            "(img_hash INTEGER PRIMARY KEY, raw_hash TEXT NOT NULL DEFAULT '', permission INTEGER NOT NULL DEFAULT 0, note TEXT NOT NULL DEFAULT '', record_time TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP)"
+        )
+
+    async def create_table_forum_score(self) -> bool:
+        self._table("forum_score")
+        return True
+
+    async def create_table_user_id(self) -> bool:
+        self._table("user_id")
+        return True
+
+    async def create_table_imghash(self) -> bool:
+        self._table("imghash")
+        return True
+
+    @_handle_exception(bool, ok_log_level=logging.INFO)
+    def add_forum_score(self, fid: int, fname: str = "", /, post: int = 0, follow: int = 0) -> bool:
+        """
+        将fid添加到表forum_score
+
+        Args:
+            fid (int): 吧id
+            fname (str): 吧名. Defaults to ''.
+            post (int, optional): 发帖评分. Defaults to 0.
+            follow (int, optional): 关注评分. Defaults to 0.
+
+        Returns:
+            bool: True成功 False失败
+        """
+
+        if not fid:
+            raise ValueError("fid为空")
+
+        table = self._table("forum_score")
+        self._store.conn.execute(
+            f'REPLACE INTO "{table}" VALUES (?,?,?,?,CURRENT_TIMESTAMP)', (fid, fname, post, follow)
+        )
+        return True
+
+    @_handle_exception(bool, ok_log_level=logging.INFO)
+    def del_forum_score(self, fid: int) -> bool:
+        """
+        从表forum_score中删除fid
+
+        Args:
+            fid (int): 吧id
+
+        Returns:
+            bool: True成功 False失败
+        """
+
+        table = self._table("forum_score")
+        self._store.conn.execute(f'DELETE FROM "{table}" WHERE fid=?', (fid,))
+        return True
+
+    @staticmethod
+    def _default_forum_score() -> tuple[int, int]:
+        return (0, 0)
+
+    @_handle_exception(_default_forum_score)
+    def get_forum_score(self, fid: int) -> tuple[int, int]:
+        """
+        获取表forum_score中fid的评分
+
+        Args:
+            fid (int): 吧id
+
+        Returns:
+            tuple[int, int]: 发帖评分, 关注评分
+        """
+
+        table = self._table("forum_score")
+        if res := self._store.conn.execute(f'SELECT post,follow FROM "{table}" WHERE fid=?', (fid,)).fetchone():
+            return res
+        return self._default_forum_score()
+
+    @_handle_exception(bool, ok_log_level=logging.INFO)
+    def add_user_id(self, user_id: int, /, permission: int = 0, *, note: str = "") -> bool:
+        """
+        将user_id添加到表user_id_{fname}
+
+        Args:
+            user_id (int): 用户的user_id
+            permission (int, optional): 权限级别. Defaults to 0.
+            note (str, optional): 备注. Defaults to ''.
+
+        Returns:
+            bool: True成功 False失败
+        """
+
+        if not user_id:
+            raise ValueError("user_id为空")
+
+        table = self._table("user_id")
+        self._store.conn.execute(
+            f'REPLACE INTO "{table}" VALUES (?,?,?,CURRENT_TIMESTAMP)', (user_id, permission, note)
+        )
+        return True
+
+    @_handle_exception(bool, ok_log_level=logging.INFO)
+    def del_user_id(self, user_id: int) -> bool:
+        """
+        从表user_id_{fname}中删除user_id
+
+        Args:
+            user_id (int): 用户的user_id
+
+        Returns:
+            bool: True成功 False失败
+        """
+
+        table = self._table("user_id")
+        self._store.conn.execute(f'DELETE FROM "{table}" WHERE user_id=?', (user_id,))
+        return True
+
+    @_handle_exception(int)
+    def get_user_id(self, user_id: int) -> int:
+        """
+        获取表user_id_{fname}中user_id的权限级别
+
+        Args:
+            user_id (int): 用户的user_id
+
+        Returns:
+            int: 权限级别
+        """
+
+        table = self._table("user_id")
+        if res := self._store.conn.execute(f'SELECT permission FROM "{table}" WHERE user_id=?', (user_id,)).fetchone():
+            return res[0]
+        return 0
+
+    @staticmethod
+    def _default_user_id_full() -> tuple[int, str, datetime.datetime]:
+        return (0, "", datetime.datetime(1970, 1, 1))
+
+    @_handle_exception(_default_user_id_full)
+    def get_user_id_full(self, user_id: int) -> tuple[int, str, datetime.datetime]:
+        """
+        获取表user_id_{fname}中user_id的完整信息
+
+        Args:
+            user_id (int): 用户的user_id
+
+        Returns:
+            tuple[int, str, datetime.datetime]: 权限级别, 备注, 记录时间
+        """
+
+        table = self._table("user_id")
+        res = self._store.conn.execute(
+            f'SELECT permission,note,record_time FROM "{table}" WHERE user_id=?', (user_id,)
+        ).fetchone()
+        if res:
+            permission, note, record_time = res
+            return permission, note, datetime.datetime.fromisoformat(record_time)
+        return self._default_user_id_full()
+
+    @_handle_exception(list)
+    def get_user_id_list(
+        self,
+        lower_permission: int = 0,
+        upper_permission: int = 50,
+        *,
+        limit: int = 1,
+        offset: int = 0,
+    ) -> list[int]:
+        """
+        获取表user_id_{fname}中user_id的列表
+
+        Args:
+            lower_permission (int, optional): 获取所有权限级别大于等于lower_permission的user_id. Defaults to 0.
+            upper_permission (int, optional): 获取所有权限级别小于等于upper_permission的user_id. Defaults to 50.
+            limit (int, optional): 返回数量限制. Defaults to 1.
+            offset (int, optional): 偏移. Defaults to 0.
+
+        Returns:
+            list[int]: user_id列表
+        """
+
+        table = self._table("user_id")
+        cursor = self._store.conn.execute(
+            f'SELECT user_id FROM "{table}" WHERE permission>=? AND permission<=? '
+            "ORDER BY record_time DESC, rowid DESC LIMIT ? OFFSET ?",
+            (lower_permission, upper_permission, limit, offset),
+        )
+        return [row[0] for row in cursor]
+
+    @_handle_exception(bool, ok_log_level=logging.INFO)
+    def add_imghash(self, img_hash: int, raw_hash: str = "", /, permission: int = 0, *, note: str = "") -> bool:
+        """
+        将img_hash添加到表imghash_{fname}
+
+        Args:
+            img_hash (int): 图像的ahash
+            raw_hash (str): 贴吧图床hash. Defaults to ''.
+            permission (int, optional): 封锁级别. Defaults to 0.
+            note (str, optional): 备注. Defaults to ''.
+
+        Returns:
+            bool: True成功 False失败
+        """
+
+        if not img_hash:
+            raise ValueError("img_hash为空")
+
+        table = self._table("imghash")
+        self._store.conn.execute(
+            f'REPLACE INTO "{table}" VALUES (?,?,?,?,CURRENT_TIMESTAMP)',
+            (_to_signed64(img_hash), raw_hash, permission, note),
+        )
+        return True
+
+    @_handle_exception(bool, ok_log_level=logging.INFO)
+    def del_imghash(self, img_hash: int) -> bool:
+        """
+        从表imghash_{fname}中删除img_hash
+
+        Args:
+            img_hash (int): 图像的ahash
+
+        Returns:
+            bool: True成功 False失败
+        """
+
+        table = self._table("imghash")
+        self._store.conn.execute(f'DELETE FROM "{table}" WHERE img_hash=?', (_to_signed64(img_hash),))
+        return True
+
+    @_handle_exception(int)
+    def get_imghash(self, img_hash: int, *, hamming_dist: int = 0) -> int:
+        """
+        获取表imghash_{fname}中img_hash的封锁级别
+
+        Args:
+            img_hash (int): 图像的ahash
+            hamming_dist (int): 匹配的最大海明距离 默认为0 即要求图像ahash完全一致
+
+        Returns:
+            int: 封锁级别 有多条匹配时取最高的级别
+        """
+
+        return self._query_imghash(img_hash, hamming_dist)[0]
+
+    @staticmethod
+    def _default_imghash_full() -> tuple[int, str]:
+        return (0, "")
+
+    @_handle_exception(_default_imghash_full)
+    def get_imghash_full(self, img_hash: int, *, hamming_dist: int = 0) -> tuple[int, str]:
+        """
+        获取表imghash_{fname}中img_hash的完整信息
+
+        Args:
+            img_hash (int): 图像的ahash
+            hamming_dist (int): 匹配的最大海明距离 默认为0 即要求图像ahash完全一致
+
+        Returns:
+            tuple[int, str]: 封锁级别, 备注 有多条匹配时取级别最高的一条
+        """
+
+        return self._query_imghash(img_hash, hamming_dist)
+
+    def _query_imghash(self, img_hash: int, hamming_dist: int) -> tuple[int, str]:
+        table = self._table("imghash")
+        img_hash = _to_signed64(img_hash)
+        if hamming_dist > 0:
+            res = self._store.conn.execute(
+                f'SELECT permission,note FROM "{table}" WHERE hamming(img_hash, ?)<=? ORDER BY permission DESC LIMIT 1',
+                (img_hash, hamming_dist),
+            ).fetchone()
+        else:
+            res = self._store.conn.execute(
+                f'SELECT permission,note FROM "{table}" WHERE img_hash=?', (img_hash,)
+            ).fetchone()
+        return res or self._default_imghash_full()
+
+
+def _to_signed64(value: int) -> int:
+    # SQLite的INTEGER为64位有符号整数
+    return value - (1 << 64) if value >= 1 << 63 else value
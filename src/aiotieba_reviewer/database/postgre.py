@@ -11,6 +11,7 @@ import asyncpg.prepared_stmt
 from aiotieba import get_logger
 
 from ..config import DB_CONFIG
+from ..tracing import span
 
 
 def _handle_exception(
@@ -30,6 +31,8 @@ def _handle_exception(
     """
 
     def wrapper(func):
+        span_name = f"postgres.{func.__name__}"
+
         async def awrapper(self: PostgreDB, *args, **kwargs):
             def _log(log_level: int, err: Exception | None = None) -> None:
                 logger = get_logger()
@@ -41,7 +44,8 @@ def _handle_exception(
                     logger.handle(record)
 
             try:
-                ret = await func(self, *args, **kwargs)
+                with span(span_name):
+                    ret = await func(self, *args, **kwargs)
 
                 if ok_log_level:
                     _log(ok_log_level)
@@ -72,6 +76,11 @@ def _handle_exception(
     return wrapper
 
 
+def _to_signed64(value: int) -> int:
+    # 64位的ahash以BIGINT保存 需要转换为有符号整数
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
 class PostgreDB:
     """
     PostgreSQL交互
@@ -106,6 +115,24 @@ class PostgreDB:
         if self._pool is not None:
             await self._pool.close()
 
+    def fork(self, fname: str) -> PostgreDB:
+        """
+        创建一个共享连接池的实例
+
+        Args:
+            fname (str): 新实例操作的目标贴吧名
+
+        Returns:
+            PostgreDB
+
+        Note:
+            连接池的生命周期由原实例管理 不应对返回的实例调用`__aexit__`
+        """
+
+        db = PostgreDB(fname)
+        db._pool = self._pool
+        return db
+
     async def _create_pool(self) -> None:
         """
         创建连接池
@@ -382,3 +409,111 @@ class PostgreDB:
 
         res = [record["user_id"] for record in records]
         return res
+
+    @_handle_exception(lambda _: None, bool, ok_log_level=logging.INFO)
+    async def create_table_imghash(self) -> bool:
+        """
+        创建表imghash_{fname}
+        """
+
+        async with self._pool.acquire() as conn:
+            await conn.execute(
+                f"""CREATE TABLE IF NOT EXISTS "imghash_{self.fname}\""""
+                "(img_hash BIGINT PRIMARY KEY, raw_hash VARCHAR(40) NOT NULL DEFAULT '', permission SMALLINT NOT NULL DEFAULT 0, note VARCHAR(64) NOT NULL DEFAULT '', record_time TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP);"
+                f"CREATE INDEX imghash_{self.fname}_permission ON imghash_{self.fname}(permission);"
+            )
+
+        return True
+
+    @_handle_exception(create_table_imghash, bool, ok_log_level=logging.INFO)
+    async def add_imghash(self, img_hash: int, raw_hash: str = "", /, permission: int = 0, *, note: str = "") -> bool:
+        """
+        将img_hash添加到表imghash_{fname}
+
+        Args:
+            img_hash (int): 图像的ahash
+            raw_hash (str): 贴吧图床hash. Defaults to ''.
+            permission (int, optional): 封锁级别. Defaults to 0.
+            note (str, optional): 备注. Defaults to ''.
+
+        Returns:
+            bool: True成功 False失败
+        """
+
+        if not img_hash:
+            raise ValueError("img_hash为空")
+
+        async with self._pool.acquire() as conn:
+            await conn.execute(
+                f"""INSERT INTO "imghash_{self.fname}" VALUES ($1,$2,$3,$4,DEFAULT)"""
+                "ON CONFLICT (img_hash) DO UPDATE SET (raw_hash,permission,note,record_time)=(EXCLUDED.raw_hash,EXCLUDED.permission,EXCLUDED.note,EXCLUDED.record_time)",
+                _to_signed64(img_hash),
+                raw_hash,
+                permission,
+                note,
+            )
+
+        return True
+
+    @_handle_exception(create_table_imghash, bool, ok_log_level=logging.INFO)
+    async def del_imghash(self, img_hash: int) -> bool:
+        """
+        从表imghash_{fname}中删除img_hash
+
+        Args:
+            img_hash (int): 图像的ahash
+
+        Returns:
+            bool: True成功 False失败
+        """
+
+        async with self._pool.acquire() as conn:
+            await conn.execute(f"""DELETE FROM "imghash_{self.fname}" WHERE img_hash=$1""", _to_signed64(img_hash))
+
+        return True
+
+    @_handle_exception(create_table_imghash, int)
+    async def get_imghash(self, img_hash: int, *, hamming_dist: int = 0) -> int:
+        """
+        获取表imghash_{fname}中img_hash的封锁级别
+
+        Args:
+            img_hash (int): 图像的ahash
+            hamming_dist (int): 匹配的最大海明距离 默认为0 即要求图像ahash完全一致
+
+        Returns:
+            int: 封锁级别 有多条匹配时取最高的级别
+        """
+
+        return (await self.get_imghash_full(img_hash, hamming_dist=hamming_dist))[0]
+
+    @staticmethod
+    def _default_imghash_full() -> tuple[int, str]:
+        return (0, "")
+
+    @_handle_exception(create_table_imghash, _default_imghash_full)
+    async def get_imghash_full(self, img_hash: int, *, hamming_dist: int = 0) -> tuple[int, str]:
+        """
+        获取表imghash_{fname}中img_hash的完整信息
+
+        Args:
+            img_hash (int): 图像的ahash
+            hamming_dist (int): 匹配的最大海明距离 默认为0 即要求图像ahash完全一致
+
+        Returns:
+            tuple[int, str]: 封锁级别, 备注 有多条匹配时取级别最高的一条
+        """
+
+        async with self._pool.acquire() as conn:
+            if hamming_dist > 0:
+                stmt = await conn.prepare(
+                    f"""SELECT permission,note FROM "imghash_{self.fname}" WHERE bit_count((img_hash # $1)::bit(64))<=$2 ORDER BY permission DESC LIMIT 1"""
+                )
+                res = await stmt.fetchrow(_to_signed64(img_hash), hamming_dist)
+            else:
+                stmt = await conn.prepare(f"""SELECT permission,note FROM "imghash_{self.fname}" WHERE img_hash=$1""")
+                res = await stmt.fetchrow(_to_signed64(img_hash))
+            if res:
+                return tuple(res)
+
+        return self._default_imghash_full()
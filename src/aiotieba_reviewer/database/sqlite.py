@@ -8,6 +8,8 @@ from typing import Any
 
 from aiotieba import get_logger
 
+from ..tracing import span
+
 
 def handle_exception(
     null_factory: Callable[[], Any],
@@ -24,6 +26,8 @@ def handle_exception(
     """
 
     def wrapper(func):
+        span_name = f"sqlite.{func.__name__}"
+
         def inner(self, *args, **kwargs):
             def _log(log_level: int, err: Exception | None = None) -> None:
                 logger = get_logger()
@@ -35,7 +39,8 @@ def handle_exception(
                     logger.handle(record)
 
             try:
-                ret = func(self, *args, **kwargs)
+                with span(span_name):
+                    ret = func(self, *args, **kwargs)
 
                 if ok_log_level:
                     _log(ok_log_level)
@@ -62,6 +67,7 @@ class SQLiteDB:
 
     Args:
         fname (str): 操作的目标贴吧名. Defaults to ''.
+        path (str | Path, optional): 数据库文件路径. Defaults to None即.cache/{fname}.sqlite.
 
     Attributes:
         fname (str): 操作的目标贴吧名
@@ -73,9 +79,9 @@ class SQLiteDB:
 
     __slots__ = ["fname", "_conn"]
 
-    def __init__(self, fname: str = "") -> None:
+    def __init__(self, fname: str = "", path: str | Path | None = None) -> None:
         self.fname = fname
-        db_path = Path(f".cache/{self.fname}.sqlite")
+        db_path = Path(f".cache/{self.fname}.sqlite" if path is None else path)
         need_init = False
 
         if not db_path.exists():
@@ -149,6 +155,58 @@ class SQLiteDB:
             return res_tuple[0]
         return None
 
+    def create_table_punish(self) -> None:
+        """
+        创建表punish_{fname}
+        """
+
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS `punish_{self.fname}` \
+            (`id` INTEGER PRIMARY KEY AUTOINCREMENT, `payload` TEXT NOT NULL)",
+        )
+
+    @handle_exception(int)
+    def add_punish_job(self, payload: str) -> int:
+        """
+        将待执行的吧务写操作添加到表punish_{fname}
+
+        Args:
+            payload (str): 序列化后的操作
+
+        Returns:
+            int: 记录id 0表示失败
+        """
+
+        cursor = self._conn.execute(f"INSERT INTO `punish_{self.fname}` (`payload`) VALUES (?)", (payload,))
+        return cursor.lastrowid
+
+    @handle_exception(bool)
+    def del_punish_job(self, row_id: int) -> bool:
+        """
+        从表punish_{fname}中删除记录
+
+        Args:
+            row_id (int): 记录id
+
+        Returns:
+            bool: True成功 False失败
+        """
+
+        self._conn.execute(f"DELETE FROM `punish_{self.fname}` WHERE `id`={row_id}")
+        return True
+
+    @handle_exception(list)
+    def get_punish_jobs(self) -> list[tuple[int, str]]:
+        """
+        获取表punish_{fname}中所有未完成的操作
+
+        Returns:
+            list[tuple[int, str]]: 记录id, 序列化后的操作
+        """
+
+        cursor = self._conn.execute(f"SELECT `id`,`payload` FROM `punish_{self.fname}` ORDER BY `id`")
+        return cursor.fetchall()
+
     @handle_exception(bool, ok_log_level=logging.INFO)
     def truncate(self, day: int) -> bool:
         """
@@ -0,0 +1,365 @@
+from __future__ import annotations
+
+import re
+import time
+import unicodedata
+from collections import deque
+from typing import NamedTuple
+
+import numpy as np
+
+from .metrics import MetricFamily, add_collector
+from .typing import TypeObj
+
+_STRIP = re.compile(r"[\W_]+")
+
+
+def normalize(text: str) -> str:
+    """
+    规范化文本 使插入空白与标点 全半角与大小写变化不影响签名
+
+    Args:
+        text (str)
+
+    Returns:
+        str: 经过NFKC与大小写折叠 且去除了空白与标点的文本
+    """
+
+    return _STRIP.sub("", unicodedata.normalize("NFKC", text).casefold())
+
+
+class NearDupStat(NamedTuple):
+    """
+    近似副本的统计
+
+    Attributes:
+        copies (int): 时间窗口内的近似副本数 不含查询对象自身
+        users (int): 发布这些副本的不同用户数
+        first_seen (float): 最早一个副本的时间戳 没有副本时为0.0
+    """
+
+    copies: int
+    users: int
+    first_seen: float
+
+
+_EMPTY = NearDupStat(0, 0, 0.0)
+
+
+class NearDupIndex:
+    """
+    基于MinHash与LSH分段查找的近似重复文本索引
+
+    文本被切分为ngram分片 以num_perm个哈希函数下各自的最小值作为签名
+    两个签名在某一位置相等的概率等于两段文本分片集合的Jaccard相似度
+    签名每rows个值为一段 各段维护一个从段值到条目的桶 查询只需校验与查询签名共享某一段的条目
+    候选条目的签名相等比例不低于threshold时被计为近似副本
+
+    条目按加入顺序保存 超出时间窗口或条目上限的最早条目被逐出 内存占用因此有界
+
+    Args:
+        window (float, optional): 时间窗口 以秒为单位. Defaults to 3600.0.
+        max_entries (int, optional): 条目上限 每个条目约占1.5KiB. Defaults to 50000.
+        threshold (float, optional): 视为近似副本的最小Jaccard相似度. Defaults to 0.5.
+        min_length (int, optional): 规范化后短于该长度的文本不参与索引与查询. Defaults to 10.
+        ngram (int, optional): 分片长度. Defaults to 2.
+        num_perm (int, optional): 签名长度. Defaults to 64.
+        rows (int, optional): 每段的签名值个数. Defaults to 4.
+
+    Attributes:
+        added (int): 加入过的条目数
+        queries (int): 查询次数
+        evicted (int): 被逐出的条目数
+
+    Note:
+        以对象的pid去重 同一对象被多次观察时只计入一次
+        分片的哈希使用内置的hash 签名因此只在同一进程内可比较
+    """
+
+    __slots__ = [
+        "window",
+        "max_entries",
+        "threshold",
+        "min_length",
+        "ngram",
+        "num_perm",
+        "rows",
+        "added",
+        "queries",
+        "evicted",
+        "_a",
+        "_b",
+        "_buckets",
+        "_entries",
+        "_keys",
+    ]
+
+    def __init__(
+        self,
+        window: float = 3600.0,
+        max_entries: int = 50000,
+        threshold: float = 0.5,
+        min_length: int = 10,
+        ngram: int = 2,
+        num_perm: int = 64,
+        rows: int = 4,
+    ) -> None:
+        self.window = window
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.min_length = min_length
+        self.ngram = ngram
+        self.num_perm = num_perm
+        self.rows = rows
+
+        self.added = 0
+        self.queries = 0
+        self.evicted = 0
+
+        # 乘移位哈希 (a*x+b)>>32 其中a为奇数
+        rng = np.random.default_rng(0x5EED)
+        self._a = rng.integers(1, 1 << 63, num_perm, dtype=np.uint64) | np.uint64(1)
+        self._b = rng.integers(0, 1 << 63, num_perm, dtype=np.uint64)
+        # 条目为(时间戳, 签名, user_id, pid) 签名以bytes保存
+        # 绝大多数桶只有一个条目 此时直接保存条目而不是列表
+        self._buckets: list[dict[int, tuple | list[tuple]]] = [{} for _ in range(num_perm // rows)]
+        self._entries: deque[tuple] = deque()
+        self._keys: set[int] = set()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def signature(self, text: str) -> bytes | None:
+        """
+        计算文本的MinHash签名
+
+        Args:
+            text (str)
+
+        Returns:
+            bytes | None: num_perm个uint32 文本过短时为None
+        """
+
+        text = normalize(text)
+        if len(text) < self.min_length:
+            return None
+
+        ngram = self.ngram
+        grams = {text[i : i + ngram] for i in range(len(text) - ngram + 1)}
+        hashes = np.fromiter((hash(g) & 0xFFFFFFFF for g in grams), dtype=np.uint64, count=len(grams))
+        # 乘法按模2**64回绕 取高32位
+        sig = ((hashes[:, None] * self._a + self._b) >> np.uint64(32)).min(axis=0)
+        return sig.astype(np.uint32).tobytes()
+
+    def _band_keys(self, sig: bytes) -> list[int]:
+        width = 4 * self.rows
+        return [hash(sig[i : i + width]) for i in range(0, width * len(self._buckets), width)]
+
+    def _evict(self) -> None:
+        entry = self._entries.popleft()
+        # 条目按加入顺序进入各个桶 因此最早的条目总在桶的最左端
+        for buckets, key in zip(self._buckets, self._band_keys(entry[1]), strict=True):
+            bucket = buckets[key]
+            if bucket.__class__ is tuple or len(bucket) == 2:
+                del buckets[key]
+                if bucket.__class__ is list:
+                    buckets[key] = bucket[1]
+            else:
+                del bucket[0]
+        self._keys.discard(entry[3])
+        self.evicted += 1
+
+    def _expire(self, now: float) -> None:
+        entries = self._entries
+        cutoff = now - self.window
+        while entries and (entries[0][0] < cutoff or len(entries) > self.max_entries):
+            self._evict()
+
+    def add_signature(self, sig: bytes, user_id: int, pid: int, ts: float | None = None) -> None:
+        """
+        加入一个已计算的签名
+
+        Args:
+            sig (bytes): 签名
+            user_id (int): 发布者的user_id
+            pid (int): 对象的pid 用于去重
+            ts (float, optional): 时间戳. Defaults to None即当前时间.
+        """
+
+        if pid in self._keys:
+            return
+        now = time.time()
+        entry = (now if ts is None else ts, sig, user_id, pid)
+        self._entries.append(entry)
+        self._keys.add(pid)
+        for buckets, key in zip(self._buckets, self._band_keys(sig), strict=True):
+            if (bucket := buckets.get(key)) is None:
+                buckets[key] = entry
+            elif bucket.__class__ is tuple:
+                buckets[key] = [bucket, entry]
+            else:
+                bucket.append(entry)
+        self.added += 1
+        self._expire(now)
+
+    def query_signature(self, sig: bytes, within: float | None = None, exclude: int = 0) -> NearDupStat:
+        """
+        查询签名的近似副本
+
+        Args:
+            sig (bytes): 签名
+            within (float, optional): 只统计最近within秒内的副本. Defaults to None即整个时间窗口.
+            exclude (int, optional): 不计入统计的pid. Defaults to 0.
+
+        Returns:
+            NearDupStat
+        """
+
+        self.queries += 1
+        now = time.time()
+        since = now - (self.window if within is None else min(within, self.window))
+
+        candidates = {}
+        for buckets, key in zip(self._buckets, self._band_keys(sig), strict=True):
+            if (bucket := buckets.get(key)) is None:
+                continue
+            if bucket.__class__ is tuple:
+                bucket = (bucket,)
+            for entry in bucket:
+                if entry[0] >= since and entry[3] != exclude:
+                    candidates[entry[3]] = entry
+        if not candidates:
+            return _EMPTY
+
+        # 批量校验候选条目的签名相等比例
+        entries = list(candidates.values())
+        others = np.frombuffer(b"".join(e[1] for e in entries), dtype=np.uint32).reshape(len(entries), -1)
+        equal = np.count_nonzero(others == np.frombuffer(sig, dtype=np.uint32), axis=1)
+        matched = [e for e, n in zip(entries, equal.tolist(), strict=True) if n >= self.threshold * self.num_perm]
+        if not matched:
+            return _EMPTY
+        return NearDupStat(len(matched), len({e[2] for e in matched}), min(e[0] for e in matched))
+
+    def observe_text(self, text: str, user_id: int, pid: int, within: float | None = None) -> NearDupStat:
+        """
+        查询文本的近似副本 然后将其加入索引
+
+        Args:
+            text (str)
+            user_id (int): 发布者的user_id
+            pid (int): 对象的pid 用于去重
+            within (float, optional): 只统计最近within秒内的副本. Defaults to None即整个时间窗口.
+
+        Returns:
+            NearDupStat: 不含pid对应的对象自身 文本过短时为空统计
+        """
+
+        if (sig := self.signature(text)) is None:
+            return _EMPTY
+        stat = self.query_signature(sig, within, pid)
+        self.add_signature(sig, user_id, pid)
+        return stat
+
+    def observe(self, obj: TypeObj, within: float | None = None) -> NearDupStat:
+        """
+        查询对象文本的近似副本 然后将其加入索引
+
+        Args:
+            obj (TypeObj): 主题帖 回复或楼中楼
+            within (float, optional): 只统计最近within秒内的副本. Defaults to None即整个时间窗口.
+
+        Returns:
+            NearDupStat: 不含对象自身 文本过短时为空统计
+
+        Note:
+            时间戳取观察到对象的时刻而非其发布时间 回放历史数据时窗口因此仍然有效
+        """
+
+        return self.observe_text(obj.text, obj.author_id, obj.pid, within)
+
+    def query(self, text: str, within: float | None = None) -> NearDupStat:
+        """
+        查询文本的近似副本 不修改索引
+
+        Args:
+            text (str)
+            within (float, optional): 只统计最近within秒内的副本. Defaults to None即整个时间窗口.
+
+        Returns:
+            NearDupStat
+        """
+
+        if (sig := self.signature(text)) is None:
+            return _EMPTY
+        return self.query_signature(sig, within)
+
+    def collect(self) -> list[MetricFamily]:
+        """
+        以指标的形式输出索引的规模与吞吐
+
+        Returns:
+            list[MetricFamily]
+        """
+
+        return [
+            MetricFamily("neardup_entries", "gauge", "Entries in the near-duplicate index", [("", {}, len(self))]),
+            MetricFamily(
+                "neardup_ops_total",
+                "counter",
+                "Near-duplicate index operations",
+                [
+                    ("", {"op": "add"}, self.added),
+                    ("", {"op": "query"}, self.queries),
+                    ("", {"op": "evict"}, self.evicted),
+                ],
+            ),
+        ]
+
+
+_index = NearDupIndex()
+
+
+def _collect() -> list[MetricFamily]:
+    return _index.collect()
+
+
+add_collector(_collect)
+
+
+def get_neardup_index() -> NearDupIndex:
+    """
+    获取全局的近似重复文本索引
+
+    Returns:
+        NearDupIndex
+
+    Note:
+        可在检查函数与过滤器中调用`get_neardup_index().observe(obj)`
+        所有吧共用同一个索引 跨吧的刷屏因此也能被发现
+    """
+
+    return _index
+
+
+def enable_neardup_index(
+    window: float = 3600.0,
+    max_entries: int = 50000,
+    threshold: float = 0.5,
+    min_length: int = 10,
+) -> NearDupIndex:
+    """
+    以指定参数重建全局的近似重复文本索引 已索引的条目被丢弃
+
+    Args:
+        window (float, optional): 时间窗口 以秒为单位. Defaults to 3600.0.
+        max_entries (int, optional): 条目上限 每个条目约占1.5KiB. Defaults to 50000.
+        threshold (float, optional): 视为近似副本的最小Jaccard相似度. Defaults to 0.5.
+        min_length (int, optional): 规范化后短于该长度的文本不参与索引与查询. Defaults to 10.
+
+    Returns:
+        NearDupIndex
+    """
+
+    global _index
+    _index = NearDupIndex(window, max_entries, threshold, min_length)
+    return _index
@@ -1,47 +1,43 @@
 from __future__ import annotations
 
 import asyncio
+import functools
 from collections.abc import Awaitable, Callable
 
-import aiotieba as tb
 from aiotieba import get_logger as LOG
 
+from . import metrics
 from .client import get_client, get_fname
 from .enums import Ops
 from .punish import Punish
+from .punish_queue import DEADLINES, execute_job, get_punish_aggregator, get_punish_queue, jobs_from_punish
+from .scheduler import get_retry_scheduler
 
 TypePunishExecutor = Callable[[Punish], Awaitable[Punish | None]]
 
 
-async def default_punish_executor(punish: Punish) -> Punish | None:
-    if day := punish.day:
-        client = await get_client()
-        ret = await client.block(get_fname(), punish.obj.user.portrait, day=day, reason=punish.note)
-        if isinstance(ret.err, tb.exception.TiebaServerError):
-            if ret.err.code == 1211068:
-                await client.unblock(get_fname(), punish.obj.user.user_id)
-                await asyncio.sleep(1.5)
-                await client.block(get_fname(), punish.obj.user.portrait, day=day, reason=punish.note)
-            elif ret.err.code == 3150003:
-                await client.block(get_fname(), punish.obj.user.portrait, day=10, reason=punish.note)
+def _transit(punish: Punish) -> Punish | None:
+    """
+    计算处罚在执行后需要向上层传递的部分
+
+    Args:
+        punish (Punish)
+
+    Returns:
+        Punish | None: None表示无需向上层传递
+    """
 
     op = punish.op
     if op == Ops.NORMAL:
         return
     if op == Ops.DELETE:
-        LOG().info(f"Del {punish.obj}. note={punish.note}")
         op &= ~Ops.DELETE
         punish.op = op
         punish.day = 0
-        client = await get_client()
-        await client.del_post(punish.obj.fid, punish.obj.tid, punish.obj.pid)
         return punish
     if op == Ops.PENDING:
         return punish
     if op == Ops.HIDE:
-        LOG().info(f"Hide {punish.obj}. note={punish.note}")
-        client = await get_client()
-        await client.hide_thread(get_fname(), punish.obj.tid)
         return
     if op & Ops.PARENT == Ops.PARENT:
         op &= ~Ops.PARENT
@@ -54,33 +50,55 @@ async def default_punish_executor(punish: Punish) -> Punish | None:
         return punish
 
 
+async def default_punish_executor(punish: Punish) -> Punish | None:
+    metrics.count_punish(punish)
+
+    if (aggregator := get_punish_aggregator()) is not None:
+        for job in jobs_from_punish(punish):
+            aggregator.add(job)
+        return _transit(punish)
+
+    if (queue := get_punish_queue()) is not None:
+        queue.put_punish(punish)
+        return _transit(punish)
+
+    block = None
+    for job in jobs_from_punish(punish):
+        if job.kind == "block":
+            # 封禁及其补救操作由调度器执行 与删帖同时进行 审查流程被取消时也不会中断
+            block = get_retry_scheduler().submit(
+                "block", functools.partial(execute_job, job), deadline=DEADLINES["block"]
+            )
+
+    op = punish.op
+    if op == Ops.DELETE:
+        LOG().info(f"Del {punish.obj}. note={punish.note}")
+        client = await get_client()
+        await client.del_post(punish.obj.fid, punish.obj.tid, punish.obj.pid)
+    elif op == Ops.HIDE:
+        LOG().info(f"Hide {punish.obj}. note={punish.note}")
+        client = await get_client()
+        await client.hide_thread(get_fname(), punish.obj.tid)
+
+    if block is not None:
+        await asyncio.shield(block)
+
+    return _transit(punish)
+
+
 async def default_punish_executor_test(punish: Punish) -> Punish | None:
+    metrics.count_punish(punish)
+
     if day := punish.day:
         LOG().info(f"Block. user={punish.obj.user!r} day={day} note={punish.note}")
 
     op = punish.op
-    if op == Ops.NORMAL:
-        return
     if op == Ops.DELETE:
         LOG().info(f"Del {punish.obj}. note={punish.note}")
-        op &= ~Ops.DELETE
-        punish.op = op
-        punish.day = 0
-        return punish
-    if op == Ops.PENDING:
-        return punish
-    if op == Ops.HIDE:
+    elif op == Ops.HIDE:
         LOG().info(f"Hide {punish.obj}. note={punish.note}")
-        return
-    if op & Ops.PARENT == Ops.PARENT:
-        op &= ~Ops.PARENT
-        punish.op = op
-        return punish
-    if op & Ops.GRANDPARENT == Ops.GRANDPARENT:
-        op &= ~Ops.GRANDPARENT
-        op |= Ops.PARENT
-        punish.op = op
-        return punish
+
+    return _transit(punish)
 
 
 punish_executor = default_punish_executor_test
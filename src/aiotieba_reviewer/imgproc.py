@@ -3,6 +3,7 @@ import numpy as np
 from aiotieba import get_logger as LOG
 
 from .client import get_db
+from .tracing import span
 
 _qrdetector = None
 _img_hasher = None
@@ -34,7 +35,8 @@ def decode_QRcode(image: "np.ndarray") -> str:
     """
 
     try:
-        data = qrdetector().detectAndDecode(image)[0]
+        with span("opencv.decode_QRcode"):
+            data = qrdetector().detectAndDecode(image)[0]
     except Exception as err:
         LOG().warning(err)
         data = ""
@@ -54,7 +56,8 @@ def has_QRcode(image: "np.ndarray") -> bool:
     """
 
     try:
-        res = qrdetector().detect(image)[0]
+        with span("opencv.has_QRcode"):
+            res = qrdetector().detect(image)[0]
     except Exception as err:
         LOG().warning(err)
         res = False
@@ -74,7 +77,8 @@ def compute_imghash(image: "np.ndarray") -> int:
     """
 
     try:
-        img_hash_array = img_hasher().compute(image).flatten()
+        with span("opencv.compute_imghash"):
+            img_hash_array = img_hasher().compute(image).flatten()
         img_hash = 0
         for hash_num, shift in zip(img_hash_array, range(56, -1, -8), strict=True):
             img_hash += int(hash_num) << shift
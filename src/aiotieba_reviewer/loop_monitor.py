@@ -0,0 +1,236 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, deque
+from types import CodeType, FrameType
+
+from aiotieba import get_logger as LOG
+
+from .metrics import MetricFamily, add_collector, summary
+from .perf_stat import aperf_stat
+
+
+class BlockEvent:
+    """
+    一次事件循环阻塞
+
+    Attributes:
+        duration (float): 阻塞时长 以秒为单位
+        target (str): 阻塞被归因到的检查函数或过滤器 无法归因时为最内层函数
+        stack (list[str]): 阻塞期间事件循环线程的调用栈 由外到内
+    """
+
+    __slots__ = ["duration", "target", "stack"]
+
+    def __init__(self, duration: float, target: str, stack: list[str]) -> None:
+        self.duration = duration
+        self.target = target
+        self.stack = stack
+
+    def __repr__(self) -> str:
+        return str({"duration": self.duration, "target": self.target})
+
+
+def _checker_codes() -> dict[CodeType, str]:
+    from .reviewer import comment, comments, post, posts, thread, threads
+
+    funcs = [
+        thread.checker.ori_checker,
+        post.checker.ori_checker,
+        comment.checker.ori_checker,
+        *threads.filter._filters,
+        *posts.filter._filters,
+        *comments.filter._filters,
+    ]
+
+    codes = {}
+    for func in funcs:
+        func = getattr(func, "__wrapped__", func)
+        if (code := getattr(func, "__code__", None)) is not None:
+            codes[code] = func.__qualname__
+    return codes
+
+
+def _attribute(frame: FrameType) -> str:
+    codes = _checker_codes()
+
+    code = frame.f_code
+    innermost = f"{os.path.basename(code.co_filename)}:{code.co_qualname}"
+    while frame is not None:
+        if (name := codes.get(frame.f_code)) is not None:
+            return name
+        frame = frame.f_back
+
+    return innermost
+
+
+class LoopMonitor:
+    """
+    事件循环延迟与阻塞监测
+
+    事件循环中的探测协程按固定间隔醒来并记录调度延迟
+    独立的看门狗线程在探测协程超时未醒来时抓取事件循环线程的调用栈 并将阻塞归因到正在执行的检查函数或过滤器
+
+    Args:
+        interval (float, optional): 探测间隔 以秒为单位. Defaults to 0.05.
+        threshold (float, optional): 视为阻塞的调度延迟 以秒为单位. Defaults to 0.1.
+        max_events (int, optional): 保留的最近阻塞事件数. Defaults to 32.
+
+    Attributes:
+        lag (aperf_stat): 调度延迟的分布 total_ns与total_count为累计的延迟与探测次数
+        blocked (Counter[str]): 各归因目标的累计阻塞时长 以秒为单位
+        blocks (Counter[str]): 各归因目标的阻塞次数
+        events (deque[BlockEvent]): 最近的阻塞事件
+    """
+
+    __slots__ = [
+        "interval",
+        "threshold",
+        "lag",
+        "blocked",
+        "blocks",
+        "events",
+        "_heartbeat",
+        "_captured",
+        "_pending",
+        "_thread_id",
+        "_probe_task",
+        "_watchdog",
+        "_stop",
+    ]
+
+    def __init__(self, interval: float = 0.05, threshold: float = 0.1, max_events: int = 32) -> None:
+        self.interval = interval
+        self.threshold = threshold
+
+        self.lag = aperf_stat()
+        self.blocked: Counter[str] = Counter()
+        self.blocks: Counter[str] = Counter()
+        self.events: deque[BlockEvent] = deque(maxlen=max_events)
+
+        self._heartbeat = 0.0
+        self._captured = 0.0
+        self._pending: tuple[float, str, list[str]] | None = None
+        self._thread_id = 0
+        self._probe_task: asyncio.Task | None = None
+        self._watchdog: threading.Thread | None = None
+        self._stop = threading.Event()
+
+    def start(self) -> None:
+        """
+        在当前事件循环中启动监测
+        """
+
+        self._thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic() + self.interval
+        self._stop.clear()
+        self._probe_task = asyncio.create_task(self._probe())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self) -> None:
+        """
+        停止监测
+        """
+
+        self._stop.set()
+        if self._probe_task is not None:
+            self._probe_task.cancel()
+            await asyncio.gather(self._probe_task, return_exceptions=True)
+            self._probe_task = None
+        if self._watchdog is not None:
+            await asyncio.to_thread(self._watchdog.join)
+            self._watchdog = None
+
+    async def _probe(self) -> None:
+        while 1:
+            expected = time.monotonic() + self.interval
+            self._heartbeat = expected
+            await asyncio.sleep(self.interval)
+
+            lag = time.monotonic() - expected
+            self.lag.record(int(max(lag, 0.0) * 1e9))
+            if lag >= self.threshold:
+                self._on_block(expected, lag)
+
+    def _watch(self) -> None:
+        while not self._stop.wait(self.threshold / 2):
+            beat = self._heartbeat
+            if beat == self._captured or time.monotonic() - beat < self.threshold:
+                continue
+
+            self._captured = beat
+            if (frame := sys._current_frames().get(self._thread_id)) is None:
+                continue
+            target = _attribute(frame)
+            stack = [f"{fs.filename}:{fs.lineno} {fs.name}" for fs in traceback.extract_stack(frame)]
+            self._pending = (beat, target, stack)
+
+    def _on_block(self, beat: float, lag: float) -> None:
+        pending = self._pending
+        if pending is not None and pending[0] == beat:
+            _, target, stack = pending
+        else:
+            # 阻塞时长短于看门狗的采样间隔 未能抓到调用栈
+            target, stack = "unknown", []
+        self._pending = None
+
+        self.blocked[target] += lag
+        self.blocks[target] += 1
+        self.events.append(BlockEvent(lag, target, stack))
+
+        LOG().warning(f"Event loop blocked for {lag:.3f}s. target={target}")
+        if stack:
+            LOG().debug("Blocking stack:\n" + "\n".join(stack[-8:]))
+
+    def collect(self) -> list[MetricFamily]:
+        """
+        以指标的形式输出调度延迟与阻塞统计
+
+        Returns:
+            list[MetricFamily]
+        """
+
+        lag = self.lag
+        return [
+            summary(
+                "loop_lag_seconds",
+                "Event loop scheduling lag",
+                [({}, lag, lag.total_ns / 1e9, lag.total_count)],
+            ),
+            MetricFamily(
+                "loop_blocked_seconds_total",
+                "counter",
+                "Time the event loop was blocked by target",
+                [("", {"target": target}, seconds) for target, seconds in self.blocked.items()],
+            ),
+            MetricFamily(
+                "loop_blocks_total",
+                "counter",
+                "Event loop blocks by target",
+                [("", {"target": target}, num) for target, num in self.blocks.items()],
+            ),
+        ]
+
+
+def start_loop_monitor(interval: float = 0.05, threshold: float = 0.1) -> LoopMonitor:
+    """
+    在当前事件循环中启动事件循环延迟与阻塞监测 结果同时出现在指标服务中
+
+    Args:
+        interval (float, optional): 探测间隔 以秒为单位. Defaults to 0.05.
+        threshold (float, optional): 视为阻塞的调度延迟 以秒为单位. Defaults to 0.1.
+
+    Returns:
+        LoopMonitor
+    """
+
+    monitor = LoopMonitor(interval, threshold)
+    monitor.start()
+    add_collector(monitor.collect)
+    return monitor
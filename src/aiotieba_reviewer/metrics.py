@@ -0,0 +1,290 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+from collections import Counter
+from collections.abc import Callable, Iterable, Iterator
+from typing import NamedTuple
+
+from aiotieba import get_logger as LOG
+
+from .enums import Ops
+from .perf_stat import aperf_stat
+from .punish import Punish
+from .rule_stat import op_name
+
+_PREFIX = "aiotieba_reviewer_"
+_QUANTILES = (0.5, 0.9, 0.99)
+
+
+class MetricFamily(NamedTuple):
+    """
+    一组同名指标
+
+    Attributes:
+        name (str): 指标名 不含前缀
+        type (str): counter/gauge/summary
+        help (str): 说明
+        samples (list[tuple[str, dict[str, str], float]]): (后缀, 标签, 值)
+    """
+
+    name: str
+    type: str
+    help: str
+    samples: list[tuple[str, dict[str, str], float]]
+
+
+TypeCollector = Callable[[], Iterable[MetricFamily]]
+
+# 以下计数器由审查流程直接累加 仅在被抓取时才被格式化
+checked: Counter[str] = Counter()
+punished: Counter[tuple[str, bool]] = Counter()
+id_cache: Counter[tuple[str, bool]] = Counter()
+
+_collectors: list[TypeCollector] = []
+
+
+def add_collector(collector: TypeCollector) -> TypeCollector:
+    """
+    注册一个指标收集函数 收集函数仅在被抓取时调用
+
+    Args:
+        collector (TypeCollector)
+
+    Returns:
+        TypeCollector
+    """
+
+    _collectors.append(collector)
+    return collector
+
+
+def remove_collector(collector: TypeCollector) -> None:
+    """
+    移除一个已注册的指标收集函数
+
+    Args:
+        collector (TypeCollector)
+    """
+
+    with contextlib.suppress(ValueError):
+        _collectors.remove(collector)
+
+
+def count_punish(punish: Punish) -> None:
+    """
+    累加一次处罚 仍需向上层传递的处罚不计入
+
+    Args:
+        punish (Punish)
+    """
+
+    op = punish.op
+    if not punish or op & (Ops.PARENT | Ops.GRANDPARENT):
+        return
+    punished[op_name(op), punish.day > 0] += 1
+
+
+def summary(name: str, help_: str, rows: Iterable[tuple[dict[str, str], aperf_stat, float, int]]) -> MetricFamily:
+    """
+    将一组aperf_stat转换为summary 以秒为单位
+
+    Args:
+        name (str): 指标名
+        help_ (str): 说明
+        rows (Iterable[tuple[dict[str, str], aperf_stat, float, int]]): (标签, 统计, 累计耗时, 累计次数) 累计值不应随时间减少
+
+    Returns:
+        MetricFamily
+    """
+
+    samples = []
+    for labels, stat, total, count in rows:
+        samples.extend(("", {**labels, "quantile": str(q)}, stat.quantile(q) / 1e3) for q in _QUANTILES)
+        samples.append(("_sum", labels, total))
+        samples.append(("_count", labels, count))
+    return MetricFamily(name, "summary", help_, samples)
+
+
+def _collect_builtin() -> Iterator[MetricFamily]:
+    from .punish_queue import get_punish_queue
+    from .reviewer import thread, threads
+    from .rule_stat import get_rulebook
+    from .scheduler import get_retry_scheduler
+    from .tracing import get_tracer
+
+    yield MetricFamily(
+        "checked_total",
+        "counter",
+        "Objects produced for checking",
+        [("", {"level": level}, num) for level, num in checked.items()],
+    )
+    yield MetricFamily(
+        "punished_total",
+        "counter",
+        "Punishments passed to the executor",
+        [("", {"op": op, "block": str(block).lower()}, num) for (op, block), num in punished.items()],
+    )
+    yield MetricFamily(
+        "id_cache_total",
+        "counter",
+        "Lookups of the SQLite id cache",
+        [("", {"level": level, "hit": str(hit).lower()}, num) for (level, hit), num in id_cache.items()],
+    )
+
+    # 分位数只覆盖aperf_stat的滑动窗口 sum与count为进程启动以来的累计值
+    yield summary(
+        "cycle_seconds",
+        "Duration of a review cycle",
+        [
+            ({"level": level}, stat, stat.total_ns / 1e9, stat.total_count)
+            for level, stat in (("threads", threads.runner.perf_stat), ("thread", thread.runner.perf_stat))
+        ],
+    )
+
+    rulebook = get_rulebook()
+    yield MetricFamily(
+        "rule_hits_total",
+        "counter",
+        "Punishments produced by each rule",
+        [("", {"rule": rule}, stat.hits) for rule, stat in rulebook.rules.items()],
+    )
+    yield MetricFamily(
+        "checker_seconds_total",
+        "counter",
+        "Time spent in each checker or filter",
+        [("", {"checker": name}, stat.cost_ns / 1e9) for name, stat in rulebook.checkers.items()],
+    )
+
+    tracer = get_tracer()
+    if tracer.enabled:
+        stages = sorted(tracer.stats.items())
+        yield summary(
+            "stage_seconds",
+            "Duration of a traced stage such as client.get_posts or sqlite.get_id",
+            [({"stage": name}, stat.recent, stat.total_ns / 1e9, stat.count) for name, stat in stages],
+        )
+
+    scheduler = get_retry_scheduler()
+    yield MetricFamily(
+        "punish_attempts_total",
+        "counter",
+        "Attempts of punish operations by error code",
+        [("", {"op": op, "code": str(code)}, num) for (op, code), num in scheduler.outcomes.items()],
+    )
+    yield MetricFamily(
+        "punish_expired_total", "counter", "Operations given up after deadline", [("", {}, scheduler.expired)]
+    )
+
+    if (queue := get_punish_queue()) is not None:
+        yield MetricFamily("punish_queue_pending", "gauge", "Jobs waiting in the punish queue", [("", {}, len(queue))])
+        yield MetricFamily(
+            "punish_queue_jobs_total",
+            "counter",
+            "Finished punish queue jobs",
+            [
+                ("", {"result": "succeeded"}, queue.succeeded),
+                ("", {"result": "failed"}, queue.failed),
+                ("", {"result": "retried"}, queue.retried),
+            ],
+        )
+
+
+_collectors.append(_collect_builtin)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def render() -> str:
+    """
+    以Prometheus文本格式输出所有指标
+
+    Returns:
+        str
+    """
+
+    lines = []
+    for collector in _collectors:
+        try:
+            families = list(collector())
+        except Exception as err:
+            LOG().warning(f"Metrics collector failed. err={err!r}")
+            continue
+
+        for family in families:
+            if not family.samples:
+                continue
+            name = _PREFIX + family.name
+            lines.append(f"# HELP {name} {family.help}")
+            lines.append(f"# TYPE {name} {family.type}")
+            for suffix, labels, value in family.samples:
+                if labels:
+                    label_str = ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+                    lines.append(f"{name}{suffix}{{{label_str}}} {value}")
+                else:
+                    lines.append(f"{name}{suffix} {value}")
+
+    lines.append("")
+    return "\n".join(lines)
+
+
+async def _handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), 5.0)
+        while (await asyncio.wait_for(reader.readline(), 5.0)) not in (b"\r\n", b"\n", b""):
+            pass
+
+        parts = request_line.split()
+        if len(parts) >= 2 and parts[0] == b"GET" and parts[1].split(b"?")[0] in (b"/", b"/metrics"):
+            status = "200 OK"
+            body = render().encode()
+        else:
+            status = "404 Not Found"
+            body = b""
+
+        writer.write(
+            f"HTTP/1.1 {status}\r\n"
+            "Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Connection: close\r\n\r\n".encode()
+            + body
+        )
+        await writer.drain()
+
+    except (TimeoutError, ConnectionError):
+        pass
+
+    finally:
+        writer.close()
+        with contextlib.suppress(ConnectionError):
+            await writer.wait_closed()
+
+
+async def start_metrics_server(host: str = "127.0.0.1", port: int = 9108, trace: bool = False) -> asyncio.Server:
+    """
+    在当前事件循环中启动指标服务 以Prometheus文本格式响应GET /metrics
+
+    Args:
+        host (str, optional): 监听地址. Defaults to "127.0.0.1".
+        port (int, optional): 监听端口. Defaults to 9108.
+        trace (bool, optional): 是否启用分阶段计时以提供API与数据库的延迟指标 启用后每次API调用与数据库操作都会被计时. Defaults to False.
+
+    Returns:
+        asyncio.Server
+
+    Note:
+        须在`set_BDUSS_key`与其他客户端代理启用之后调用
+        指标仅在被抓取时格式化 不启用trace时 无人抓取的开销只有计数器累加
+    """
+
+    if trace:
+        from .tracing import enable_tracing, get_tracer
+
+        if not get_tracer().enabled:
+            enable_tracing(report_interval=0.0)
+
+    server = await asyncio.start_server(_handle, host, port)
+    LOG().info(f"Serving metrics on http://{host}:{port}/metrics")
+    return server
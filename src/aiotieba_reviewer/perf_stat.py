@@ -1,57 +1,313 @@
+import functools
+import inspect
 import time
 from collections import deque
+from collections.abc import Awaitable
+from typing import Any
+
+# 每个2的幂区间被线性细分的格数的对数 相对误差不超过1/2**_SUB_BITS
+_SUB_BITS = 4
+_SUB_COUNT = 1 << _SUB_BITS
+
+
+def _bucket_index(value: int) -> int:
+    if value < _SUB_COUNT:
+        return value
+    exp = value.bit_length() - 1 - _SUB_BITS
+    return ((exp + 1) << _SUB_BITS) | ((value >> exp) & (_SUB_COUNT - 1))
+
+
+def _bucket_value(index: int) -> int:
+    if index < _SUB_COUNT:
+        return index
+    exp = (index >> _SUB_BITS) - 1
+    low = ((index & (_SUB_COUNT - 1)) | _SUB_COUNT) << exp
+    # 取格子的中点
+    return low + ((1 << exp) >> 1)
+
+
+class _Window:
+    __slots__ = ["epoch", "count", "acc", "max", "buckets"]
+
+    def __init__(self, epoch: int) -> None:
+        self.reset(epoch)
+
+    def reset(self, epoch: int) -> None:
+        self.epoch = epoch
+        self.count = 0
+        self.acc = 0
+        self.max = 0
+        self.buckets: dict[int, int] = {}
+
+
+class Histogram:
+    """
+    可合并的耗时直方图
+
+    Args:
+        count (int, optional): 记录数. Defaults to 0.
+        max_ns (int, optional): 最大耗时 单位为纳秒. Defaults to 0.
+        buckets (dict[int, int], optional): 各格子的记录数. Defaults to None.
+
+    Note:
+        可被pickle 多个进程的aperf_stat.histogram()合并后即可得到整体的分位数
+    """
+
+    __slots__ = ["count", "max_ns", "buckets"]
+
+    def __init__(self, count: int = 0, max_ns: int = 0, buckets: dict[int, int] | None = None) -> None:
+        self.count = count
+        self.max_ns = max_ns
+        self.buckets: dict[int, int] = {} if buckets is None else buckets
+
+    def merge(self, other: "Histogram") -> None:
+        """
+        将另一个直方图合并到本直方图
+
+        Args:
+            other (Histogram)
+        """
+
+        self.count += other.count
+        if other.max_ns > self.max_ns:
+            self.max_ns = other.max_ns
+        buckets = self.buckets
+        for idx, num in other.buckets.items():
+            buckets[idx] = buckets.get(idx, 0) + num
+
+    def quantile(self, q: float) -> float:
+        """
+        耗时分位数
+
+        Args:
+            q (float): 分位 取值范围为[0, 1]
+
+        Returns:
+            float: 单位为毫秒 没有记录时返回0.0
+        """
+
+        if not self.count:
+            return 0.0
+
+        rank = q * self.count
+        acc = 0
+        for idx in sorted(self.buckets):
+            acc += self.buckets[idx]
+            if acc >= rank:
+                break
+        return min(_bucket_value(idx), self.max_ns) / 1e6
 
 
 class aperf_stat:
     """
-    异步函数性能统计工具
+    函数性能统计工具
+
+    耗时被记录在对数线性直方图中 内存占用与调用次数无关
+    分位数 最大耗时与调用次数的统计范围为最近num_windows个长度为window秒的时间窗口
 
     Args:
-        perf_rec_maxlen (int, optional): 性能记录队列的最大长度. Defaults to 30.
+        perf_rec_maxlen (int, optional): 计算平均耗时所用的最近调用次数. Defaults to 30.
+        window (float, optional): 单个时间窗口的长度 以秒为单位 仅能以关键字传入. Defaults to 60.0.
+        num_windows (int, optional): 参与统计的时间窗口数 仅能以关键字传入. Defaults to 5.
 
     Attributes:
-        avg_time: 平均耗时 单位为毫秒
+        avg_time: 最近perf_rec_maxlen次调用的平均耗时 单位为毫秒
         last_time: 最后一次运行耗时 单位为毫秒
+        max_time: 最大耗时 单位为毫秒
+        p50 p90 p99: 耗时分位数 单位为毫秒 相对误差不超过1/16
+        count: 统计范围内的调用次数
+        total_count (int): 累计调用次数 不随时间窗口滑动而减少
+        total_ns (int): 累计耗时 单位为纳秒 不随时间窗口滑动而减少
+
+    Note:
+        可用于装饰异步函数 同步函数 生成器与异步生成器 以及返回可等待对象的可调用对象
+        生成器的耗时为其自身执行的总时长 不含调用方在两次迭代之间的耗时
     """
 
     __slots__ = [
+        "window",
+        "_windows",
         "_rec_queue",
         "_acc_time_ns",
         "_last_time_ns",
+        "total_count",
+        "total_ns",
     ]
 
-    def __init__(self, perf_rec_maxlen: int = 30) -> None:
+    def __init__(self, perf_rec_maxlen: int = 30, *, window: float = 60.0, num_windows: int = 5) -> None:
+        self.window = window
+        self._windows = [_Window(-1) for _ in range(num_windows)]
         self._rec_queue = deque(maxlen=perf_rec_maxlen + 1)
         self._acc_time_ns = 0
         self._last_time_ns = 0
+        self.total_count = 0
+        self.total_ns = 0
 
     def __call__(self, func):
-        async def wrapper(*args, **kwargs):
-            start = time.perf_counter_ns()
+        # 生成器的耗时只计其自身执行的部分 send与throw被原样转发
+        if inspect.isasyncgenfunction(func):
 
-            res = await func(*args, **kwargs)
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                agen = func(*args, **kwargs)
+                elapsed = 0
+                value = None
+                exc = None
+                try:
+                    while 1:
+                        start = time.perf_counter_ns()
+                        try:
+                            item = await (agen.asend(value) if exc is None else agen.athrow(exc))
+                        except StopAsyncIteration:
+                            return
+                        finally:
+                            elapsed += time.perf_counter_ns() - start
+                        exc = None
+                        try:
+                            value = yield item
+                        except GeneratorExit:
+                            raise
+                        except BaseException as err:
+                            value = None
+                            exc = err
+                finally:
+                    await agen.aclose()
+                    self.record(elapsed)
 
-            end = time.perf_counter_ns()
-            self._last_time_ns = end - start
-            self._acc_time_ns += self._last_time_ns
-            self._rec_queue.append(self._last_time_ns)
+        elif inspect.isgeneratorfunction(func):
 
-            if len(self._rec_queue) == self._rec_queue.maxlen:
-                remove_rec = self._rec_queue.popleft()
-                self._acc_time_ns -= remove_rec
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                gen = func(*args, **kwargs)
+                elapsed = 0
+                value = None
+                exc = None
+                try:
+                    while 1:
+                        start = time.perf_counter_ns()
+                        try:
+                            item = gen.send(value) if exc is None else gen.throw(exc)
+                        except StopIteration as stop:
+                            return stop.value
+                        finally:
+                            elapsed += time.perf_counter_ns() - start
+                        exc = None
+                        try:
+                            value = yield item
+                        except GeneratorExit:
+                            raise
+                        except BaseException as err:
+                            value = None
+                            exc = err
+                finally:
+                    gen.close()
+                    self.record(elapsed)
 
-            return res
+        elif inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                start = time.perf_counter_ns()
+                res = await func(*args, **kwargs)
+                self.record(time.perf_counter_ns() - start)
+                return res
+
+        else:
+            # __call__为async def的可调用对象等 按返回值是否可等待区分
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter_ns()
+                res = func(*args, **kwargs)
+                if inspect.isawaitable(res):
+                    return self._await(res, start)
+                self.record(time.perf_counter_ns() - start)
+                return res
 
         return wrapper
 
+    async def _await(self, awaitable: Awaitable, start: int) -> Any:
+        res = await awaitable
+        self.record(time.perf_counter_ns() - start)
+        return res
+
+    def _current(self) -> _Window:
+        epoch = int(time.monotonic() // self.window)
+        window = self._windows[epoch % len(self._windows)]
+        if window.epoch != epoch:
+            window.reset(epoch)
+        return window
+
+    def _live_windows(self) -> list[_Window]:
+        oldest = int(time.monotonic() // self.window) - len(self._windows)
+        return [w for w in self._windows if w.count and w.epoch > oldest]
+
+    def record(self, duration_ns: int) -> None:
+        """
+        记录一次耗时
+
+        Args:
+            duration_ns (int): 耗时 单位为纳秒
+        """
+
+        self._last_time_ns = duration_ns
+        self.total_count += 1
+        self.total_ns += duration_ns
+        self._acc_time_ns += duration_ns
+        self._rec_queue.append(duration_ns)
+        if len(self._rec_queue) == self._rec_queue.maxlen:
+            self._acc_time_ns -= self._rec_queue.popleft()
+
+        window = self._current()
+        window.count += 1
+        window.acc += duration_ns
+        if duration_ns > window.max:
+            window.max = duration_ns
+        idx = _bucket_index(duration_ns)
+        window.buckets[idx] = window.buckets.get(idx, 0) + 1
+
+    def quantile(self, q: float) -> float:
+        """
+        耗时分位数
+
+        Args:
+            q (float): 分位 取值范围为[0, 1]
+
+        Returns:
+            float: 单位为毫秒 统计范围内没有记录时返回0.0
+        """
+
+        return self.histogram().quantile(q)
+
+    def histogram(self) -> Histogram:
+        """
+        统计范围内的耗时直方图
+
+        Returns:
+            Histogram
+        """
+
+        hist = Histogram()
+        for w in self._live_windows():
+            hist.merge(Histogram(w.count, w.max, w.buckets))
+        return hist
+
+    @property
+    def count(self) -> int:
+        """
+        统计范围内的调用次数
+        """
+
+        return sum(w.count for w in self._live_windows())
+
     @property
     def avg_time(self) -> float:
         """
-        平均耗时
+        最近perf_rec_maxlen次调用的平均耗时
 
         Note:
             单位为毫秒
         """
+
         if _len := len(self._rec_queue):
             return self._acc_time_ns / (1e6 * _len)
         else:
@@ -67,3 +323,47 @@ class aperf_stat:
         """
 
         return self._last_time_ns / 1e6
+
+    @property
+    def max_time(self) -> float:
+        """
+        最大耗时
+
+        Note:
+            单位为毫秒
+        """
+
+        return max((w.max for w in self._live_windows()), default=0) / 1e6
+
+    @property
+    def p50(self) -> float:
+        """
+        耗时的中位数
+
+        Note:
+            单位为毫秒
+        """
+
+        return self.quantile(0.5)
+
+    @property
+    def p90(self) -> float:
+        """
+        耗时的90分位数
+
+        Note:
+            单位为毫秒
+        """
+
+        return self.quantile(0.9)
+
+    @property
+    def p99(self) -> float:
+        """
+        耗时的99分位数
+
+        Note:
+            单位为毫秒
+        """
+
+        return self.quantile(0.99)
@@ -0,0 +1,52 @@
+from __future__ import annotations
+
+from collections.abc import Callable
+from typing import Any
+
+import aiotieba as tb
+
+
+class ClientProxy:
+    """
+    客户端代理基类
+
+    将属性访问转发给被代理的客户端 子类通过覆写`_wrap`拦截需要的方法
+
+    Args:
+        client (tb.Client): 被代理的客户端 也可以是另一个代理
+    """
+
+    __slots__ = ["_client", "_methods"]
+
+    def __init__(self, client: tb.Client) -> None:
+        self._client = client
+        self._methods: dict[str, Callable] = {}
+
+    def __getattr__(self, name: str) -> Any:
+        if (method := self._methods.get(name)) is not None:
+            return method
+
+        attr = getattr(self._client, name)
+        if name.startswith("_") or not callable(attr):
+            return attr
+
+        method = self._wrap(name, attr)
+        self._methods[name] = method
+        return method
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({self._client!r})"
+
+    def _wrap(self, name: str, method: Callable) -> Callable:
+        """
+        包装被代理客户端的方法
+
+        Args:
+            name (str): 方法名
+            method (Callable): 被代理客户端的绑定方法
+
+        Returns:
+            Callable: 包装后的方法 结果会被缓存 因此每个方法只会被包装一次
+        """
+
+        return method
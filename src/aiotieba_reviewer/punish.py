@@ -1,3 +1,4 @@
+import os
 import sys
 
 from .enums import Ops
@@ -12,27 +13,36 @@ class Punish:
         op (Ops, optional): 删除类型. Defaults to Ops.NORMAL.
         day (int, optional): 封禁天数. Defaults to 0.
         note (str, optional): 处罚理由. Defaults to ''.
+        rule (str, optional): 产生该处罚的规则标识. Defaults to ''即使用"文件名:行号".
     """
 
     __slots__ = [
         "obj",
         "line",
+        "rule",
         "op",
         "day",
         "_note",
         "_raw_note",
     ]
 
-    def __init__(self, obj: TypeObj, op: Ops = Ops.NORMAL, day: int = 0, note: str = ""):
+    def __init__(self, obj: TypeObj, op: Ops = Ops.NORMAL, day: int = 0, note: str = "", *, rule: str = ""):
         self.obj = obj
         self.op = op
         self.day = day
         self._note = None
         if op > Ops.NORMAL:
-            self.line = sys._getframe(1).f_lineno
+            frame = sys._getframe(1)
+            self.line = frame.f_lineno
+            self.rule = rule or f"{os.path.basename(frame.f_code.co_filename)}:{self.line}"
             self._raw_note = note
         else:
             self.line = 0
+            # 仅封禁的处罚同样需要规则标识
+            if day and not rule:
+                frame = sys._getframe(1)
+                rule = f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_lineno}"
+            self.rule = rule
             self._raw_note = ""
 
     def __bool__(self) -> bool:
@@ -0,0 +1,585 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import dataclasses as dcs
+import functools
+import json
+from collections.abc import AsyncGenerator
+from typing import Any
+
+from aiotieba import get_logger as LOG
+
+from .client import get_client, get_db_sqlite, get_fname
+from .database import SQLiteDB
+from .enums import Ops
+from .punish import Punish
+from .ratelimit import get_err_code, is_transient
+from .scheduler import TimerHandle, get_retry_scheduler
+from .typing import Thread
+
+# 各类操作自提交起的截止时间 以秒为单位
+DEADLINES = {"block": 120.0, "delete": 60.0, "hide": 60.0}
+
+
+@dcs.dataclass(slots=True)
+class PunishJob:
+    """
+    一次待执行的吧务写操作
+
+    Attributes:
+        kind (str): 操作类型 block/delete/hide
+        fname (str): 所在吧名
+        fid (int): 所在吧id
+        tid (int): 主题帖tid
+        pid (int): 回复或楼中楼的pid
+        pids (list[int]): 批量删除时同一主题帖下的pid列表
+        is_thread (bool): 操作对象是否为主题帖
+        portrait (str): 被封禁用户的portrait
+        user_id (int): 被封禁用户的user_id
+        day (int): 封禁天数
+        note (str): 处罚理由
+        desc (str): 操作对象的描述 仅用于日志
+        attempts (int): 已重试次数
+    """
+
+    kind: str
+    fname: str
+    fid: int = 0
+    tid: int = 0
+    pid: int = 0
+    pids: list[int] = dcs.field(default_factory=list)
+    is_thread: bool = False
+    portrait: str = ""
+    user_id: int = 0
+    day: int = 0
+    note: str = ""
+    desc: str = ""
+    attempts: int = 0
+    row_id: int = dcs.field(default=0, compare=False)
+    waiter: asyncio.Future | None = dcs.field(default=None, compare=False, repr=False)
+
+    def dumps(self) -> str:
+        data = {f.name: getattr(self, f.name) for f in dcs.fields(self) if f.compare}
+        return json.dumps(data, ensure_ascii=False)
+
+    @staticmethod
+    def loads(payload: str, row_id: int = 0) -> PunishJob:
+        return PunishJob(**json.loads(payload), row_id=row_id)
+
+
+def jobs_from_punish(punish: Punish) -> list[PunishJob]:
+    """
+    将处罚拆分为待执行的吧务写操作
+
+    Args:
+        punish (Punish)
+
+    Returns:
+        list[PunishJob]
+    """
+
+    obj = punish.obj
+    fname = get_fname()
+    jobs = []
+
+    if punish.day:
+        jobs.append(
+            PunishJob(
+                "block",
+                fname,
+                portrait=obj.user.portrait,
+                user_id=obj.user.user_id,
+                day=punish.day,
+                note=punish.note,
+                desc=repr(obj.user),
+            )
+        )
+
+    if punish.op == Ops.DELETE:
+        jobs.append(
+            PunishJob(
+                "delete",
+                fname,
+                fid=obj.fid,
+                tid=obj.tid,
+                pid=obj.pid,
+                is_thread=isinstance(obj, Thread),
+                note=punish.note,
+                desc=str(obj),
+            )
+        )
+    elif punish.op == Ops.HIDE:
+        jobs.append(PunishJob("hide", fname, tid=obj.tid, note=punish.note, desc=str(obj)))
+
+    return jobs
+
+
+class PunishQueue:
+    """
+    异步处罚队列
+
+    处罚由审查流程投递后立即返回 实际的删封操作由一组工作协程执行
+    遇到暂时性错误时按指数退避重试 可选地将未完成的操作持久化到SQLite
+
+    Args:
+        num_workers (int, optional): 工作协程数. Defaults to 4.
+        max_retries (int, optional): 暂时性错误的最大重试次数. Defaults to 3.
+        backoff (float, optional): 首次重试的等待时间 以秒为单位. Defaults to 2.0.
+        durable (bool, optional): 是否将未完成的操作持久化到SQLite. Defaults to False.
+
+    Attributes:
+        succeeded (int): 成功执行的操作数
+        failed (int): 最终失败的操作数
+        retried (int): 重试次数
+    """
+
+    __slots__ = [
+        "num_workers",
+        "max_retries",
+        "backoff",
+        "durable",
+        "succeeded",
+        "failed",
+        "retried",
+        "_queue",
+        "_workers",
+        "_pending",
+        "_idle",
+        "_dbs",
+        "_parked",
+        "_stopping",
+    ]
+
+    def __init__(
+        self,
+        num_workers: int = 4,
+        max_retries: int = 3,
+        backoff: float = 2.0,
+        durable: bool = False,
+    ) -> None:
+        self.num_workers = num_workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.durable = durable
+
+        self.succeeded = 0
+        self.failed = 0
+        self.retried = 0
+
+        self._queue: asyncio.Queue[PunishJob] = asyncio.Queue()
+        self._workers: list[asyncio.Task] = []
+        self._pending = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._dbs: dict[str, SQLiteDB] = {}
+        # 在时间轮中等待重试的操作 以id(job)为键
+        self._parked: dict[int, tuple[TimerHandle, PunishJob]] = {}
+        self._stopping = False
+
+    def __len__(self) -> int:
+        return self._pending
+
+    def start(self) -> None:
+        """
+        启动工作协程 持久化模式下会先恢复当前吧遗留的操作
+        """
+
+        if self.durable:
+            db_sqlite = get_db_sqlite()
+            db_sqlite.create_table_punish()
+            for row_id, payload in db_sqlite.get_punish_jobs():
+                job = PunishJob.loads(payload, row_id)
+                self._dbs[job.fname] = db_sqlite
+                self._put(job)
+                LOG().info(f"Restore punish job. job={job}")
+
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.num_workers)]
+
+    async def stop(self, wait_time: float = 30.0) -> None:
+        """
+        等待已投递的操作完成并停止工作协程
+
+        Args:
+            wait_time (float, optional): 最长等待时间 以秒为单位. Defaults to 30.0.
+
+        Note:
+            仍在等待重试的操作会被提前执行一次 不再重试
+            超时后未完成的操作在持久化模式下保留在SQLite中 下次启动时恢复
+        """
+
+        with contextlib.suppress(TimeoutError):
+            await asyncio.wait_for(self._idle.wait(), wait_time)
+
+        self._stopping = True
+        if self._parked:
+            LOG().info(f"Flush {len(self._parked)} parked punish retries")
+            for handle, job in self._parked.values():
+                handle.cancel()
+                self._queue.put_nowait(job)
+            self._parked.clear()
+            with contextlib.suppress(TimeoutError):
+                await asyncio.wait_for(self._idle.wait(), wait_time)
+
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers.clear()
+
+        while not self._queue.empty():
+            self._drop(self._queue.get_nowait())
+        self._stopping = False
+
+    def put_punish(self, punish: Punish) -> asyncio.Future[bool]:
+        """
+        投递一个处罚
+
+        Args:
+            punish (Punish)
+
+        Returns:
+            asyncio.Future[bool]: 所有相关操作均成功时为True 仅在需要确认执行结果时等待
+        """
+
+        loop = asyncio.get_running_loop()
+        waiters = []
+        for job in jobs_from_punish(punish):
+            job.waiter = loop.create_future()
+            waiters.append(job.waiter)
+            self.put(job)
+
+        future = loop.create_future()
+        if not waiters:
+            future.set_result(True)
+            return future
+
+        def _done(fut: asyncio.Future) -> None:
+            future.set_result(all(fut.result()))
+
+        asyncio.gather(*waiters).add_done_callback(_done)
+        return future
+
+    def put(self, job: PunishJob) -> None:
+        """
+        投递一个吧务写操作
+
+        Args:
+            job (PunishJob)
+        """
+
+        if self.durable:
+            if (db_sqlite := self._dbs.get(job.fname)) is None:
+                db_sqlite = self._dbs[job.fname] = get_db_sqlite()
+                db_sqlite.create_table_punish()
+            job.row_id = db_sqlite.add_punish_job(job.dumps())
+        self._put(job)
+
+    def _put(self, job: PunishJob) -> None:
+        self._pending += 1
+        self._idle.clear()
+        self._queue.put_nowait(job)
+
+    def _finish(self, job: PunishJob, success: bool) -> None:
+        if success:
+            self.succeeded += 1
+        else:
+            self.failed += 1
+            LOG().warning(f"Give up punish job. job={job}")
+
+        if job.row_id:
+            self._dbs[job.fname].del_punish_job(job.row_id)
+        if job.waiter is not None and not job.waiter.done():
+            job.waiter.set_result(success)
+
+        self._pending -= 1
+        if not self._pending:
+            self._idle.set()
+
+    def _drop(self, job: PunishJob) -> None:
+        # 持久化模式下保留记录
+        if not job.row_id:
+            LOG().warning(f"Drop punish job on stop. job={job}")
+        if job.waiter is not None and not job.waiter.done():
+            job.waiter.set_result(False)
+
+        self._pending -= 1
+        if not self._pending:
+            self._idle.set()
+
+    def _unpark(self, job: PunishJob) -> None:
+        del self._parked[id(job)]
+        self._queue.put_nowait(job)
+
+    async def _worker(self) -> None:
+        while 1:
+            job = await self._queue.get()
+            try:
+                err = (await execute_job(job)).err
+            except Exception as _err:
+                err = _err
+            get_retry_scheduler().record(job.kind, err)
+
+            if err is None:
+                self._finish(job, True)
+            elif is_transient(err) and job.attempts < self.max_retries:
+                if self._stopping:
+                    self._drop(job)
+                    continue
+                delay = self.backoff * 2**job.attempts
+                job.attempts += 1
+                self.retried += 1
+                LOG().info(f"Retry punish job in {delay}s. err={err} job={job}")
+                handle = get_retry_scheduler().wheel.call_later(delay, functools.partial(self._unpark, job))
+                self._parked[id(job)] = (handle, job)
+            else:
+                self._finish(job, False)
+
+
+async def execute_job(job: PunishJob) -> Any:
+    """
+    执行一个吧务写操作
+
+    Args:
+        job (PunishJob)
+
+    Returns:
+        Any: 客户端方法的返回值 其err字段为None时表示成功
+
+    Note:
+        本函数只尝试一次 重试由调用方负责
+    """
+
+    client = await get_client()
+
+    if job.kind == "block":
+        ret = await client.block(job.fname, job.portrait, day=job.day, reason=job.note)
+        if (code := get_err_code(ret)) == 1211068:
+            # 用户已被封禁 解封后稍等再重新封禁
+            # 补救操作不单独重试 失败时由外层对整个封禁重试
+            await client.unblock(job.fname, job.user_id)
+            await asyncio.sleep(1.5)
+            ret = await client.block(job.fname, job.portrait, day=job.day, reason=job.note)
+        elif code == 3150003:
+            # 封禁天数超出权限范围 降级为10天
+            ret = await client.block(job.fname, job.portrait, day=10, reason=job.note)
+
+    elif job.kind == "delete":
+        LOG().info(f"Del {job.desc}. note={job.note}")
+        if len(job.pids) > 1:
+            ret = await client.del_posts(job.fid, job.tid, job.pids)
+        else:
+            ret = await client.del_post(job.fid, job.tid, job.pid)
+
+    else:
+        LOG().info(f"Hide {job.desc}. note={job.note}")
+        ret = await client.hide_thread(job.fname, job.tid)
+
+    return ret
+
+
+class PunishAggregator:
+    """
+    单轮审查内的处罚合并
+
+    同一用户的多次封禁合并为一次 取最大天数
+    同一主题帖下的多条删除合并为批量删除 主题帖本身被删除时取消其下所有删除与屏蔽
+
+    Args:
+        batch_size (int, optional): 单次批量删除的最大条数. Defaults to 30.
+
+    Attributes:
+        received (int): 收到的操作数
+        emitted (int): 合并后实际发出的操作数
+    """
+
+    __slots__ = ["batch_size", "received", "emitted", "_jobs"]
+
+    def __init__(self, batch_size: int = 30) -> None:
+        self.batch_size = batch_size
+        self.received = 0
+        self.emitted = 0
+        self._jobs: dict[str, list[PunishJob]] = {}
+
+    def add(self, job: PunishJob) -> None:
+        """
+        暂存一个吧务写操作
+
+        Args:
+            job (PunishJob)
+        """
+
+        self.received += 1
+        self._jobs.setdefault(job.fname, []).append(job)
+
+    def drain(self, fname: str) -> list[PunishJob]:
+        """
+        取出并合并一个吧暂存的所有操作
+
+        Args:
+            fname (str): 吧名
+
+        Returns:
+            list[PunishJob]: 合并后的操作
+        """
+
+        jobs = self._jobs.pop(fname, [])
+
+        blocks: dict[int, PunishJob] = {}
+        deleted_threads: dict[int, PunishJob] = {}
+        deletes: dict[int, list[PunishJob]] = {}
+        hides: dict[int, PunishJob] = {}
+
+        for job in jobs:
+            if job.kind == "block":
+                prev = blocks.get(job.user_id)
+                if prev is None or job.day > prev.day:
+                    blocks[job.user_id] = job
+            elif job.kind == "delete":
+                if job.is_thread:
+                    deleted_threads[job.tid] = job
+                else:
+                    deletes.setdefault(job.tid, []).append(job)
+            else:
+                hides[job.tid] = job
+
+        merged = list(blocks.values())
+        merged += deleted_threads.values()
+
+        for tid, del_jobs in deletes.items():
+            if tid in deleted_threads:
+                continue
+            pids = list(dict.fromkeys(j.pid for j in del_jobs))
+            for i in range(0, len(pids), self.batch_size):
+                batch = pids[i : i + self.batch_size]
+                first = del_jobs[0]
+                if len(batch) == 1:
+                    merged.append(next(j for j in del_jobs if j.pid == batch[0]))
+                else:
+                    merged.append(
+                        PunishJob(
+                            "delete",
+                            fname,
+                            fid=first.fid,
+                            tid=tid,
+                            pid=batch[0],
+                            pids=batch,
+                            note=first.note,
+                            desc=f"{len(batch)} posts in tid={tid}",
+                        )
+                    )
+
+        merged += (job for tid, job in hides.items() if tid not in deleted_threads)
+
+        self.emitted += len(merged)
+        return merged
+
+
+_punish_queue: PunishQueue | None = None
+_punish_aggregator: PunishAggregator | None = None
+
+
+def get_punish_queue() -> PunishQueue | None:
+    """
+    获取正在使用的处罚队列
+
+    Returns:
+        PunishQueue | None: None表示处罚在审查流程中同步执行
+    """
+
+    return _punish_queue
+
+
+def get_punish_aggregator() -> PunishAggregator | None:
+    """
+    获取正在使用的处罚合并器
+
+    Returns:
+        PunishAggregator | None: None表示不合并处罚
+    """
+
+    return _punish_aggregator
+
+
+async def flush_punishes() -> None:
+    """
+    将当前吧在本轮审查中暂存的处罚合并后执行
+
+    Note:
+        已启用处罚队列时投递到队列 否则交给重试调度器执行并等待其完成
+        单个操作的失败只记录日志 不影响其他操作
+    """
+
+    if _punish_aggregator is None:
+        return
+
+    jobs = _punish_aggregator.drain(get_fname())
+    if _punish_queue is not None:
+        for job in jobs:
+            _punish_queue.put(job)
+        return
+
+    scheduler = get_retry_scheduler()
+    futures = [
+        scheduler.submit(job.kind, functools.partial(execute_job, job), deadline=DEADLINES[job.kind]) for job in jobs
+    ]
+    # 调度器的操作不会被审查流程的取消中断
+    rets = await asyncio.shield(asyncio.gather(*futures))
+    for job, ret in zip(jobs, rets, strict=True):
+        # 尝试抛出异常时调度器的结果为None
+        err = ret.err if ret is not None else "exception"
+        if err is not None:
+            LOG().warning(f"Failed to execute punish job. err={err} job={job}")
+
+
+@contextlib.asynccontextmanager
+async def use_punish_queue(
+    num_workers: int = 4,
+    max_retries: int = 3,
+    durable: bool = False,
+) -> AsyncGenerator[PunishQueue, None]:
+    """
+    在上下文中使用异步处罚队列执行删封
+
+    Args:
+        num_workers (int, optional): 工作协程数. Defaults to 4.
+        max_retries (int, optional): 暂时性错误的最大重试次数. Defaults to 3.
+        durable (bool, optional): 是否将未完成的操作持久化到SQLite. Defaults to False.
+
+    Note:
+        仅在`no_test`模式下生效 退出上下文时会等待已投递的操作完成
+    """
+
+    global _punish_queue
+    queue = PunishQueue(num_workers, max_retries, durable=durable)
+    queue.start()
+    _punish_queue = queue
+
+    try:
+        yield queue
+    finally:
+        _punish_queue = None
+        await queue.stop()
+
+
+@contextlib.asynccontextmanager
+async def use_punish_aggregator(batch_size: int = 30) -> AsyncGenerator[PunishAggregator, None]:
+    """
+    在上下文中将每轮审查产生的处罚合并后执行
+
+    Args:
+        batch_size (int, optional): 单次批量删除的最大条数. Defaults to 30.
+
+    Note:
+        仅在`no_test`模式下生效 处罚将延迟到每轮审查结束时执行
+        可与`use_punish_queue`嵌套使用 此时合并后的操作将投递到队列
+    """
+
+    global _punish_aggregator
+    aggregator = PunishAggregator(batch_size)
+    _punish_aggregator = aggregator
+
+    try:
+        yield aggregator
+    finally:
+        await flush_punishes()
+        _punish_aggregator = None
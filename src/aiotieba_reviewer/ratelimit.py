@@ -0,0 +1,382 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import deque
+from collections.abc import Callable
+from typing import Any
+
+import aiohttp
+import aiotieba as tb
+from aiotieba import get_logger as LOG
+
+from .client import wrap_client
+from .metrics import MetricFamily, add_collector
+from .proxy import ClientProxy
+
+# 贴吧服务端在请求过于频繁时返回的错误码 可按需覆盖
+THROTTLE_CODES = frozenset({220034, 340011})
+
+WRITE_METHODS = frozenset(
+    {
+        "block",
+        "unblock",
+        "del_post",
+        "del_posts",
+        "del_thread",
+        "del_threads",
+        "hide_thread",
+        "unhide_thread",
+        "recover",
+        "recover_post",
+        "recover_thread",
+        "move",
+        "good",
+        "ungood",
+        "top",
+        "untop",
+        "recommend",
+        "add_bawu_blacklist",
+        "del_bawu_blacklist",
+    }
+)
+
+
+def is_read_method(name: str) -> bool:
+    """
+    判断客户端方法是否为只读请求
+
+    Args:
+        name (str): 方法名
+
+    Returns:
+        bool
+    """
+
+    return name.startswith(("get_", "search_")) or name == "tieba_uid2user_info"
+
+
+def get_err_code(res: Any) -> int:
+    """
+    获取返回值中的贴吧服务端错误码
+
+    Args:
+        res (Any): 客户端方法的返回值
+
+    Returns:
+        int: 错误码 无错误或非服务端错误时返回0
+    """
+
+    err = getattr(res, "err", None)
+    if isinstance(err, tb.exception.TiebaServerError):
+        return err.code
+    return 0
+
+
+def is_transient(err: Exception | None) -> bool:
+    """
+    判断错误是否为可重试的暂时性错误
+
+    Args:
+        err (Exception | None)
+
+    Returns:
+        bool
+    """
+
+    if isinstance(err, tb.exception.TiebaServerError):
+        return err.code in THROTTLE_CODES
+    return isinstance(err, TimeoutError | aiohttp.ClientError | tb.exception.HTTPStatusError)
+
+
+class TokenBucket:
+    """
+    令牌桶
+
+    Args:
+        rate (float): 每秒补充的令牌数
+        burst (float, optional): 桶容量. Defaults to 0.0即与rate相同.
+    """
+
+    __slots__ = ["rate", "burst", "_tokens", "_last", "_lock"]
+
+    def __init__(self, rate: float, burst: float = 0.0) -> None:
+        self.rate = rate
+        self.burst = burst or max(rate, 1.0)
+        self._tokens = self.burst
+        self._last = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        """
+        取走一个令牌 令牌不足时等待
+        """
+
+        async with self._lock:
+            while 1:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return
+                await asyncio.sleep((1.0 - self._tokens) / self.rate)
+
+
+class AIMDLimiter:
+    """
+    加性增乘性减的并发上限控制
+
+    Args:
+        init_limit (float, optional): 初始并发上限. Defaults to 4.0.
+        min_limit (float, optional): 最小并发上限. Defaults to 1.0.
+        max_limit (float, optional): 最大并发上限. Defaults to 64.0.
+        target_latency (float, optional): 健康延迟阈值 以秒为单位. Defaults to 1.0.
+        max_error_rate (float, optional): 健康错误率阈值. Defaults to 0.05.
+
+    Attributes:
+        limit (float): 当前并发上限
+        inflight (int): 进行中的请求数
+        latency (float): 平滑后的请求延迟 以秒为单位
+        error_rate (float): 平滑后的错误率
+        decreases (int): 触发乘性减的次数
+    """
+
+    __slots__ = [
+        "min_limit",
+        "max_limit",
+        "target_latency",
+        "max_error_rate",
+        "limit",
+        "inflight",
+        "latency",
+        "error_rate",
+        "decreases",
+        "_last_decrease",
+        "_waiters",
+    ]
+
+    def __init__(
+        self,
+        init_limit: float = 4.0,
+        min_limit: float = 1.0,
+        max_limit: float = 64.0,
+        target_latency: float = 1.0,
+        max_error_rate: float = 0.05,
+    ) -> None:
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.target_latency = target_latency
+        self.max_error_rate = max_error_rate
+
+        self.limit = init_limit
+        self.inflight = 0
+        self.latency = 0.0
+        self.error_rate = 0.0
+        self.decreases = 0
+
+        self._last_decrease = 0.0
+        self._waiters: deque[asyncio.Future] = deque()
+
+    async def acquire(self) -> None:
+        """
+        占用一个并发名额 名额不足时等待
+        """
+
+        while self.inflight >= int(self.limit):
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            finally:
+                if not waiter.done():
+                    self._waiters.remove(waiter)
+        self.inflight += 1
+
+    def release(self, latency: float, is_error: bool, is_throttled: bool) -> None:
+        """
+        归还并发名额并根据本次请求的结果调整并发上限
+
+        Args:
+            latency (float): 本次请求的延迟 以秒为单位
+            is_error (bool): 本次请求是否出错
+            is_throttled (bool): 本次请求是否被服务端限流
+        """
+
+        self.latency += 0.1 * (latency - self.latency)
+        self.error_rate += 0.1 * (float(is_error) - self.error_rate)
+
+        if is_throttled:
+            now = time.monotonic()
+            # 同一批进行中的请求只触发一次减半
+            if now - self._last_decrease >= self.latency:
+                self._last_decrease = now
+                self.limit = max(self.min_limit, self.limit / 2)
+                self.decreases += 1
+                LOG().warning(f"Throttled by server. concurrency limit -> {self.limit:.2f}")
+        elif self.latency <= self.target_latency and self.error_rate <= self.max_error_rate:
+            self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+
+        self.inflight -= 1
+        for _ in range(int(self.limit) - self.inflight):
+            if not self._waiters:
+                break
+            self._waiters.popleft().set_result(None)
+
+
+class RateGovernor:
+    """
+    API请求速率控制
+
+    读请求与写请求分别使用独立的令牌桶 读请求的并发上限按AIMD自适应调整
+
+    Args:
+        read_rate (float, optional): 每秒允许的读请求数. Defaults to 20.0.
+        write_rate (float, optional): 每秒允许的写请求数. Defaults to 2.0.
+        limiter (AIMDLimiter, optional): 读请求并发控制. Defaults to None.
+        throttle_codes (frozenset[int], optional): 视为限流的服务端错误码. Defaults to THROTTLE_CODES.
+
+    Attributes:
+        read_bucket (TokenBucket): 读请求令牌桶
+        write_bucket (TokenBucket): 写请求令牌桶
+        limiter (AIMDLimiter): 读请求并发控制
+        throttled (int): 被限流的请求数
+    """
+
+    __slots__ = [
+        "read_bucket",
+        "write_bucket",
+        "limiter",
+        "throttle_codes",
+        "throttled",
+    ]
+
+    def __init__(
+        self,
+        read_rate: float = 20.0,
+        write_rate: float = 2.0,
+        limiter: AIMDLimiter | None = None,
+        throttle_codes: frozenset[int] = THROTTLE_CODES,
+    ) -> None:
+        self.read_bucket = TokenBucket(read_rate)
+        self.write_bucket = TokenBucket(write_rate)
+        self.limiter = limiter if limiter is not None else AIMDLimiter()
+        self.throttle_codes = throttle_codes
+        self.throttled = 0
+
+    def collect(self) -> list[MetricFamily]:
+        """
+        以指标的形式输出速率控制的状态
+
+        Returns:
+            list[MetricFamily]
+        """
+
+        limiter = self.limiter
+        return [
+            MetricFamily("throttled_total", "counter", "Requests throttled by the server", [("", {}, self.throttled)]),
+            MetricFamily(
+                "read_concurrency_limit", "gauge", "AIMD concurrency limit of reads", [("", {}, limiter.limit)]
+            ),
+            MetricFamily("read_inflight", "gauge", "Reads in flight", [("", {}, limiter.inflight)]),
+        ]
+
+    def wrap(self, client: tb.Client) -> GovernedClient:
+        """
+        使用该实例代理一个客户端
+
+        Args:
+            client (tb.Client)
+
+        Returns:
+            GovernedClient
+        """
+
+        return GovernedClient(client, self)
+
+    async def read(self, method: Callable, args: tuple, kwargs: dict) -> Any:
+        """
+        经由速率控制发起读请求
+        """
+
+        await self.read_bucket.acquire()
+        await self.limiter.acquire()
+
+        start = time.perf_counter()
+        is_error = True
+        is_throttled = False
+        try:
+            res = await method(*args, **kwargs)
+            err = getattr(res, "err", None)
+            is_error = err is not None
+            is_throttled = isinstance(err, TimeoutError) or get_err_code(res) in self.throttle_codes
+            return res
+        except TimeoutError:
+            is_throttled = True
+            raise
+        finally:
+            if is_throttled:
+                self.throttled += 1
+            self.limiter.release(time.perf_counter() - start, is_error, is_throttled)
+
+    async def write(self, method: Callable, args: tuple, kwargs: dict) -> Any:
+        """
+        经由速率控制发起写请求
+        """
+
+        await self.write_bucket.acquire()
+        res = await method(*args, **kwargs)
+        if get_err_code(res) in self.throttle_codes:
+            self.throttled += 1
+        return res
+
+
+class GovernedClient(ClientProxy):
+    """
+    受速率控制的客户端代理
+
+    Args:
+        client (tb.Client): 被代理的客户端
+        governor (RateGovernor): 速率控制
+    """
+
+    __slots__ = ["_governor"]
+
+    def __init__(self, client: tb.Client, governor: RateGovernor) -> None:
+        super().__init__(client)
+        self._governor = governor
+
+    def _wrap(self, name: str, method: Callable) -> Callable:
+        if name in WRITE_METHODS:
+            request = self._governor.write
+        elif is_read_method(name):
+            request = self._governor.read
+        else:
+            return method
+
+        async def _(*args, **kwargs):
+            return await request(method, args, kwargs)
+
+        return _
+
+
+def enable_rate_governor(read_rate: float = 20.0, write_rate: float = 2.0) -> RateGovernor:
+    """
+    为`get_client`返回的客户端启用速率控制
+
+    Args:
+        read_rate (float, optional): 每秒允许的读请求数. Defaults to 20.0.
+        write_rate (float, optional): 每秒允许的写请求数. Defaults to 2.0.
+
+    Returns:
+        RateGovernor
+
+    Note:
+        须在`set_BDUSS_key`之后调用
+        若同时启用了请求去重 应先启用速率控制再启用去重 使被合并的请求不占用令牌
+    """
+
+    governor = RateGovernor(read_rate, write_rate)
+    wrap_client(governor.wrap)
+    add_collector(governor.collect)
+    return governor
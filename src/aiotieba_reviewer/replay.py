@@ -0,0 +1,312 @@
+from __future__ import annotations
+
+import asyncio
+import functools
+import inspect
+import pickle
+import struct
+import time
+import zlib
+from collections import Counter, deque
+from collections.abc import Callable, Iterator
+from pathlib import Path
+from typing import Any, BinaryIO
+
+import aiotieba as tb
+from aiotieba import get_logger as LOG
+
+from . import client
+from .proxy import ClientProxy
+from .ratelimit import WRITE_METHODS
+
+RECORD_METHODS = frozenset(
+    {
+        "get_threads",
+        "get_posts",
+        "get_comments",
+        "get_homepage",
+        "get_user_info",
+        "tieba_uid2user_info",
+        "get_portrait",
+        "get_image",
+        "get_image_bytes",
+        "get_fid",
+        "get_fname",
+    }
+)
+
+_MAGIC = b"TBRP\x01"
+_LEN = struct.Struct(">I")
+
+
+@functools.cache
+def _signature(name: str) -> inspect.Signature | None:
+    try:
+        return inspect.signature(getattr(tb.Client, name))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+def _key(name: str, args: tuple, kwargs: dict) -> str:
+    # 按方法签名补全默认参数 使位置参数与关键字参数两种写法得到相同的键
+    if (sig := _signature(name)) is not None:
+        try:
+            bound = sig.bind(None, *args, **kwargs)
+            bound.apply_defaults()
+            return repr((name, bound.args[1:], sorted(bound.kwargs.items())))
+        except TypeError:
+            pass
+    return repr((name, args, sorted(kwargs.items())))
+
+
+def write_record(fp: BinaryIO, record: tuple[str, str, float, Any]) -> None:
+    """
+    向录制档案追加一条记录
+
+    Args:
+        fp (BinaryIO): 以追加模式打开的档案
+        record (tuple[str, str, float, Any]): (方法名, 请求键, 延迟, 返回值)
+    """
+
+    payload = zlib.compress(pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL))
+    fp.write(_LEN.pack(len(payload)) + payload)
+
+
+def read_records(path: str | Path) -> Iterator[tuple[str, str, float, Any]]:
+    """
+    依次读取录制档案中的记录
+
+    Args:
+        path (str | Path): 档案路径
+
+    Yields:
+        tuple[str, str, float, Any]: (方法名, 请求键, 延迟, 返回值)
+    """
+
+    with open(path, "rb") as fp:
+        if fp.read(len(_MAGIC)) != _MAGIC:
+            raise ValueError(f"Not a replay archive. path={path}")
+        while header := fp.read(_LEN.size):
+            (length,) = _LEN.unpack(header)
+            payload = fp.read(length)
+            if len(payload) != length:
+                LOG().warning(f"Truncated replay archive. path={path}")
+                return
+            yield pickle.loads(zlib.decompress(payload))
+
+
+class Recorder:
+    """
+    录制客户端的只读请求及其返回值
+
+    档案由若干条长度前缀的记录组成 每条记录经pickle序列化后以zlib压缩
+
+    Args:
+        path (str | Path): 档案路径 已存在时追加写入
+        methods (frozenset[str], optional): 录制的方法. Defaults to RECORD_METHODS.
+
+    Attributes:
+        recorded (int): 已录制的记录数
+        skipped (int): 因无法序列化而跳过的记录数
+    """
+
+    __slots__ = ["path", "methods", "recorded", "skipped", "_fp"]
+
+    def __init__(self, path: str | Path, methods: frozenset[str] = RECORD_METHODS) -> None:
+        self.path = Path(path)
+        self.methods = methods
+        self.recorded = 0
+        self.skipped = 0
+
+        is_new = not self.path.exists() or self.path.stat().st_size == 0
+        self._fp = open(self.path, "ab")  # noqa: SIM115
+        if is_new:
+            self._fp.write(_MAGIC)
+
+    def wrap(self, client: tb.Client) -> RecordingClient:
+        """
+        使用该录制器代理一个客户端
+
+        Args:
+            client (tb.Client)
+
+        Returns:
+            RecordingClient
+        """
+
+        return RecordingClient(client, self)
+
+    def record(self, name: str, key: str, latency: float, res: Any) -> None:
+        """
+        写入一条记录
+        """
+
+        try:
+            write_record(self._fp, (name, key, latency, res))
+        except (pickle.PicklingError, TypeError, AttributeError) as err:
+            self.skipped += 1
+            LOG().debug(f"Skip unpicklable response. method={name} err={err!r}")
+            return
+
+        self._fp.flush()
+        self.recorded += 1
+
+    def close(self) -> None:
+        self._fp.close()
+
+
+class RecordingClient(ClientProxy):
+    """
+    录制只读请求的客户端代理
+
+    Args:
+        client (tb.Client): 被代理的客户端
+        recorder (Recorder): 录制器
+    """
+
+    __slots__ = ["_recorder"]
+
+    def __init__(self, client: tb.Client, recorder: Recorder) -> None:
+        super().__init__(client)
+        self._recorder = recorder
+
+    def _wrap(self, name: str, method: Callable) -> Callable:
+        if name not in self._recorder.methods:
+            return method
+
+        recorder = self._recorder
+
+        async def _(*args, **kwargs):
+            start = time.perf_counter()
+            res = await method(*args, **kwargs)
+            recorder.record(name, _key(name, args, kwargs), time.perf_counter() - start, res)
+            return res
+
+        return _
+
+
+class ReplayClient:
+    """
+    离线回放录制档案的客户端
+
+    相同请求按录制顺序依次返回 录制的返回值用尽后重复返回最后一个
+    返回值以序列化的形式保存 每次返回新的副本 调用方对返回值的原地修改不会影响之后的回放
+    写操作直接返回成功 不会访问网络
+
+    Args:
+        path (str | Path): 档案路径
+        speed (float, optional): 回放速度 0表示不模拟延迟 1表示按录制时的延迟等待 2表示两倍速. Defaults to 0.0.
+
+    Attributes:
+        hits (Counter[str]): 各方法命中录制的次数
+        misses (Counter[str]): 各方法未被录制的请求次数
+        writes (Counter[str]): 各写操作被调用的次数
+    """
+
+    __slots__ = ["path", "speed", "hits", "misses", "writes", "_responses", "_types", "_methods"]
+
+    def __init__(self, path: str | Path, speed: float = 0.0) -> None:
+        self.path = Path(path)
+        self.speed = speed
+        self.hits: Counter[str] = Counter()
+        self.misses: Counter[str] = Counter()
+        self.writes: Counter[str] = Counter()
+
+        self._responses: dict[str, deque[tuple[float, bytes]]] = {}
+        self._types: dict[str, type] = {}
+        self._methods: dict[str, Callable] = {}
+
+        num = 0
+        for name, key, latency, res in read_records(self.path):
+            payload = pickle.dumps(res, protocol=pickle.HIGHEST_PROTOCOL)
+            self._responses.setdefault(key, deque()).append((latency, payload))
+            self._types.setdefault(name, type(res))
+            num += 1
+        LOG().info(f"Loaded {num} responses from {self.path}")
+
+    async def __aenter__(self) -> ReplayClient:
+        return self
+
+    async def __aexit__(self, exc_type=None, exc_val=None, exc_tb=None) -> None:
+        pass
+
+    def __getattr__(self, name: str) -> Callable:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        if (method := self._methods.get(name)) is not None:
+            return method
+
+        if name in WRITE_METHODS:
+
+            async def method(*args, **kwargs):
+                self.writes[name] += 1
+                return tb.exception.BoolResponse()
+
+        else:
+
+            async def method(*args, **kwargs):
+                return await self._replay(name, _key(name, args, kwargs))
+
+        self._methods[name] = method
+        return method
+
+    async def _replay(self, name: str, key: str) -> Any:
+        if (responses := self._responses.get(key)) is None:
+            self.misses[name] += 1
+            LOG().debug(f"Replay miss. key={key}")
+            res = self._types[name]() if name in self._types else tb.exception.BoolResponse()
+            res.err = KeyError(key)
+            return res
+
+        self.hits[name] += 1
+        latency, payload = responses[0]
+        if len(responses) > 1:
+            responses.popleft()
+        if self.speed:
+            await asyncio.sleep(latency / self.speed)
+        return pickle.loads(payload)
+
+
+def enable_recording(path: str | Path) -> Recorder:
+    """
+    录制`get_client`返回的客户端的只读请求
+
+    Args:
+        path (str | Path): 档案路径 已存在时追加写入
+
+    Returns:
+        Recorder
+
+    Note:
+        须在`set_BDUSS_key`之后 其他客户端代理之前调用 以录制真实的请求延迟
+    """
+
+    recorder = Recorder(path)
+    client.wrap_client(recorder.wrap)
+    return recorder
+
+
+def enable_replay(path: str | Path, speed: float = 0.0) -> ReplayClient:
+    """
+    使`get_client`返回回放录制档案的离线客户端 取代`set_BDUSS_key`
+
+    Args:
+        path (str | Path): 档案路径
+        speed (float, optional): 回放速度 0表示不模拟延迟 1表示按录制时的延迟等待. Defaults to 0.0.
+
+    Returns:
+        ReplayClient
+
+    Note:
+        其他客户端代理须在本函数之后启用
+        `run` `run_multi_pn` `test`等入口均可直接在回放上运行
+    """
+
+    replay = ReplayClient(path, speed)
+
+    async def _client_generator():
+        while 1:
+            yield replay
+
+    client.client_generator = _client_generator()
+    return replay
@@ -1,2 +1,15 @@
 from . import comment, comments, post, posts, thread, threads
-from .entry import no_test, run, run_multi_pn, run_multi_pn_with_time_threshold, run_with_dyn_interval, test
+from .entry import (
+    no_test,
+    run,
+    run_multi_forum,
+    run_multi_pn,
+    run_multi_pn_with_time_threshold,
+    run_with_adaptive_interval,
+    run_with_dyn_interval,
+    test,
+)
+from .interval import AdaptiveInterval
+from .memo import CheckerMemo, MemoStat, get_checker_memo
+from .shadow import ShadowSet, get_shadow_set
+from .supervisor import HashRing, Supervisor, run_sharded
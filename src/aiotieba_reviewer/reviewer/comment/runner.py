@@ -4,6 +4,7 @@ from collections.abc import Awaitable, Callable
 
 from ... import executor
 from ...punish import Punish
+from ...tracing import span
 from ...typing import Comment
 from . import checker
 
@@ -15,11 +16,14 @@ async def __null_runner(_):
 
 
 async def __default_runner(comment: Comment) -> Punish | None:
-    punish = await checker.checker(comment)
-    if punish is not None:
-        punish = await executor.punish_executor(punish)
+    with span("comment", pid=comment.pid):
+        with span("comment.checker"):
+            punish = await checker.checker(comment)
         if punish is not None:
-            return punish
+            with span("comment.executor"):
+                punish = await executor.punish_executor(punish)
+            if punish is not None:
+                return punish
 
 
 runner: TypeCommentRunner = __null_runner
@@ -1,16 +1,57 @@
+from __future__ import annotations
+
 from collections.abc import Awaitable, Callable
 
 from ...punish import Punish
+from ...rule_stat import get_rulebook
 from ...typing import Comment
+from ..shadow import get_shadow_set
 
 TypeCommentsFilter = Callable[[list[Comment]], Awaitable[list[Punish] | None]]
 
 _filters: list[TypeCommentsFilter] = []
+_side_effect_free: set[TypeCommentsFilter] = set()
 
 _append_filter_hook = None
 
 
-def append_filter(new_filter: TypeCommentsFilter) -> TypeCommentsFilter:
-    _append_filter_hook()
-    _filters.append(new_filter)
-    return new_filter
+def append_filter(
+    new_filter: TypeCommentsFilter | None = None,
+    /,
+    *,
+    side_effect_free: bool = False,
+    shadow: bool = False,
+) -> TypeCommentsFilter | Callable[[TypeCommentsFilter], TypeCommentsFilter]:
+    """
+    装饰器: 添加楼中楼过滤器
+
+    Args:
+        new_filter (TypeCommentsFilter, optional): 过滤器. 为None时返回带参数的装饰器.
+        side_effect_free (bool, optional): 过滤器是否无副作用 相邻的无副作用过滤器将被并发执行. Defaults to False.
+        shadow (bool, optional): 是否作为候选过滤器添加到影子规则集 而不影响在线过滤器. Defaults to False.
+
+    Returns:
+        TypeCommentsFilter | Callable[[TypeCommentsFilter], TypeCommentsFilter]
+
+    Note:
+        过滤器只会收到尚未被先前过滤器处罚的对象
+    """
+
+    def _(new_filter: TypeCommentsFilter) -> TypeCommentsFilter:
+        if shadow:
+            get_shadow_set().append_filter("comments", new_filter, side_effect_free)
+            return new_filter
+
+        _append_filter_hook()
+        if (rulebook := get_rulebook()).enabled:
+            wrapped = rulebook.account(new_filter, "comments")
+        else:
+            wrapped = new_filter
+        _filters.append(wrapped)
+        if side_effect_free:
+            _side_effect_free.add(wrapped)
+        return new_filter
+
+    if new_filter is None:
+        return _
+    return _(new_filter)
@@ -3,10 +3,13 @@ from __future__ import annotations
 import asyncio
 from collections.abc import Awaitable, Callable
 
-from ... import executor
+from ... import executor, metrics
+from ...activity import get_activity_tracker
 from ...punish import Punish
+from ...tracing import span
 from ...typing import Post
 from ..comment import runner as c_runner
+from ..shadow import get_shadow_set
 from . import filter, producer
 
 TypeCommentsRunner = Callable[[Post], Awaitable[Punish | None]]
@@ -17,33 +20,36 @@ async def __null_runner(_):
 
 
 async def __default_runner(post: Post) -> Punish | None:
-    comments = await producer.producer(post)
-    for comment in comments:
-        comment.parent = post
-
-    rethrow_punish = None
-
-    for filt in filter._filters:
-        punishes = await filt(comments)
-        if punishes is None:
-            continue
+    with span("comments", pid=post.pid):
+        with span("comments.producer"):
+            comments = await producer.producer(post)
+        metrics.checked["comment"] += len(comments)
+        get_activity_tracker().feed(comments)
+        for comment in comments:
+            comment.parent = post
+
+        rethrow_punish = None
+
+        with span("comments.filter"):
+            punishes = await get_shadow_set().apply_filters(
+                "comments", filter._filters, filter._side_effect_free, comments
+            )
         for punish in punishes:
-            if punish:
-                comments.remove(punish.obj)
+            with span("comments.executor"):
                 _p = await executor.punish_executor(punish)
-                if _p is not None:
-                    if rethrow_punish is None:
-                        rethrow_punish = Punish(post)
-                    rethrow_punish |= _p
-
-    punishes = await asyncio.gather(*[c_runner.runner(c) for c in comments])
-    for _p in punishes:
-        if _p is not None:
-            if rethrow_punish is None:
-                rethrow_punish = Punish(post)
-            rethrow_punish |= _p
-
-    return rethrow_punish
+            if _p is not None:
+                if rethrow_punish is None:
+                    rethrow_punish = Punish(post)
+                rethrow_punish |= _p
+
+        punishes = await asyncio.gather(*[c_runner.runner(c) for c in comments])
+        for _p in punishes:
+            if _p is not None:
+                if rethrow_punish is None:
+                    rethrow_punish = Punish(post)
+                rethrow_punish |= _p
+
+        return rethrow_punish
 
 
 runner: TypeCommentsRunner = __null_runner
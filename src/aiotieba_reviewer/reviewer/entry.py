@@ -9,10 +9,14 @@ from aiotieba import get_logger as LOG
 from aiotieba.enums import PostSortType
 
 from .. import client, executor
-from ..client import get_client
+from ..client import Forum, get_client
+from ..database import create_db
+from ..metrics import add_collector, remove_collector
 from ..punish import Punish
+from ..scheduler import get_retry_scheduler
 from ..typing import Post, Thread
 from . import comment, post, posts, thread, threads
+from .interval import AdaptiveInterval
 
 
 async def run(time_interval: float = 0.0) -> NoReturn:
@@ -24,7 +28,7 @@ async def run(time_interval: float = 0.0) -> NoReturn:
     """
 
     while 1:
-        await threads.runner.runner(client._fname)
+        await threads.runner.runner(client.get_fname())
         await asyncio.sleep(time_interval)
 
 
@@ -37,11 +41,72 @@ async def run_with_dyn_interval(dyn_interval: Generator[float, None, None]) -> N
     """
 
     for time_interval in dyn_interval:
-        await threads.runner.runner(client._fname)
+        await threads.runner.runner(client.get_fname())
         if time_interval:
             await asyncio.sleep(time_interval)
 
 
+async def run_with_adaptive_interval(interval: AdaptiveInterval | None = None) -> NoReturn:
+    """
+    在第一页上循环运行审查 根据吧内活跃度自适应调整时间间隔
+
+    Args:
+        interval (AdaptiveInterval, optional): 自适应间隔控制器. Defaults to None.
+
+    Note:
+        运行期间间隔的决策与估计的活跃度会作为指标输出
+    """
+
+    if interval is None:
+        interval = AdaptiveInterval()
+
+    ori_producer = threads.producer.producer
+
+    @threads.set_producer
+    async def _(fname: str, pn: int = 1) -> list[Thread]:
+        thread_list = await ori_producer(fname, pn)
+        interval.observe(thread_list)
+        return thread_list
+
+    add_collector(interval.collect)
+    try:
+        while 1:
+            await threads.runner.runner(client.get_fname())
+            # 间隔须在本轮审查observe之后读取 使突增立即生效
+            await asyncio.sleep(interval.interval)
+    finally:
+        remove_collector(interval.collect)
+        threads.set_producer(ori_producer)
+
+
+async def run_multi_forum(fnames: list[str], time_interval: float = 0.0, max_concurrency: int = 1) -> NoReturn:
+    """
+    在单个进程中循环审查多个吧的第一页 各吧共享同一个客户端与PostgreSQL连接池
+
+    Args:
+        fnames (list[str]): 待管理吧的吧名列表
+        time_interval (float, optional): 每个吧两次审查的时间间隔 以秒为单位. Defaults to 0.0.
+        max_concurrency (int, optional): 允许同时进行审查循环的吧数. Defaults to 1.
+
+    Note:
+        等待执行的吧按先进先出的顺序获得执行权 从而保证各吧被公平地交替审查
+        检查函数与过滤器由所有吧共享 可在其中通过`get_fname`区分当前所在的吧
+    """
+
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def _loop(forum: Forum) -> NoReturn:
+        client.set_forum(forum)
+        while 1:
+            async with semaphore:
+                await threads.runner.runner(forum.fname)
+            await asyncio.sleep(time_interval)
+
+    async with create_db(fnames[0]) as db:
+        forums = [Forum(fname, db.fork(fname)) for fname in fnames]
+        await asyncio.gather(*[_loop(forum) for forum in forums])
+
+
 async def run_multi_pn(pn_gen: Generator[int, None, None] = range(4, 0, -1)) -> None:
     """
     清洗多个页码 将禁用历史状态缓存以允许重复检查
@@ -58,7 +123,7 @@ async def run_multi_pn(pn_gen: Generator[int, None, None] = range(4, 0, -1)) ->
     comment.set_checker(True, False)(comment.checker.ori_checker)
 
     for pn in pn_gen:
-        await threads.runner.runner(client._fname, pn)
+        await threads.runner.runner(client.get_fname(), pn)
 
 
 async def run_multi_pn_with_time_threshold(
@@ -118,7 +183,7 @@ async def run_multi_pn_with_time_threshold(
         return post_list
 
     for pn in pn_gen:
-        await threads.runner.runner(client._fname, pn)
+        await threads.runner.runner(client.get_fname(), pn)
 
 
 async def test(tid: int, pid: int = 0, is_comment: bool = False) -> Punish | None:
@@ -159,6 +224,9 @@ async def no_test() -> None:
 
         LOG().critical(traceback.format_exc())
 
+    # 等待调度器中的封禁与重试完成 避免事件循环退出时被丢弃
+    await get_retry_scheduler().join()
+
     executor.punish_executor = executor.default_punish_executor_test
     thread.runner.set_thread_runner(True)(thread.runner.ori_runner)
     threads.runner.set_threads_runner(True)(threads.runner.ori_runner)
@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+import asyncio
+from collections.abc import Awaitable, Callable
+
+from ..punish import Punish
+from ..typing import TypeObj
+
+TypeFilter = Callable[[list[TypeObj]], Awaitable[list[Punish] | None]]
+
+
+async def apply_filters(
+    filters: list[TypeFilter],
+    side_effect_free: set[TypeFilter],
+    objs: list[TypeObj],
+) -> list[Punish]:
+    """
+    依次执行过滤器 并从objs中原地移除被处罚的对象
+
+    相邻的无副作用过滤器将被并发执行 它们看到的是同一份尚未被处罚的对象列表
+    每组过滤器执行完毕后只对objs做一次原地压缩 后续过滤器收到的仍是同一个列表对象
+
+    Args:
+        filters (list[TypeFilter]): 过滤器列表
+        side_effect_free (set[TypeFilter]): 无副作用的过滤器集合
+        objs (list[TypeObj]): 待过滤的对象列表
+
+    Returns:
+        list[Punish]: 所有非空的处罚 同一对象的多个处罚已合并
+    """
+
+    punished: dict[int, Punish] = {}
+
+    idx = 0
+    num_filters = len(filters)
+    while idx < num_filters:
+        group = [filters[idx]]
+        idx += 1
+        if group[0] in side_effect_free:
+            while idx < num_filters and filters[idx] in side_effect_free:
+                group.append(filters[idx])
+                idx += 1
+
+        if len(group) == 1:
+            results = [await group[0](objs)]
+        else:
+            results = await asyncio.gather(*[filt(objs) for filt in group])
+
+        num_punished = len(punished)
+        for punishes in results:
+            if punishes is None:
+                continue
+            for punish in punishes:
+                if not punish:
+                    continue
+                key = id(punish.obj)
+                if (prev := punished.get(key)) is not None:
+                    punish = prev | punish
+                punished[key] = punish
+
+        if len(punished) != num_punished:
+            objs[:] = [obj for obj in objs if id(obj) not in punished]
+
+    return list(punished.values())
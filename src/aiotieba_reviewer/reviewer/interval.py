@@ -0,0 +1,219 @@
+from __future__ import annotations
+
+import time
+from collections import Counter
+
+from aiotieba import get_logger as LOG
+
+from ..metrics import MetricFamily
+from ..typing import Thread
+
+
+class AdaptiveInterval:
+    """
+    根据吧内活跃度自适应调整的审查间隔
+
+    对比相邻两次获取到的主题帖列表 估计新主题帖与新回复的产生速率
+    活跃度突增时立即缩短到最短间隔 冷清时按指数退避延长间隔
+
+    Args:
+        min_interval (float, optional): 最短间隔 以秒为单位. Defaults to 2.0.
+        max_interval (float, optional): 最长间隔 以秒为单位. Defaults to 120.0.
+        target_events (float, optional): 期望每个间隔内新增的主题帖与回复总数. Defaults to 5.0.
+        backoff (float, optional): 无新内容时的退避倍率. Defaults to 2.0.
+        burst_ratio (float, optional): 瞬时速率超过平滑速率的该倍数时视为突增. Defaults to 3.0.
+        call_budget (float, optional): 每分钟允许的API调用次数上限 0表示不限制. Defaults to 0.0.
+        smoothing (float, optional): 速率的指数平滑系数. Defaults to 0.3.
+        min_burst_rate (float, optional): 视为突增的最低瞬时速率 单位为个每秒. Defaults to 0.05.
+
+    Attributes:
+        interval (float): 当前间隔 以秒为单位
+        thread_rate (float): 平滑后的新主题帖速率 单位为个每秒
+        reply_rate (float): 平滑后的新回复速率 单位为个每秒
+        calls_per_cycle (float): 平滑后的每轮审查API调用数估计值
+        last_decision (str): 最后一次决策的类型
+        decisions (Counter[str]): 各类决策的累计次数
+
+    Note:
+        决策类型包括 burst(突增) active(活跃) backoff(退避) budget(受调用预算限制)
+        实例本身是一个无限迭代器 因此也可以直接传给`run_with_dyn_interval`
+        但此时需要自行调用`observe`喂入主题帖列表
+    """
+
+    __slots__ = [
+        "min_interval",
+        "max_interval",
+        "target_events",
+        "backoff",
+        "burst_ratio",
+        "call_budget",
+        "smoothing",
+        "min_burst_rate",
+        "interval",
+        "thread_rate",
+        "reply_rate",
+        "calls_per_cycle",
+        "last_decision",
+        "decisions",
+        "_snapshot",
+        "_last_mono",
+        "_last_wall",
+    ]
+
+    def __init__(
+        self,
+        min_interval: float = 2.0,
+        max_interval: float = 120.0,
+        target_events: float = 5.0,
+        backoff: float = 2.0,
+        burst_ratio: float = 3.0,
+        call_budget: float = 0.0,
+        smoothing: float = 0.3,
+        min_burst_rate: float = 0.05,
+    ) -> None:
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.target_events = target_events
+        self.backoff = backoff
+        self.burst_ratio = burst_ratio
+        self.call_budget = call_budget
+        self.smoothing = smoothing
+        self.min_burst_rate = min_burst_rate
+
+        self.interval = min_interval
+        self.thread_rate = 0.0
+        self.reply_rate = 0.0
+        self.calls_per_cycle = 1.0
+        self.last_decision = ""
+        self.decisions: Counter[str] = Counter()
+
+        self._snapshot: dict[int, int] | None = None
+        self._last_mono = 0.0
+        self._last_wall = 0
+
+    def __iter__(self) -> AdaptiveInterval:
+        return self
+
+    def __next__(self) -> float:
+        return self.interval
+
+    def observe(self, threads: list[Thread]) -> float:
+        """
+        喂入一次获取到的主题帖列表并更新间隔
+
+        Args:
+            threads (list[Thread]): 主题帖列表
+
+        Returns:
+            float: 更新后的间隔 以秒为单位
+        """
+
+        now_mono = time.monotonic()
+        now_wall = int(time.time())
+        snapshot = {t.tid: t.reply_num for t in threads}
+
+        prev_snapshot = self._snapshot
+        self._snapshot = snapshot
+        elapsed = now_mono - self._last_mono
+        last_wall = self._last_wall
+        self._last_mono = now_mono
+        self._last_wall = now_wall
+
+        if prev_snapshot is None or elapsed <= 0.0:
+            return self.interval
+
+        new_threads = 0
+        new_replies = 0
+        changed = 0
+        for thread in threads:
+            prev_reply_num = prev_snapshot.get(thread.tid)
+            if prev_reply_num is None:
+                changed += 1
+                if thread.create_time >= last_wall:
+                    new_threads += 1
+                    new_replies += thread.reply_num
+                else:
+                    # 旧帖被顶上来 至少有一条新回复
+                    new_replies += 1
+            elif thread.reply_num > prev_reply_num:
+                changed += 1
+                new_replies += thread.reply_num - prev_reply_num
+
+        self._update(new_threads / elapsed, new_replies / elapsed, 1 + changed)
+        return self.interval
+
+    def _update(self, thread_rate: float, reply_rate: float, calls: int) -> None:
+        alpha = self.smoothing
+        smoothed_rate = self.thread_rate + self.reply_rate
+        rate = thread_rate + reply_rate
+
+        self.thread_rate += alpha * (thread_rate - self.thread_rate)
+        self.reply_rate += alpha * (reply_rate - self.reply_rate)
+        self.calls_per_cycle += alpha * (calls - self.calls_per_cycle)
+
+        if rate == 0.0:
+            interval = self.interval * self.backoff
+            decision = "backoff"
+        elif rate >= self.min_burst_rate and rate > self.burst_ratio * smoothed_rate:
+            # 冷清一段时间后平滑速率趋于0 零星的新回复不应被视为突增
+            interval = self.min_interval
+            decision = "burst"
+        else:
+            # smoothing为0时平滑速率始终为0 此时以瞬时速率估计
+            interval = self.target_events / (self.thread_rate + self.reply_rate or rate)
+            decision = "active"
+
+        if self.call_budget:
+            budget_interval = self.calls_per_cycle * 60.0 / self.call_budget
+            if interval < budget_interval:
+                interval = budget_interval
+                decision = "budget"
+
+        interval = min(max(interval, self.min_interval), self.max_interval)
+
+        self.interval = interval
+        self.last_decision = decision
+        self.decisions[decision] += 1
+
+        LOG().debug(
+            f"Adaptive interval={interval:.2f}s decision={decision} "
+            f"thread_rate={self.thread_rate:.4f}/s reply_rate={self.reply_rate:.4f}/s"
+        )
+
+    def collect(self) -> list[MetricFamily]:
+        """
+        以指标的形式输出间隔决策与平滑后的速率
+
+        Returns:
+            list[MetricFamily]
+        """
+
+        return [
+            MetricFamily(
+                "review_interval_seconds", "gauge", "Current adaptive review interval", [("", {}, self.interval)]
+            ),
+            MetricFamily(
+                "review_interval_decisions_total",
+                "counter",
+                "Adaptive interval decisions",
+                [("", {"decision": decision}, count) for decision, count in sorted(self.decisions.items())],
+            ),
+            MetricFamily(
+                "review_interval_last_decision",
+                "gauge",
+                "Type of the last adaptive interval decision",
+                [("", {"decision": self.last_decision}, 1)] if self.last_decision else [],
+            ),
+            MetricFamily(
+                "forum_activity_rate",
+                "gauge",
+                "Smoothed rate of new threads and replies per second",
+                [("", {"kind": "thread"}, self.thread_rate), ("", {"kind": "reply"}, self.reply_rate)],
+            ),
+            MetricFamily(
+                "review_calls_per_cycle",
+                "gauge",
+                "Smoothed estimate of API calls per review cycle",
+                [("", {}, self.calls_per_cycle)],
+            ),
+        ]
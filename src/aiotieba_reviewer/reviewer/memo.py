@@ -0,0 +1,285 @@
+from __future__ import annotations
+
+import asyncio
+import copy
+import functools
+import hashlib
+import time
+import unicodedata
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable, Sequence
+
+from aiotieba import get_logger as LOG
+
+from ..client import get_fname
+from ..metrics import MetricFamily, add_collector
+from ..punish import Punish
+from ..typing import TypeObj
+
+TypeChecker = Callable[[TypeObj], Awaitable[Punish | None]]
+
+# 依次尝试的内容片段属性 取第一个非空的属性作为片段的标识
+_FRAG_ATTRS = ("hash", "md5", "id", "user_id", "raw_url", "url", "src", "text")
+
+
+def content_digest(obj: TypeObj, user_attrs: Sequence[str] = ("level",), fname: str = "") -> bytes:
+    """
+    计算对象内容与发帖用户属性的摘要
+
+    文本经过NFKC与空白合并 图片以哈希 表情以编号 @以user_id 链接以地址标识
+
+    Args:
+        obj (TypeObj): 主题帖 回复或楼中楼
+        user_attrs (Sequence[str], optional): 参与摘要的用户属性. Defaults to ("level",).
+        fname (str, optional): 所在吧的吧名. Defaults to "".
+
+    Returns:
+        bytes: 16字节的摘要
+    """
+
+    parts = [fname, obj.__class__.__name__, getattr(obj, "title", "")]
+    for frag in obj.contents.objs:
+        name = frag.__class__.__name__
+        for attr in _FRAG_ATTRS:
+            if value := getattr(frag, attr, None):
+                if attr == "text":
+                    value = " ".join(unicodedata.normalize("NFKC", value).split())
+                parts.append(f"{name}:{value}")
+                break
+        else:
+            parts.append(name)
+    user = obj.user
+    parts.extend(str(getattr(user, attr, "")) for attr in user_attrs)
+    return hashlib.blake2b("\x1f".join(parts).encode(), digest_size=16).digest()
+
+
+class MemoStat:
+    """
+    单个检查函数的记忆化统计
+
+    Attributes:
+        name (str): 检查函数的限定名
+        calls (int): 总调用次数
+        hits (int): 命中结果缓存的次数
+        coalesced (int): 合并到进行中检查的次数
+        expired (int): 缓存条目过期的次数
+    """
+
+    __slots__ = ["name", "calls", "hits", "coalesced", "expired"]
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.calls = 0
+        self.hits = 0
+        self.coalesced = 0
+        self.expired = 0
+
+    def __repr__(self) -> str:
+        return str(
+            {
+                "calls": self.calls,
+                "hits": self.hits,
+                "coalesced": self.coalesced,
+                "expired": self.expired,
+                "hit_ratio": self.hit_ratio,
+            }
+        )
+
+    @property
+    def misses(self) -> int:
+        """
+        实际执行检查函数的次数
+        """
+
+        return self.calls - self.hits - self.coalesced
+
+    @property
+    def hit_ratio(self) -> float:
+        """
+        被省去的检查占比
+        """
+
+        if self.calls:
+            return (self.hits + self.coalesced) / self.calls
+        return 0.0
+
+
+def _template(punish: Punish | None) -> Punish | None:
+    # 缓存不持有原对象
+    if punish is None:
+        return None
+    punish = copy.copy(punish)
+    punish.obj = None
+    return punish
+
+
+def _rebind(punish: Punish | None, obj: TypeObj) -> Punish | None:
+    if punish is None:
+        return None
+    punish = copy.copy(punish)
+    punish.obj = obj
+    return punish
+
+
+class CheckerMemo:
+    """
+    按内容摘要缓存检查函数的处罚结果
+
+    以所在吧 内容摘要与发帖用户的若干属性为键 命中时以缓存的处罚结果代替检查函数的执行
+    相同键的并发检查共享同一次执行 结果缓存为带有效期的LRU
+
+    Args:
+        maxsize (int, optional): 每个层级的最大条目数. Defaults to 10000.
+        ttl (float, optional): 缓存的有效期 以秒为单位. Defaults to 600.0.
+
+    Attributes:
+        stats (dict[str, MemoStat]): 各层级检查函数的记忆化统计
+
+    Note:
+        仅适用于结果只取决于内容与所列用户属性的检查函数
+        检查函数依赖发帖用户的其他信息(如主页 签名)时 应将相应属性加入user_attrs 例如"user_id"
+        被缓存的处罚结果会在命中时绑定到新的对象上 检查函数内的副作用不会被重放
+        多吧共享检查函数时 各吧的结果互不复用 检查函数可通过`get_fname`使用各吧不同的规则
+    """
+
+    __slots__ = ["maxsize", "ttl", "stats", "_caches", "_inflight"]
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 600.0) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+
+        self.stats: dict[str, MemoStat] = {}
+        self._caches: dict[str, OrderedDict[bytes, tuple[float, Punish | None]]] = {}
+        self._inflight: dict[str, dict[bytes, asyncio.Task]] = {}
+
+    def invalidate(self, level: str | None = None) -> None:
+        """
+        清空结果缓存 规则在检查函数之外更新时(如重新加载关键词)应当调用
+
+        Args:
+            level (str, optional): thread/post/comment. Defaults to None即全部层级.
+        """
+
+        for _level, cache in self._caches.items():
+            if level is None or _level == level:
+                cache.clear()
+
+    def wrap(self, level: str, func: TypeChecker, user_attrs: Sequence[str] = ("level",)) -> TypeChecker:
+        """
+        包装检查函数 使其结果按内容摘要被缓存 该层级原有的缓存与统计被丢弃
+
+        Args:
+            level (str): thread/post/comment
+            func (TypeChecker): 检查函数
+            user_attrs (Sequence[str], optional): 参与缓存键的用户属性. Defaults to ("level",).
+
+        Returns:
+            TypeChecker: 包装后的函数 其`__wrapped__`为原函数
+        """
+
+        stat = self.stats[level] = MemoStat(func.__qualname__)
+        cache = self._caches[level] = OrderedDict()
+        inflight = self._inflight[level] = {}
+        user_attrs = tuple(user_attrs)
+
+        async def _check(key: bytes, obj: TypeObj) -> Punish | None:
+            # 在结果交给任何调用者之前保存模板 调用者对处罚结果的原地修改(如执行器的_transit)不会影响其他调用者
+            try:
+                punish = _template(await func(obj))
+            finally:
+                del inflight[key]
+            cache[key] = (time.monotonic() + self.ttl, punish)
+            cache.move_to_end(key)
+            if len(cache) > self.maxsize:
+                cache.popitem(last=False)
+            return punish
+
+        @functools.wraps(func)
+        async def _(obj: TypeObj) -> Punish | None:
+            try:
+                key = content_digest(obj, user_attrs, get_fname())
+            except AttributeError as err:
+                LOG().warning(f"Failed to digest {obj!r}. err={err!r}")
+                return await func(obj)
+
+            stat.calls += 1
+            if (entry := cache.get(key)) is not None:
+                expire, punish = entry
+                if expire > time.monotonic():
+                    stat.hits += 1
+                    cache.move_to_end(key)
+                    return _rebind(punish, obj)
+                stat.expired += 1
+                del cache[key]
+
+            if (task := inflight.get(key)) is not None:
+                stat.coalesced += 1
+                return _rebind(await asyncio.shield(task), obj)
+
+            task = inflight[key] = asyncio.ensure_future(_check(key, obj))
+            # shield保证发起者被取消时 其他等待者仍能拿到结果
+            return _rebind(await asyncio.shield(task), obj)
+
+        return _
+
+    def discard(self, level: str) -> None:
+        """
+        丢弃某一层级的缓存与统计 该层级的检查函数不再使用记忆化时调用
+
+        Args:
+            level (str): thread/post/comment
+        """
+
+        self.stats.pop(level, None)
+        self._caches.pop(level, None)
+        self._inflight.pop(level, None)
+
+    def collect(self) -> list[MetricFamily]:
+        """
+        以指标的形式输出各检查函数的记忆化统计
+
+        Returns:
+            list[MetricFamily]
+        """
+
+        samples = []
+        entries = []
+        for level, stat in sorted(self.stats.items()):
+            labels = {"level": level, "checker": stat.name}
+            samples.append(("", {**labels, "result": "miss"}, stat.misses))
+            samples.append(("", {**labels, "result": "hit"}, stat.hits))
+            samples.append(("", {**labels, "result": "coalesced"}, stat.coalesced))
+            entries.append(("", labels, len(self._caches[level])))
+        return [
+            MetricFamily("checker_memo_calls_total", "counter", "Checker calls through the memo", samples),
+            MetricFamily("checker_memo_entries", "gauge", "Cached checker verdicts", entries),
+        ]
+
+    def report(self) -> None:
+        """
+        在日志中输出各检查函数的记忆化统计
+        """
+
+        for level, stat in sorted(self.stats.items()):
+            LOG().info(
+                f"CheckerMemo {level} {stat.name} calls={stat.calls} hits={stat.hits} "
+                f"coalesced={stat.coalesced} hit_ratio={stat.hit_ratio:.2%}"
+            )
+
+
+_memo = CheckerMemo()
+add_collector(_memo.collect)
+
+
+def get_checker_memo() -> CheckerMemo:
+    """
+    获取全局的检查函数记忆化层
+
+    Returns:
+        CheckerMemo
+
+    Note:
+        maxsize与ttl可直接修改 对之后写入的条目生效
+    """
+
+    return _memo
@@ -1,10 +1,13 @@
 from __future__ import annotations
 
-from collections.abc import Awaitable, Callable
+from collections.abc import Awaitable, Callable, Sequence
 
-from ... import client
+from ... import client, metrics
 from ...punish import Punish
+from ...rule_stat import get_rulebook
 from ...typing import Post
+from ..memo import get_checker_memo
+from ..shadow import get_shadow_set
 from ..user_checker import _user_checker
 
 TypePostChecker = Callable[[Post], Awaitable[Punish | None]]
@@ -16,19 +19,23 @@ def __id_checker(func):
     """
 
     async def _(post: Post) -> Punish | None:
-        prev_reply_num = client._db_sqlite.get_id(post.pid)
+        db_sqlite = client.get_db_sqlite()
+        prev_reply_num = db_sqlite.get_id(post.pid)
         if prev_reply_num is not None:
             if post.reply_num == prev_reply_num:
+                metrics.id_cache["post", True] += 1
                 return
             elif post.reply_num < prev_reply_num:
-                client._db_sqlite.add_id(post.pid, tag=post.reply_num)
+                metrics.id_cache["post", True] += 1
+                db_sqlite.add_id(post.pid, tag=post.reply_num)
                 return
+        metrics.id_cache["post", False] += 1
 
         punish = await func(post)
         if punish:
             return punish
 
-        client._db_sqlite.add_id(post.pid, tag=post.reply_num)
+        db_sqlite.add_id(post.pid, tag=post.reply_num)
 
     return _
 
@@ -43,10 +50,39 @@ checker: TypePostChecker = _user_checker(ori_checker)
 
 _set_checker_hook = None
 
+# set_checker的参数 影子规则集变化时据此重建检查函数
+_options: tuple[bool, bool, bool | Sequence[str]] = (True, True, False)
+
+
+def _build() -> None:
+    global checker
+    enable_user_checker, enable_id_checker, memoize = _options
+
+    # 重新设置检查函数时 旧规则下缓存的结果随之失效
+    memo = get_checker_memo()
+    if memoize:
+        checker = memo.wrap("post", ori_checker) if memoize is True else memo.wrap("post", ori_checker, memoize)
+    else:
+        memo.discard("post")
+        checker = ori_checker
+
+    if (rulebook := get_rulebook()).enabled:
+        checker = rulebook.account(checker, "post")
+    if "post" in (shadow_set := get_shadow_set()).checkers:
+        checker = shadow_set.wrap_checker("post", checker)
+
+    if enable_user_checker:
+        checker = _user_checker(checker)
+    if enable_id_checker:
+        checker = __id_checker(checker)
+
 
 def set_checker(
     enable_user_checker: bool = True,
     enable_id_checker: bool = True,
+    *,
+    shadow: bool = False,
+    memoize: bool | Sequence[str] = False,
 ) -> Callable[[TypePostChecker], TypePostChecker]:
     """
     装饰器: 设置回复检查函数
@@ -54,25 +90,32 @@ def set_checker(
     Args:
         enable_user_checker (bool, optional): 是否检查发帖用户的黑白名单状态. Defaults to True.
         enable_id_checker (bool, optional): 是否使用历史状态缓存避免重复检查. Defaults to True.
+        shadow (bool, optional): 是否作为候选检查函数注册到影子规则集 而不替换在线检查函数. Defaults to False.
+        memoize (bool | Sequence[str], optional): 是否按内容摘要缓存检查结果 为True时以内容与用户等级为键
+            也可以传入参与缓存键的用户属性名 见`CheckerMemo`. Defaults to False.
 
     Returns:
         Callable[[TypePostChecker], TypePostChecker]
     """
 
     def _(new_checker: TypePostChecker) -> TypePostChecker:
+        global ori_checker, _options
+
         if new_checker is __default_checker:
             return new_checker
 
+        if shadow:
+            get_shadow_set().set_checker("post", new_checker)
+            # 为已设置的在线检查函数加上抽样
+            if ori_checker is not __default_checker:
+                _build()
+            return new_checker
+
         _set_checker_hook()
 
-        global ori_checker, checker
         ori_checker = new_checker
-        checker = ori_checker
-
-        if enable_user_checker:
-            checker = _user_checker(checker)
-        if enable_id_checker:
-            checker = __id_checker(checker)
+        _options = (enable_user_checker, enable_id_checker, memoize)
+        _build()
 
         return ori_checker
 
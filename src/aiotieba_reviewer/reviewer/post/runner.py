@@ -4,6 +4,7 @@ from collections.abc import Awaitable, Callable
 
 from ... import executor
 from ...punish import Punish
+from ...tracing import span
 from ...typing import Post
 from .. import comments
 from . import checker
@@ -16,18 +17,22 @@ async def __null_runner(_):
 
 
 async def __default_runner(post: Post) -> Punish | None:
-    punish = await checker.checker(post)
-    if punish is not None:
-        punish = await executor.punish_executor(punish)
+    with span("post", pid=post.pid):
+        with span("post.checker"):
+            punish = await checker.checker(post)
         if punish is not None:
-            return punish
+            with span("post.executor"):
+                punish = await executor.punish_executor(punish)
+            if punish is not None:
+                return punish
 
-    punish = await comments.runner.runner(post)
-    if punish is not None:
-        punish.obj = post
-        punish = await executor.punish_executor(punish)
+        punish = await comments.runner.runner(post)
         if punish is not None:
-            return punish
+            punish.obj = post
+            with span("post.executor"):
+                punish = await executor.punish_executor(punish)
+            if punish is not None:
+                return punish
 
 
 runner: TypePostRunner = __null_runner
@@ -4,10 +4,13 @@ import asyncio
 import itertools
 from collections.abc import Awaitable, Callable
 
-from ... import executor
+from ... import executor, metrics
+from ...activity import get_activity_tracker
 from ...punish import Punish
+from ...tracing import span
 from ...typing import Thread
 from ..post import runner as p_runner
+from ..shadow import get_shadow_set
 from . import filter, producer
 
 TypePostsRunner = Callable[[Thread], Awaitable[Punish | None]]
@@ -18,37 +21,38 @@ async def __null_runner(_):
 
 
 async def __default_runner(thread: Thread) -> Punish | None:
-    posts = await producer.producer(thread)
-    for post in posts:
-        post.parent = thread
-
-    rethrow_punish = None
-
-    for filt in filter._filters:
-        punishes = await filt(posts)
-        if punishes is None:
-            continue
+    with span("posts", tid=thread.tid):
+        with span("posts.producer"):
+            posts = await producer.producer(thread)
+        metrics.checked["post"] += len(posts)
+        get_activity_tracker().feed(posts)
+        for post in posts:
+            post.parent = thread
+
+        rethrow_punish = None
+
+        with span("posts.filter"):
+            punishes = await get_shadow_set().apply_filters("posts", filter._filters, filter._side_effect_free, posts)
         for punish in punishes:
-            if punish:
-                posts.remove(punish.obj)
+            with span("posts.executor"):
                 _p = await executor.punish_executor(punish)
-                if _p is not None:
-                    if rethrow_punish is None:
-                        rethrow_punish = Punish(thread)
-                    rethrow_punish |= _p
-
-    for i in itertools.count():
-        _posts = posts[i * 50 : (i + 1) * 50]
-        if not _posts:
-            break
-        punishes = await asyncio.gather(*[p_runner.runner(p) for p in _posts])
-        for _p in punishes:
             if _p is not None:
                 if rethrow_punish is None:
                     rethrow_punish = Punish(thread)
                 rethrow_punish |= _p
 
-    return rethrow_punish
+        for i in itertools.count():
+            _posts = posts[i * 50 : (i + 1) * 50]
+            if not _posts:
+                break
+            punishes = await asyncio.gather(*[p_runner.runner(p) for p in _posts])
+            for _p in punishes:
+                if _p is not None:
+                    if rethrow_punish is None:
+                        rethrow_punish = Punish(thread)
+                    rethrow_punish |= _p
+
+        return rethrow_punish
 
 
 runner: TypePostsRunner = __null_runner
@@ -0,0 +1,618 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import multiprocessing
+import multiprocessing.connection
+import multiprocessing.context
+import multiprocessing.process
+import os
+import pickle
+import random
+import signal
+import time
+from collections import deque
+from collections.abc import Awaitable, Callable
+
+from aiotieba import get_logger as LOG
+
+from .. import client
+from ..metrics import MetricFamily, add_collector, summary
+from ..perf_stat import aperf_stat
+from ..punish import Punish
+from ..tracing import get_tracer
+from ..typing import TypeObj
+from .filter_runner import TypeFilter, apply_filters
+
+TypeChecker = Callable[[TypeObj], Awaitable[Punish | None]]
+
+# 比较处罚决定时只关心处罚类型与封禁天数
+TypeDecision = tuple[int, int] | None
+
+
+def _decision(punish: Punish | None) -> TypeDecision:
+    if not punish:
+        return None
+    return (int(punish.op), punish.day)
+
+
+class ShadowStat:
+    """
+    单个层级的影子评估统计
+
+    Attributes:
+        samples (int): 完成评估的样本数
+        skipped (int): 因队列已满而放弃的样本数
+        errors (int): 影子检查抛出异常的次数
+        timeouts (int): 影子检查超出时间预算的次数
+        live_latency (aperf_stat): 在线检查的耗时分布
+        shadow_latency (aperf_stat): 影子检查的耗时分布
+        live_cpu_ns (int): 在线检查的总CPU耗时 单位为纳秒
+        shadow_cpu_ns (int): 影子检查的总CPU耗时 单位为纳秒
+        agree (int): 处罚决定一致的对象数
+        live_only (int): 仅在线检查处罚的对象数
+        shadow_only (int): 仅影子检查处罚的对象数
+        differ (int): 均处罚但处罚类型或天数不同的对象数
+    """
+
+    __slots__ = [
+        "samples",
+        "skipped",
+        "errors",
+        "timeouts",
+        "live_latency",
+        "shadow_latency",
+        "live_cpu_ns",
+        "shadow_cpu_ns",
+        "agree",
+        "live_only",
+        "shadow_only",
+        "differ",
+    ]
+
+    def __init__(self) -> None:
+        self.samples = 0
+        self.skipped = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.live_latency = aperf_stat()
+        self.shadow_latency = aperf_stat()
+        self.live_cpu_ns = 0
+        self.shadow_cpu_ns = 0
+        self.agree = 0
+        self.live_only = 0
+        self.shadow_only = 0
+        self.differ = 0
+
+    def compare(self, live: TypeDecision, shadow: TypeDecision) -> None:
+        if live == shadow:
+            self.agree += 1
+        elif shadow is None:
+            self.live_only += 1
+        elif live is None:
+            self.shadow_only += 1
+        else:
+            self.differ += 1
+
+
+class _Job:
+    __slots__ = ["level", "live", "latency_ns", "cpu_ns", "payload", "submitted"]
+
+    def __init__(self, level: str, live, latency_ns: int, cpu_ns: int, payload: bytes) -> None:
+        self.level = level
+        self.live = live
+        self.latency_ns = latency_ns
+        self.cpu_ns = cpu_ns
+        self.payload = payload
+        self.submitted = time.monotonic()
+
+
+class _Denied:
+    # 工作进程中替代客户端与数据库的生成器 候选规则无法访问在线的客户端与数据库
+
+    def __aiter__(self) -> _Denied:
+        return self
+
+    async def __anext__(self):
+        raise RuntimeError("Shadow rules cannot access the live client or database")
+
+
+async def _evaluate(rules: tuple, level: str, arg, max_time: float):
+    checkers, filters, side_effect_free = rules
+    async with asyncio.timeout(max_time):
+        if isinstance(arg, list):
+            punishes = await apply_filters(filters[level], side_effect_free, arg[:])
+            # 对象在进程间被复制 以其在列表中的下标对应在线的处罚决定
+            index = {id(obj): i for i, obj in enumerate(arg)}
+            return {index[id(p.obj)]: _decision(p) for p in punishes if id(p.obj) in index}
+        return _decision(await checkers[level](arg))
+
+
+def _serve(conn: multiprocessing.connection.Connection, rules: tuple, max_time: float) -> None:
+    """
+    工作进程的主循环 依次评估收到的样本并回传(状态, 处罚决定, 耗时, CPU耗时)
+
+    状态为ok/timeout/error
+    """
+
+    # 中断信号由主进程处理 降低优先级以免与在线进程争抢CPU
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    with contextlib.suppress(OSError):
+        os.nice(10)
+    client.client_generator = _Denied()
+    client.db_generator = _Denied()
+    client._db_sqlite = None
+    client.set_forum(None)
+    get_tracer().enabled = False
+    loop = asyncio.new_event_loop()
+
+    while 1:
+        try:
+            level, arg, fname = pickle.loads(conn.recv_bytes())
+        except EOFError:
+            return
+        client.set_fname(fname)
+
+        start = time.perf_counter_ns()
+        start_cpu = time.thread_time_ns()
+        try:
+            shadow = loop.run_until_complete(_evaluate(rules, level, arg, max_time))
+            status = "ok"
+        except TimeoutError:
+            shadow = None
+            status = "timeout"
+        except Exception as err:
+            shadow = repr(err)
+            status = "error"
+
+        latency_ns = time.perf_counter_ns() - start
+        if status == "ok" and latency_ns > max_time * 1e9:
+            status = "timeout"
+        conn.send((status, shadow, latency_ns, time.thread_time_ns() - start_cpu))
+
+
+class _Worker:
+    __slots__ = ["process", "conn", "job", "timer"]
+
+    def __init__(
+        self, process: multiprocessing.process.BaseProcess, conn: multiprocessing.connection.Connection
+    ) -> None:
+        self.process = process
+        self.conn = conn
+        self.job: _Job | None = None
+        self.timer: asyncio.TimerHandle | None = None
+
+
+class ShadowSet:
+    """
+    与在线规则并行评估的候选规则集
+
+    在线检查函数与过滤器按sample_rate抽样 样本被序列化后经管道交给空闲的工作进程 等待的样本进入有界队列
+    num_workers个工作进程在各自的事件循环中执行候选规则 结果只用于统计 从不执行处罚
+    单个样本最多执行max_time秒 超时的样本不计入对比 超过两倍预算仍未返回的工作进程被终止并重建
+
+    队列已满时放弃样本 出现以下情况时整个影子规则集被自动停用:
+    样本排队超过max_lag秒 连续max_pending个样本被放弃
+    或在线事件循环用于影子评估(序列化样本与记录结果)的CPU耗时占比超过max_overhead
+
+    Args:
+        sample_rate (float, optional): 抽样比例. Defaults to 0.1.
+        num_workers (int, optional): 工作进程数. Defaults to 1.
+        max_pending (int, optional): 队列长度上限. Defaults to 256.
+        max_lag (float, optional): 样本的最长排队时间 以秒为单位. Defaults to 5.0.
+        max_time (float, optional): 单个样本的时间预算 以秒为单位. Defaults to 1.0.
+        max_overhead (float, optional): 在线事件循环用于影子评估的时间占比上限. Defaults to 0.02.
+        mp_context (multiprocessing.context.BaseContext, optional): 创建工作进程的上下文. Defaults to None即默认的启动方式.
+
+    Attributes:
+        checkers (dict[str, TypeChecker]): 各层级的候选检查函数 层级为thread/post/comment
+        filters (dict[str, list[TypeFilter]]): 各层级的候选过滤器 层级为threads/posts/comments
+        stats (dict[str, ShadowStat]): 各层级的评估统计
+        active (bool): 是否正在评估
+        dropped (str): 被自动停用的原因 未被停用时为空字符串
+        overhead_ns (int): 在线事件循环用于影子评估的总CPU耗时 单位为纳秒
+
+    Note:
+        候选规则在工作进程中对样本的副本执行 无法修改在线的对象
+        候选规则无法使用`get_client`与`get_db` 调用时抛出的异常计入errors
+        候选规则可以通过`get_fname`获取样本所在的吧
+        候选规则在工作进程启动时被交给工作进程 使用fork以外的启动方式时 候选规则须为可被pickle的模块级函数
+        注册新的候选规则会重建工作进程
+        只有设置了在线检查函数的层级才会抽样候选检查函数
+    """
+
+    __slots__ = [
+        "sample_rate",
+        "num_workers",
+        "max_pending",
+        "max_lag",
+        "max_time",
+        "max_overhead",
+        "mp_context",
+        "checkers",
+        "filters",
+        "stats",
+        "active",
+        "dropped",
+        "overhead_ns",
+        "_side_effect_free",
+        "_workers",
+        "_backlog",
+        "_loop",
+        "_rng",
+        "_full_streak",
+        "_window_start",
+        "_window_overhead_ns",
+    ]
+
+    def __init__(
+        self,
+        sample_rate: float = 0.1,
+        num_workers: int = 1,
+        max_pending: int = 256,
+        max_lag: float = 5.0,
+        max_time: float = 1.0,
+        max_overhead: float = 0.02,
+        mp_context: multiprocessing.context.BaseContext | None = None,
+    ) -> None:
+        self.sample_rate = sample_rate
+        self.num_workers = num_workers
+        self.max_pending = max_pending
+        self.max_lag = max_lag
+        self.max_time = max_time
+        self.max_overhead = max_overhead
+        self.mp_context = mp_context
+
+        self.checkers: dict[str, TypeChecker] = {}
+        self.filters: dict[str, list[TypeFilter]] = {}
+        self.stats: dict[str, ShadowStat] = {}
+        self.active = False
+        self.dropped = ""
+        self.overhead_ns = 0
+
+        self._side_effect_free: set[TypeFilter] = set()
+        self._workers: list[_Worker] = []
+        self._backlog: deque[_Job] = deque()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._rng = random.Random()
+        self._full_streak = 0
+        self._window_start = time.monotonic()
+        self._window_overhead_ns = 0
+
+    def set_checker(self, level: str, new_checker: TypeChecker) -> None:
+        """
+        设置候选检查函数
+
+        Args:
+            level (str): thread/post/comment
+            new_checker (TypeChecker)
+        """
+
+        self.checkers[level] = new_checker
+        self._activate(level)
+
+    def append_filter(self, level: str, new_filter: TypeFilter, side_effect_free: bool = False) -> None:
+        """
+        添加候选过滤器
+
+        Args:
+            level (str): threads/posts/comments
+            new_filter (TypeFilter)
+            side_effect_free (bool, optional): 过滤器是否无副作用. Defaults to False.
+        """
+
+        self.filters.setdefault(level, []).append(new_filter)
+        if side_effect_free:
+            self._side_effect_free.add(new_filter)
+        self._activate(level)
+
+    def _activate(self, level: str) -> None:
+        if level not in self.stats:
+            self.stats[level] = ShadowStat()
+        # 已启动的工作进程持有旧的规则集
+        self._shutdown()
+        if not self.dropped:
+            self.active = True
+
+    def _start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        for _ in range(self.num_workers):
+            self._spawn()
+
+    def _spawn(self) -> _Worker:
+        ctx = self.mp_context or multiprocessing.get_context()
+        conn, child_conn = ctx.Pipe()
+        rules = (self.checkers, self.filters, self._side_effect_free)
+        process = ctx.Process(target=_serve, args=(child_conn, rules, self.max_time), name="shadow", daemon=True)
+        process.start()
+        child_conn.close()
+
+        worker = _Worker(process, conn)
+        self._workers.append(worker)
+        self._loop.add_reader(conn.fileno(), self._on_result, worker)
+        return worker
+
+    def _close(self, worker: _Worker) -> None:
+        self._workers.remove(worker)
+        if worker.timer is not None:
+            worker.timer.cancel()
+        with contextlib.suppress(RuntimeError):
+            self._loop.remove_reader(worker.conn.fileno())
+        worker.conn.close()
+        worker.process.kill()
+        worker.process.join(0.1)
+
+    def _shutdown(self) -> None:
+        for worker in self._workers[:]:
+            self._close(worker)
+        self._backlog.clear()
+        self._loop = None
+
+    def stop(self) -> None:
+        """
+        停止工作进程 等待评估的样本将被丢弃
+        """
+
+        self.active = False
+        self._shutdown()
+
+    def drop(self, reason: str) -> None:
+        """
+        停用影子规则集
+
+        Args:
+            reason (str): 停用原因
+        """
+
+        if self.dropped:
+            return
+        self.dropped = reason
+        LOG().warning(f"Shadow rule set dropped. reason={reason}")
+        self.stop()
+
+    def _submit(self, level: str, live, latency_ns: int, cpu_ns: int, arg) -> None:
+        if not self.active:
+            return
+
+        if len(self._backlog) >= self.max_pending:
+            self.stats[level].skipped += 1
+            self._full_streak += 1
+            if self._full_streak >= self.max_pending:
+                self.drop(f"{self._full_streak} samples skipped in a row")
+            return
+        self._full_streak = 0
+
+        # 事件循环被替换后 旧的工作进程已无法回传结果
+        if self._loop is not asyncio.get_running_loop():
+            self._shutdown()
+            self._start()
+
+        # 在抽样时序列化 样本不再随在线对象变化 工作进程中的修改也不会影响在线对象
+        payload = pickle.dumps((level, arg, client.get_fname()), protocol=pickle.HIGHEST_PROTOCOL)
+        self._backlog.append(_Job(level, live, latency_ns, cpu_ns, payload))
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        for worker in self._workers:
+            if not self._backlog:
+                return
+            if worker.job is not None:
+                continue
+
+            job = self._backlog.popleft()
+            if (lag := time.monotonic() - job.submitted) > self.max_lag:
+                self.drop(f"sample lagged {lag:.1f}s")
+                return
+            worker.job = job
+            worker.timer = self._loop.call_later(2 * self.max_time, self._on_stuck, worker)
+            try:
+                worker.conn.send_bytes(job.payload)
+            except OSError as err:
+                self.drop(f"worker failed. err={err!r}")
+                return
+
+    def _on_stuck(self, worker: _Worker) -> None:
+        # 计算密集的候选规则无法被asyncio.timeout打断 只能终止工作进程
+        worker.timer = None
+        self.stats[worker.job.level].timeouts += 1
+        self._close(worker)
+        self._spawn()
+        self._dispatch()
+
+    def _on_result(self, worker: _Worker) -> None:
+        start = time.thread_time_ns()
+        try:
+            status, shadow, latency_ns, cpu_ns = worker.conn.recv()
+        except (EOFError, OSError) as err:
+            self.drop(f"worker exited. err={err!r}")
+            return
+
+        job = worker.job
+        worker.job = None
+        worker.timer.cancel()
+        worker.timer = None
+
+        stat = self.stats[job.level]
+        stat.live_latency.record(job.latency_ns)
+        stat.live_cpu_ns += job.cpu_ns
+        stat.shadow_latency.record(latency_ns)
+        stat.shadow_cpu_ns += cpu_ns
+
+        if status == "timeout":
+            stat.timeouts += 1
+        elif status == "error":
+            stat.errors += 1
+            LOG().debug(f"Shadow {job.level} failed. err={shadow}")
+        else:
+            stat.samples += 1
+            if isinstance(job.live, list):
+                for i, live in enumerate(job.live):
+                    stat.compare(live, shadow.get(i))
+            else:
+                stat.compare(job.live, shadow)
+
+        self._dispatch()
+        self._account(time.thread_time_ns() - start)
+
+    def _account(self, overhead_ns: int) -> None:
+        self.overhead_ns += overhead_ns
+        self._window_overhead_ns += overhead_ns
+
+        now = time.monotonic()
+        if (elapsed := now - self._window_start) < 10.0:
+            return
+        ratio = self._window_overhead_ns / (elapsed * 1e9)
+        self._window_start = now
+        self._window_overhead_ns = 0
+        if ratio > self.max_overhead:
+            self.drop(f"live loop overhead {ratio:.2%}")
+
+    def wrap_checker(self, level: str, func: TypeChecker) -> TypeChecker:
+        """
+        包装在线检查函数 使其结果按比例被抽样并与候选检查函数比较
+
+        Args:
+            level (str): thread/post/comment
+            func (TypeChecker): 在线检查函数
+
+        Returns:
+            TypeChecker
+        """
+
+        async def _(obj: TypeObj) -> Punish | None:
+            if not self.active or level not in self.checkers or self._rng.random() >= self.sample_rate:
+                return await func(obj)
+
+            start = time.perf_counter_ns()
+            start_cpu = time.thread_time_ns()
+            punish = await func(obj)
+            latency_ns = time.perf_counter_ns() - start
+            end_cpu = time.thread_time_ns()
+            self._submit(level, _decision(punish), latency_ns, end_cpu - start_cpu, obj)
+            self._account(time.thread_time_ns() - end_cpu)
+            return punish
+
+        return _
+
+    async def apply_filters(
+        self,
+        level: str,
+        filters: list[TypeFilter],
+        side_effect_free: set[TypeFilter],
+        objs: list[TypeObj],
+    ) -> list[Punish]:
+        """
+        执行在线过滤器 并按比例将过滤前的对象列表投递给候选过滤器
+
+        Args:
+            level (str): threads/posts/comments
+            filters (list[TypeFilter]): 在线过滤器列表
+            side_effect_free (set[TypeFilter]): 无副作用的在线过滤器集合
+            objs (list[TypeObj]): 待过滤的对象列表
+
+        Returns:
+            list[Punish]: 在线过滤器产生的处罚
+        """
+
+        if not self.active or level not in self.filters or self._rng.random() >= self.sample_rate:
+            return await apply_filters(filters, side_effect_free, objs)
+
+        snapshot = list(objs)
+        start = time.perf_counter_ns()
+        start_cpu = time.thread_time_ns()
+        punishes = await apply_filters(filters, side_effect_free, objs)
+        latency_ns = time.perf_counter_ns() - start
+        end_cpu = time.thread_time_ns()
+        # 以对象在快照中的下标记录在线的处罚决定
+        index = {id(obj): i for i, obj in enumerate(snapshot)}
+        live = [None] * len(snapshot)
+        for p in punishes:
+            if (i := index.get(id(p.obj))) is not None:
+                live[i] = _decision(p)
+        self._submit(level, live, latency_ns, end_cpu - start_cpu, snapshot)
+        self._account(time.thread_time_ns() - end_cpu)
+        return punishes
+
+    def report(self) -> str:
+        """
+        输出各层级在线与候选规则的耗时与处罚决定对比
+
+        Returns:
+            str
+        """
+
+        lines = [
+            f"Shadow rule set active={self.active} dropped={self.dropped!r} sample_rate={self.sample_rate}"
+            f" live_overhead={self.overhead_ns / 1e6:.1f}ms"
+        ]
+        for level, stat in self.stats.items():
+            samples = stat.samples or 1
+            lines.append(
+                f"  {level} samples={stat.samples} skipped={stat.skipped} errors={stat.errors} timeouts={stat.timeouts}\n"
+                f"    latency p50 live={stat.live_latency.p50:.3f}ms shadow={stat.shadow_latency.p50:.3f}ms"
+                f" p99 live={stat.live_latency.p99:.3f}ms shadow={stat.shadow_latency.p99:.3f}ms\n"
+                f"    cpu/sample live={stat.live_cpu_ns / samples / 1e3:.1f}us shadow={stat.shadow_cpu_ns / samples / 1e3:.1f}us\n"
+                f"    agree={stat.agree} live_only={stat.live_only} shadow_only={stat.shadow_only} differ={stat.differ}"
+            )
+        return "\n".join(lines)
+
+    def collect(self) -> list[MetricFamily]:
+        """
+        以指标的形式输出影子评估统计
+
+        Returns:
+            list[MetricFamily]
+        """
+
+        if not self.stats:
+            return []
+
+        latency_rows = []
+        cpu_samples = []
+        decision_samples = []
+        for level, stat in self.stats.items():
+            for side, lat, cpu_ns in (
+                ("live", stat.live_latency, stat.live_cpu_ns),
+                ("shadow", stat.shadow_latency, stat.shadow_cpu_ns),
+            ):
+                labels = {"level": level, "set": side}
+                latency_rows.append((labels, lat, lat.total_ns / 1e9, lat.total_count))
+                cpu_samples.append(("", labels, cpu_ns / 1e9))
+            decision_samples.extend(
+                ("", {"level": level, "outcome": outcome}, getattr(stat, outcome))
+                for outcome in ("agree", "live_only", "shadow_only", "differ", "skipped", "errors", "timeouts")
+            )
+
+        return [
+            summary("shadow_latency_seconds", "Latency of sampled live and shadow checks", latency_rows),
+            MetricFamily("shadow_cpu_seconds_total", "counter", "CPU time of sampled checks", cpu_samples),
+            MetricFamily("shadow_samples_total", "counter", "Shadow evaluation outcomes", decision_samples),
+            MetricFamily(
+                "shadow_live_overhead_seconds_total",
+                "counter",
+                "Live loop time spent on shadow evaluation",
+                [("", {}, self.overhead_ns / 1e9)],
+            ),
+            MetricFamily(
+                "shadow_active", "gauge", "Whether the shadow rule set is running", [("", {}, float(self.active))]
+            ),
+        ]
+
+
+_shadow_set = ShadowSet()
+add_collector(_shadow_set.collect)
+
+
+def get_shadow_set() -> ShadowSet:
+    """
+    获取全局的影子规则集
+
+    Returns:
+        ShadowSet
+
+    Note:
+        通过`set_checker(shadow=True)`与`append_filter(shadow=True)`注册候选规则
+        抽样比例与队列长度等参数可在注册前直接修改
+    """
+
+    return _shadow_set
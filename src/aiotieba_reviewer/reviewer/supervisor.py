@@ -0,0 +1,363 @@
+from __future__ import annotations
+
+import asyncio
+import bisect
+import hashlib
+import multiprocessing as mp
+import queue
+import time
+from collections.abc import Callable, Hashable
+
+from aiotieba import get_logger as LOG
+
+from .. import client
+from ..perf_stat import Histogram
+from ..typing import Thread
+from . import thread, threads
+from .entry import no_test, run, run_multi_forum
+
+
+class HashRing:
+    """
+    一致性哈希环
+
+    Args:
+        nodes (list[int]): 节点列表
+        replicas (int, optional): 每个节点的虚拟节点数. Defaults to 64.
+    """
+
+    __slots__ = ["_keys", "_nodes"]
+
+    def __init__(self, nodes: list[int], replicas: int = 64) -> None:
+        ring = sorted((self._hash(f"{node}#{i}"), node) for node in nodes for i in range(replicas))
+        self._keys = [k for k, _ in ring]
+        self._nodes = [n for _, n in ring]
+
+    @staticmethod
+    def _hash(key: Hashable) -> int:
+        return int.from_bytes(hashlib.blake2b(str(key).encode(), digest_size=8).digest(), "big")
+
+    def get(self, key: Hashable) -> int:
+        """
+        获取key所属的节点
+
+        Args:
+            key (Hashable)
+
+        Returns:
+            int: 节点
+        """
+
+        idx = bisect.bisect(self._keys, self._hash(key))
+        if idx == len(self._keys):
+            idx = 0
+        return self._nodes[idx]
+
+
+TypeWorkerStat = tuple[float, float, Histogram]
+
+
+def _collect_stats() -> dict[str, TypeWorkerStat]:
+    return {
+        name: (stat.avg_time, stat.last_time, stat.histogram())
+        for name, stat in (("threads", threads.runner.perf_stat), ("thread", thread.runner.perf_stat))
+    }
+
+
+async def _worker(
+    worker_id: int,
+    fnames: list[str],
+    time_interval: float,
+    stat_queue: mp.Queue,
+    report_interval: float,
+    thread_queue: mp.Queue | None,
+) -> None:
+    if thread_queue is not None:
+        # 单个吧时由监督者统一拉取首页并按tid分片 每个tid及其下属的回复与楼中楼只会被一个工作进程检查
+        @threads.set_producer
+        async def _(fname: str, pn: int = 1) -> list[Thread]:
+            # 带超时地等待 使事件循环退出时等待线程能够及时结束
+            while 1:
+                try:
+                    thread_list = await asyncio.to_thread(thread_queue.get, True, 1.0)
+                    break
+                except queue.Empty:
+                    continue
+            # 落后于拉取进度时只审查最新的一批
+            while 1:
+                try:
+                    thread_list = thread_queue.get_nowait()
+                except queue.Empty:
+                    return thread_list
+
+        # 审查节奏由监督者的拉取间隔决定
+        time_interval = 0.0
+
+    async def _report() -> None:
+        while 1:
+            await asyncio.sleep(report_interval)
+            stat_queue.put((worker_id, _collect_stats()))
+
+    report_task = asyncio.create_task(_report())
+    try:
+        if thread_queue is not None:
+            # 各工作进程的id缓存写入同一个文件会互相损坏 因此每个分片使用独立的文件
+            # 分片由一致性哈希决定 工作进程重启后仍能复用自己的缓存
+            fname = fnames[0]
+            client.set_fname(fname, f".cache/{fname}.shard{worker_id}.sqlite")
+            await run(time_interval)
+        elif len(fnames) == 1:
+            client.set_fname(fnames[0])
+            await run(time_interval)
+        else:
+            await run_multi_forum(fnames, time_interval)
+    finally:
+        report_task.cancel()
+
+
+def _worker_main(
+    setup: Callable[[], None],
+    worker_id: int,
+    fnames: list[str],
+    time_interval: float,
+    stat_queue: mp.Queue,
+    report_interval: float,
+    is_test: bool,
+    thread_queue: mp.Queue | None,
+) -> None:
+    setup()
+
+    async def main() -> None:
+        coro = _worker(worker_id, fnames, time_interval, stat_queue, report_interval, thread_queue)
+        if is_test:
+            await coro
+        else:
+            async with no_test():
+                await coro
+
+    asyncio.run(main())
+
+
+class Supervisor:
+    """
+    多进程分片审查的监督者
+
+    Args:
+        setup (Callable[[], None]): 在每个工作进程中最先执行的初始化函数 必须可被pickle
+        fnames (list[str]): 待管理吧的吧名列表
+        num_workers (int, optional): 工作进程数. Defaults to 0即CPU核心数.
+        time_interval (float, optional): 每两次审查的时间间隔 以秒为单位. Defaults to 0.0.
+        is_test (bool, optional): 是否以测试模式运行. Defaults to True.
+        report_interval (float, optional): 工作进程上报性能统计的间隔 以秒为单位. Defaults to 30.0.
+
+    Attributes:
+        stats (dict[int, dict[str, tuple[float, float, Histogram]]]): 各工作进程最近上报的(平均耗时, 最后一次耗时, 耗时直方图) 单位为毫秒
+        assignments (dict[int, list[str]]): 各工作进程分到的吧名
+        restarts (dict[int, int]): 各工作进程的重启次数
+
+    Note:
+        setup应当完成`set_BDUSS_key`与检查函数的注册 待管理吧由监督者分配
+        多个吧时按吧名一致性哈希分配给工作进程 增减工作进程时只有少数吧会换到别的进程 未分到吧的工作进程不会启动
+        单个吧时setup也会在监督者进程中执行 由监督者每隔time_interval秒拉取一次首页 按tid一致性哈希分片后交给各工作进程
+        每个tid只属于一个工作进程 各进程的id缓存分别保存在.cache/{fname}.shard{worker_id}.sqlite中 用户权限则以PostgreSQL为准
+    """
+
+    __slots__ = [
+        "setup",
+        "fnames",
+        "num_workers",
+        "time_interval",
+        "is_test",
+        "report_interval",
+        "stats",
+        "assignments",
+        "restarts",
+        "_ctx",
+        "_queue",
+        "_thread_queues",
+        "_procs",
+    ]
+
+    def __init__(
+        self,
+        setup: Callable[[], None],
+        fnames: list[str],
+        num_workers: int = 0,
+        time_interval: float = 0.0,
+        is_test: bool = True,
+        report_interval: float = 30.0,
+    ) -> None:
+        self.setup = setup
+        self.fnames = fnames
+        self.num_workers = num_workers or mp.cpu_count()
+        if len(fnames) > 1:
+            self.num_workers = min(self.num_workers, len(fnames))
+        self.time_interval = time_interval
+        self.is_test = is_test
+        self.report_interval = report_interval
+
+        self.stats: dict[int, dict[str, TypeWorkerStat]] = {}
+        if len(fnames) == 1:
+            self.assignments = {worker_id: list(fnames) for worker_id in range(self.num_workers)}
+        else:
+            ring = HashRing(list(range(self.num_workers)))
+            self.assignments = {}
+            for fname in sorted(fnames):
+                self.assignments.setdefault(ring.get(fname), []).append(fname)
+        self.restarts: dict[int, int] = dict.fromkeys(self.assignments, 0)
+
+        self._ctx = mp.get_context("spawn")
+        self._queue: mp.Queue = self._ctx.Queue()
+        self._thread_queues: dict[int, mp.Queue] = {}
+        if len(fnames) == 1:
+            self._thread_queues = {worker_id: self._ctx.Queue() for worker_id in range(self.num_workers)}
+        self._procs: dict[int, mp.Process] = {}
+
+    def _spawn(self, worker_id: int) -> None:
+        proc = self._ctx.Process(
+            target=_worker_main,
+            args=(
+                self.setup,
+                worker_id,
+                self.assignments[worker_id],
+                self.time_interval,
+                self._queue,
+                self.report_interval,
+                self.is_test,
+                self._thread_queues.get(worker_id),
+            ),
+            name=f"reviewer-worker-{worker_id}",
+            daemon=True,
+        )
+        proc.start()
+        self._procs[worker_id] = proc
+
+    def aggregate(self) -> dict[str, tuple[float, float, float, float]]:
+        """
+        汇总各工作进程的性能统计
+
+        Returns:
+            dict[str, tuple[float, float, float, float]]: 各统计项的(平均耗时的均值, 最后一次耗时的最大值, 整体p50, 整体p99) 单位为毫秒
+
+        Note:
+            分位数由各进程的直方图合并后计算 而非对各进程的分位数取平均
+        """
+
+        res: dict[str, tuple[float, float, int, Histogram]] = {}
+        for worker_stats in self.stats.values():
+            for name, (avg_time, last_time, hist) in worker_stats.items():
+                if (item := res.get(name)) is None:
+                    item = res[name] = (0.0, 0.0, 0, Histogram())
+                acc_avg, max_last, num, merged = item
+                merged.merge(hist)
+                res[name] = (acc_avg + avg_time, max(max_last, last_time), num + 1, merged)
+        return {
+            name: (acc_avg / num, max_last, merged.quantile(0.5), merged.quantile(0.99))
+            for name, (acc_avg, max_last, num, merged) in res.items()
+        }
+
+    def _drain_queue(self) -> bool:
+        updated = False
+        while 1:
+            try:
+                worker_id, worker_stats = self._queue.get_nowait()
+            except queue.Empty:
+                return updated
+            self.stats[worker_id] = worker_stats
+            updated = True
+
+    async def _fetch(self) -> None:
+        fname = self.fnames[0]
+        ring = HashRing(list(range(self.num_workers)))
+        while 1:
+            try:
+                thread_list = await threads.producer.producer(fname)
+            except Exception as err:
+                LOG().warning(f"Failed to fetch threads. fname={fname} err={err!r}")
+            else:
+                shards: dict[int, list[Thread]] = {worker_id: [] for worker_id in self._thread_queues}
+                for t in thread_list:
+                    shards[ring.get(t.tid)].append(t)
+                for worker_id, shard in shards.items():
+                    self._thread_queues[worker_id].put(shard)
+
+                # 等待存活的工作进程取走各自的分片 避免拉取速度远超审查速度
+                for _ in range(600):
+                    if not any(
+                        proc.is_alive() and not self._thread_queues[worker_id].empty()
+                        for worker_id, proc in self._procs.items()
+                    ):
+                        break
+                    await asyncio.sleep(0.1)
+
+            await asyncio.sleep(self.time_interval)
+
+    async def run(self) -> None:
+        """
+        启动所有工作进程并持续监督 异常退出的工作进程将按指数退避重启
+        """
+
+        fetch_task = None
+        if self._thread_queues:
+            self.setup()
+            fetch_task = asyncio.create_task(self._fetch())
+
+        for worker_id in self.assignments:
+            self._spawn(worker_id)
+
+        next_spawn: dict[int, float] = {}
+        try:
+            while 1:
+                await asyncio.sleep(1.0)
+
+                if self._drain_queue():
+                    for name, (avg_time, last_time, p50, p99) in self.aggregate().items():
+                        LOG().info(
+                            f"Workers {name} avg_time={avg_time / 1e3:.5f}s max_last_time={last_time / 1e3:.5f}s"
+                            f" p50={p50 / 1e3:.5f}s p99={p99 / 1e3:.5f}s"
+                        )
+
+                now = time.monotonic()
+                for worker_id, proc in self._procs.items():
+                    if proc.is_alive():
+                        continue
+                    if proc.exitcode == 0:
+                        continue
+                    if (spawn_time := next_spawn.get(worker_id)) is None:
+                        delay = min(2.0 ** self.restarts[worker_id], 60.0)
+                        next_spawn[worker_id] = now + delay
+                        LOG().warning(f"Worker {worker_id} exited with code={proc.exitcode}. restart in {delay}s")
+                    elif now >= spawn_time:
+                        del next_spawn[worker_id]
+                        self.restarts[worker_id] += 1
+                        self._spawn(worker_id)
+
+        finally:
+            if fetch_task is not None:
+                fetch_task.cancel()
+            for proc in self._procs.values():
+                if proc.is_alive():
+                    proc.terminate()
+            for proc in self._procs.values():
+                proc.join(5.0)
+
+
+async def run_sharded(
+    setup: Callable[[], None],
+    fnames: list[str],
+    num_workers: int = 0,
+    time_interval: float = 0.0,
+    is_test: bool = True,
+) -> None:
+    """
+    使用多个工作进程分片审查
+
+    Args:
+        setup (Callable[[], None]): 在每个工作进程中最先执行的初始化函数 必须可被pickle
+        fnames (list[str]): 待管理吧的吧名列表
+        num_workers (int, optional): 工作进程数. Defaults to 0即CPU核心数.
+        time_interval (float, optional): 每两次审查的时间间隔 以秒为单位. Defaults to 0.0.
+        is_test (bool, optional): 是否以测试模式运行. Defaults to True.
+    """
+
+    await Supervisor(setup, fnames, num_workers, time_interval, is_test).run()
@@ -4,6 +4,7 @@ from aiotieba import get_logger as LOG
 
 from ... import executor
 from ...perf_stat import aperf_stat
+from ...tracing import span
 from ...typing import Thread
 from .. import posts
 from . import checker
@@ -16,21 +17,28 @@ async def __null_runner(_):
 
 
 async def __default_runner(thread: Thread) -> None:
-    punish = await checker.checker(thread)
-    if punish is not None:
-        await executor.punish_executor(punish)
+    with span("thread", tid=thread.tid):
+        with span("thread.checker"):
+            punish = await checker.checker(thread)
+        if punish is not None:
+            with span("thread.executor"):
+                await executor.punish_executor(punish)
 
-    punish = await posts.runner.runner(thread)
-    if punish is not None:
-        punish.obj = thread
-        await executor.punish_executor(punish)
+        punish = await posts.runner.runner(thread)
+        if punish is not None:
+            punish.obj = thread
+            with span("thread.executor"):
+                await executor.punish_executor(punish)
+
+
+perf_stat = aperf_stat()
 
 
 def __runner_perf_stat(func: TypeThreadRunner) -> TypeThreadRunner:
-    perf_stat = aperf_stat()
+    timed_func = perf_stat(func)
 
     async def _(thread: Thread) -> None:
-        punish = await perf_stat(func)(thread)
+        punish = await timed_func(thread)
         LOG().debug(f"Checked tid={thread.tid} time={perf_stat.last_time / 1e3:.5f}s")
         return punish
 
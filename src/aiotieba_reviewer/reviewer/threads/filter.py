@@ -1,16 +1,57 @@
+from __future__ import annotations
+
 from collections.abc import Awaitable, Callable
 
 from ...punish import Punish
+from ...rule_stat import get_rulebook
 from ...typing import Thread
+from ..shadow import get_shadow_set
 
 TypeThreadsFilter = Callable[[list[Thread]], Awaitable[list[Punish] | None]]
 
 _filters: list[TypeThreadsFilter] = []
+_side_effect_free: set[TypeThreadsFilter] = set()
 
 _append_filter_hook = None
 
 
-def append_filter(new_filter: TypeThreadsFilter) -> TypeThreadsFilter:
-    _append_filter_hook()
-    _filters.append(new_filter)
-    return new_filter
+def append_filter(
+    new_filter: TypeThreadsFilter | None = None,
+    /,
+    *,
+    side_effect_free: bool = False,
+    shadow: bool = False,
+) -> TypeThreadsFilter | Callable[[TypeThreadsFilter], TypeThreadsFilter]:
+    """
+    装饰器: 添加主题帖过滤器
+
+    Args:
+        new_filter (TypeThreadsFilter, optional): 过滤器. 为None时返回带参数的装饰器.
+        side_effect_free (bool, optional): 过滤器是否无副作用 相邻的无副作用过滤器将被并发执行. Defaults to False.
+        shadow (bool, optional): 是否作为候选过滤器添加到影子规则集 而不影响在线过滤器. Defaults to False.
+
+    Returns:
+        TypeThreadsFilter | Callable[[TypeThreadsFilter], TypeThreadsFilter]
+
+    Note:
+        过滤器只会收到尚未被先前过滤器处罚的对象
+    """
+
+    def _(new_filter: TypeThreadsFilter) -> TypeThreadsFilter:
+        if shadow:
+            get_shadow_set().append_filter("threads", new_filter, side_effect_free)
+            return new_filter
+
+        _append_filter_hook()
+        if (rulebook := get_rulebook()).enabled:
+            wrapped = rulebook.account(new_filter, "threads")
+        else:
+            wrapped = new_filter
+        _filters.append(wrapped)
+        if side_effect_free:
+            _side_effect_free.add(wrapped)
+        return new_filter
+
+    if new_filter is None:
+        return _
+    return _(new_filter)
@@ -3,8 +3,13 @@ from collections.abc import Awaitable, Callable
 
 from aiotieba import get_logger as LOG
 
-from ... import executor
+from ... import executor, metrics
+from ...activity import get_activity_tracker
 from ...perf_stat import aperf_stat
+from ...punish_queue import flush_punishes
+from ...rule_stat import get_rulebook
+from ...tracing import span
+from ..shadow import get_shadow_set
 from ..thread import runner as t_runner
 from . import filter, producer
 
@@ -16,25 +21,34 @@ async def __null_runner(_):
 
 
 async def __default_runner(fname: str, pn: int = 1) -> None:
-    threads = await producer.producer(fname, pn)
+    with span("threads", fname=fname, pn=pn):
+        with span("threads.producer"):
+            threads = await producer.producer(fname, pn)
+        metrics.checked["thread"] += len(threads)
+        get_activity_tracker().feed(threads)
 
-    for filt in filter._filters:
-        punishes = await filt(threads)
-        if punishes is None:
-            continue
-        for punish in punishes:
-            if punish:
-                threads.remove(punish.obj)
-        await asyncio.gather(*[executor.punish_executor(p) for p in punishes])
+        with span("threads.filter"):
+            punishes = await get_shadow_set().apply_filters(
+                "threads", filter._filters, filter._side_effect_free, threads
+            )
+        with span("threads.executor"):
+            await asyncio.gather(*[executor.punish_executor(p) for p in punishes])
 
-    await asyncio.gather(*[t_runner.runner(t) for t in threads])
+        await asyncio.gather(*[t_runner.runner(t) for t in threads])
+        with span("threads.flush"):
+            await flush_punishes()
+
+    get_rulebook().maybe_report()
+
+
+perf_stat = aperf_stat()
 
 
 def __runner_perf_stat(func: TypeThreadsRunner) -> TypeThreadsRunner:
-    perf_stat = aperf_stat()
+    timed_func = perf_stat(func)
 
     async def _(fname: str, pn: int = 1) -> None:
-        punish = await perf_stat(func)(fname, pn)
+        punish = await timed_func(fname, pn)
         LOG().info(f"Checked pn={pn} time={perf_stat.last_time / 1e3:.5f}s")
         return punish
 
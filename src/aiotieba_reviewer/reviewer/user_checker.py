@@ -3,6 +3,7 @@ from __future__ import annotations
 from ..client import get_db
 from ..enums import Ops
 from ..punish import Punish
+from ..tracing import span
 from ..typing import TypeObj
 
 
@@ -14,8 +15,9 @@ def _user_checker(func):
     """
 
     async def _(obj: TypeObj) -> Punish | None:
-        db = await get_db()
-        permission = await db.get_user_id(obj.user.user_id)
+        with span("user_checker"):
+            db = await get_db()
+            permission = await db.get_user_id(obj.user.user_id)
         if permission <= -50:
             return Punish(obj, Ops.DELETE, 10, "黑名单")
         if permission >= 10:
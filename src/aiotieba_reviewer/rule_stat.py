@@ -0,0 +1,300 @@
+from __future__ import annotations
+
+import ast
+import functools
+import inspect
+import os
+import textwrap
+import time
+from collections import Counter
+from collections.abc import Callable
+
+from aiotieba import get_logger as LOG
+
+from .enums import Ops
+from .punish import Punish
+
+
+def op_name(op: int) -> str:
+    """
+    获取处罚类型的名称
+
+    Args:
+        op (int): 处罚类型 可以是Ops的组合
+
+    Returns:
+        str: 组合类型返回其数值
+    """
+
+    try:
+        return Ops(op).name
+    except ValueError:
+        return str(int(op))
+
+
+class RuleStat:
+    """
+    单条规则的命中统计
+
+    Attributes:
+        hits (int): 命中次数
+        cost_ns (int): 命中该规则的那些检查调用的总耗时 单位为纳秒
+        ops (Counter[str]): 处罚类型分布
+        days (Counter[int]): 封禁天数分布
+    """
+
+    __slots__ = ["hits", "cost_ns", "ops", "days"]
+
+    def __init__(self) -> None:
+        self.hits = 0
+        self.cost_ns = 0
+        self.ops: Counter[str] = Counter()
+        self.days: Counter[int] = Counter()
+
+    def __repr__(self) -> str:
+        return str({"hits": self.hits, "cost": self.cost_ns / 1e6, "ops": dict(self.ops), "days": dict(self.days)})
+
+
+class CheckerStat:
+    """
+    单个检查函数或过滤器的耗时统计
+
+    Attributes:
+        calls (int): 调用次数
+        cost_ns (int): 总耗时 单位为纳秒
+        hits (int): 产生的处罚数
+        rules (list[str]): 源码中出现的规则标识
+    """
+
+    __slots__ = ["calls", "cost_ns", "hits", "rules"]
+
+    def __init__(self, rules: list[str]) -> None:
+        self.calls = 0
+        self.cost_ns = 0
+        self.hits = 0
+        self.rules = rules
+
+    def __repr__(self) -> str:
+        return str({"calls": self.calls, "cost": self.cost_ns / 1e6, "hits": self.hits})
+
+
+def _inventory(func: Callable) -> list[str]:
+    """
+    从源码中找出函数内所有的Punish构造 得到其规则标识
+
+    Args:
+        func (Callable)
+
+    Returns:
+        list[str]: 规则标识 源码不可用时为空列表
+    """
+
+    try:
+        lines, first_line = inspect.getsourcelines(func)
+        tree = ast.parse(textwrap.dedent("".join(lines)))
+        filename = os.path.basename(inspect.getsourcefile(func))
+    except (OSError, TypeError, SyntaxError):
+        return []
+
+    rules = []
+    for node in ast.walk(tree):
+        if not isinstance(node, ast.Call):
+            continue
+        callee = node.func
+        name = callee.id if isinstance(callee, ast.Name) else getattr(callee, "attr", "")
+        if name != "Punish":
+            continue
+        # 只有带处罚类型或封禁天数的构造才会记录规则 Punish(obj)与Punish(obj, Ops.NORMAL)不计入
+        kwargs = {kw.arg: kw.value for kw in node.keywords}
+        op = node.args[1] if len(node.args) >= 2 else kwargs.get("op")
+        day = node.args[2] if len(node.args) >= 3 else kwargs.get("day")
+        if (op is None or isinstance(op, ast.Attribute) and op.attr == "NORMAL") and (
+            day is None or isinstance(day, ast.Constant) and not day.value
+        ):
+            continue
+
+        rule = kwargs.get("rule")
+        rule = rule.value if isinstance(rule, ast.Constant) else ""
+        rules.append(rule or f"{filename}:{node.lineno + first_line - 1}")
+
+    return sorted(set(rules), key=rules.index)
+
+
+class RuleBook:
+    """
+    规则的命中与耗时统计
+
+    规则以`Punish.rule`标识 默认为构造处罚时所在的"文件名:行号"
+    检查函数与过滤器以"层级:模块名.限定名"标识 每次调用都被计时 调用产生的处罚将该次耗时计入对应的规则
+
+    Args:
+        report_interval (float, optional): 记录统计报告的最小间隔 以秒为单位 0表示不记录. Defaults to 600.0.
+
+    Attributes:
+        enabled (bool): 是否启用 未启用时检查函数与过滤器不会被包装
+        rules (dict[str, RuleStat]): 各规则的命中统计
+        checkers (dict[str, CheckerStat]): 各检查函数与过滤器的耗时统计 键为"层级:模块名.限定名"
+            同一层级中模块名与限定名均相同的不同函数以"#序号"区分
+    """
+
+    __slots__ = ["enabled", "report_interval", "rules", "checkers", "_names", "_last_report"]
+
+    def __init__(self, report_interval: float = 600.0) -> None:
+        self.enabled = False
+        self.report_interval = report_interval
+        self.rules: dict[str, RuleStat] = {}
+        self.checkers: dict[str, CheckerStat] = {}
+        self._names: dict[tuple[str, Callable], str] = {}
+        self._last_report = time.monotonic()
+
+    def _name(self, level: str, func: Callable) -> str:
+        if (name := self._names.get((level, func))) is not None:
+            return name
+
+        # 检查函数常以_命名 须带上层级与模块名 仍重名时追加序号
+        base = f"{level}:{func.__module__}.{func.__qualname__}"
+        name = base
+        taken = set(self._names.values())
+        i = 1
+        while name in taken:
+            i += 1
+            name = f"{base}#{i}"
+        self._names[level, func] = name
+        return name
+
+    def account(self, func: Callable, level: str = "") -> Callable:
+        """
+        包装检查函数或过滤器 使其调用被计入统计
+
+        Args:
+            func (Callable): 检查函数或过滤器
+            level (str, optional): 所在层级 thread/post/comment/threads/posts/comments. Defaults to "".
+
+        Returns:
+            Callable: 包装后的函数 其`__wrapped__`为原函数
+
+        Note:
+            同一层级的同一函数被再次包装时沿用已有的统计
+        """
+
+        ori_func = inspect.unwrap(func)
+        name = self._name(level, ori_func)
+        if (stat := self.checkers.get(name)) is None:
+            stat = self.checkers[name] = CheckerStat(_inventory(ori_func))
+
+        @functools.wraps(func)
+        async def _(arg):
+            start = time.perf_counter_ns()
+            res = await func(arg)
+            cost = time.perf_counter_ns() - start
+
+            stat.calls += 1
+            stat.cost_ns += cost
+            if res is None:
+                return res
+
+            if isinstance(res, Punish):
+                if res:
+                    stat.hits += 1
+                    self._hit(res, cost)
+            else:
+                punishes = [p for p in res if p]
+                if punishes:
+                    stat.hits += len(punishes)
+                    share = cost // len(punishes)
+                    for punish in punishes:
+                        self._hit(punish, share)
+
+            return res
+
+        return _
+
+    def _hit(self, punish: Punish, cost: int) -> None:
+        rule = punish.rule or "unknown"
+        if (stat := self.rules.get(rule)) is None:
+            stat = self.rules[rule] = RuleStat()
+        stat.hits += 1
+        stat.cost_ns += cost
+        stat.ops[op_name(punish.op)] += 1
+        stat.days[punish.day] += 1
+
+    def report(self, limit: int = 10, min_rate: float = 0.001) -> str:
+        """
+        输出最耗时的检查函数与规则 以及很少命中的规则
+
+        Args:
+            limit (int, optional): 每一类最多输出的条数. Defaults to 10.
+            min_rate (float, optional): 命中次数低于调用次数的该比例时视为很少命中. Defaults to 0.001.
+
+        Returns:
+            str
+        """
+
+        lines = ["Most expensive checkers:"]
+        checkers = sorted(self.checkers.items(), key=lambda item: item[1].cost_ns, reverse=True)[:limit]
+        for name, stat in checkers:
+            avg = stat.cost_ns / (1e3 * stat.calls) if stat.calls else 0.0
+            lines.append(
+                f"  {name} calls={stat.calls} total={stat.cost_ns / 1e6:.1f}ms avg={avg:.1f}us hits={stat.hits}"
+            )
+
+        lines.append("Most expensive rules:")
+        rules = sorted(self.rules.items(), key=lambda item: item[1].cost_ns, reverse=True)[:limit]
+        for rule, stat in rules:
+            lines.append(
+                f"  {rule} hits={stat.hits} cost={stat.cost_ns / 1e6:.1f}ms ops={dict(stat.ops)} days={dict(stat.days)}"
+            )
+
+        rare = []
+        for name, checker in self.checkers.items():
+            for rule in checker.rules:
+                hits = stat.hits if (stat := self.rules.get(rule)) is not None else 0
+                if hits <= checker.calls * min_rate:
+                    rare.append((hits, rule, name, checker.calls))
+        rare.sort()
+        lines.append("Rarely fired rules:")
+        lines.extend(f"  {rule} in {name} hits={hits} calls={calls}" for hits, rule, name, calls in rare[:limit])
+
+        return "\n".join(lines)
+
+    def maybe_report(self) -> None:
+        """
+        距上次记录超过report_interval时在日志中输出统计报告
+        """
+
+        if self.enabled and self.report_interval and time.monotonic() - self._last_report >= self.report_interval:
+            self._last_report = time.monotonic()
+            LOG().info(f"Rule accounting:\n{self.report()}")
+
+
+_rulebook = RuleBook()
+
+
+def get_rulebook() -> RuleBook:
+    """
+    获取全局的规则统计
+
+    Returns:
+        RuleBook
+    """
+
+    return _rulebook
+
+
+def enable_rule_accounting(report_interval: float = 600.0) -> RuleBook:
+    """
+    启用规则的命中与耗时统计
+
+    Args:
+        report_interval (float, optional): 记录统计报告的最小间隔 以秒为单位 0表示不记录. Defaults to 600.0.
+
+    Returns:
+        RuleBook
+
+    Note:
+        须在设置检查函数与添加过滤器之前调用
+    """
+
+    _rulebook.enabled = True
+    _rulebook.report_interval = report_interval
+    return _rulebook
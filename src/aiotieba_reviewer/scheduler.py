@@ -0,0 +1,249 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import Counter
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+from aiotieba import get_logger as LOG
+
+from .ratelimit import is_transient
+
+
+class TimerHandle:
+    """
+    时间轮中的一个定时回调
+
+    Attributes:
+        deadline (float): 预定的触发时刻 基于time.monotonic
+    """
+
+    __slots__ = ["deadline", "callback", "rounds", "cancelled"]
+
+    def __init__(self, deadline: float, callback: Callable[[], Any], rounds: int) -> None:
+        self.deadline = deadline
+        self.callback = callback
+        self.rounds = rounds
+        self.cancelled = False
+
+    def cancel(self) -> None:
+        self.cancelled = True
+
+
+class TimerWheel:
+    """
+    哈希时间轮
+
+    所有定时回调共享一个驱动协程 插入与取消均为O(1)
+    没有待触发的回调时驱动协程自动退出 不会产生空转唤醒
+
+    Args:
+        tick (float, optional): 每格的时长 以秒为单位. Defaults to 0.1.
+        num_slots (int, optional): 格数. Defaults to 512.
+    """
+
+    __slots__ = ["tick", "num_slots", "_slots", "_cursor", "_size", "_driver"]
+
+    def __init__(self, tick: float = 0.1, num_slots: int = 512) -> None:
+        self.tick = tick
+        self.num_slots = num_slots
+        self._slots: list[list[TimerHandle]] = [[] for _ in range(num_slots)]
+        self._cursor = 0
+        self._size = 0
+        self._driver: asyncio.Task | None = None
+
+    def __len__(self) -> int:
+        return self._size
+
+    def call_later(self, delay: float, callback: Callable[[], Any]) -> TimerHandle:
+        """
+        在delay秒后调用callback
+
+        Args:
+            delay (float): 延迟 以秒为单位 精度为tick
+            callback (Callable[[], Any]): 回调函数
+
+        Returns:
+            TimerHandle: 可用于取消回调
+        """
+
+        ticks = max(1, round(delay / self.tick))
+        rounds, offset = divmod(ticks - 1, self.num_slots)
+        handle = TimerHandle(time.monotonic() + delay, callback, rounds)
+        self._slots[(self._cursor + offset) % self.num_slots].append(handle)
+        self._size += 1
+
+        if self._driver is None or self._driver.done():
+            self._driver = asyncio.create_task(self._drive())
+
+        return handle
+
+    async def _drive(self) -> None:
+        next_tick = time.monotonic()
+        while self._size:
+            next_tick += self.tick
+            await asyncio.sleep(max(0.0, next_tick - time.monotonic()))
+
+            slot = self._slots[self._cursor]
+            self._cursor = (self._cursor + 1) % self.num_slots
+            if not slot:
+                continue
+
+            remain = []
+            for handle in slot:
+                if handle.cancelled:
+                    self._size -= 1
+                elif handle.rounds:
+                    handle.rounds -= 1
+                    remain.append(handle)
+                else:
+                    self._size -= 1
+                    try:
+                        handle.callback()
+                    except Exception as err:
+                        LOG().warning(f"Timer callback failed. err={err!r}")
+            slot[:] = remain
+
+
+class RetryScheduler:
+    """
+    吧务写操作的重试调度
+
+    每次尝试都在调度器自己持有的任务中执行 因此不受发起者被取消的影响
+    延迟与退避由时间轮驱动 不占用发起者的协程
+
+    Args:
+        max_attempts (int, optional): 最大尝试次数. Defaults to 4.
+        backoff (float, optional): 首次重试的等待时间 以秒为单位. Defaults to 1.0.
+        wheel (TimerWheel, optional): 时间轮. Defaults to None.
+
+    Attributes:
+        outcomes (Counter[tuple[str, int]]): 各操作每次尝试的结果计数 键为(操作名, 错误码)
+            错误码0表示成功 -1表示非服务端错误
+        expired (int): 因超过截止时间而放弃的操作数
+    """
+
+    __slots__ = ["max_attempts", "backoff", "wheel", "outcomes", "expired", "_tasks", "_futures"]
+
+    def __init__(self, max_attempts: int = 4, backoff: float = 1.0, wheel: TimerWheel | None = None) -> None:
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.wheel = wheel if wheel is not None else TimerWheel()
+        self.outcomes: Counter[tuple[str, int]] = Counter()
+        self.expired = 0
+        self._tasks: set[asyncio.Task] = set()
+        # 尚未得到最终结果的操作 包括在时间轮中等待下一次尝试的操作
+        self._futures: set[asyncio.Future] = set()
+
+    def submit(
+        self,
+        name: str,
+        func: Callable[[], Awaitable[Any]],
+        *,
+        delay: float = 0.0,
+        deadline: float = 60.0,
+    ) -> asyncio.Future:
+        """
+        提交一个操作
+
+        Args:
+            name (str): 操作名 用于统计
+            func (Callable[[], Awaitable[Any]]): 每次尝试时调用的函数 返回值的err字段用于判断成败
+            delay (float, optional): 首次尝试前的延迟 以秒为单位. Defaults to 0.0.
+            deadline (float, optional): 自提交起的截止时间 以秒为单位. Defaults to 60.0.
+
+        Returns:
+            asyncio.Future: 操作的最终返回值 超过截止时间时为最后一次尝试的返回值或None
+        """
+
+        future = asyncio.get_running_loop().create_future()
+        self._futures.add(future)
+        future.add_done_callback(self._futures.discard)
+        expire = time.monotonic() + deadline
+
+        def _attempt(attempts: int) -> None:
+            task = asyncio.create_task(self._run(name, func, attempts, expire, future, _attempt))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+        if delay > 0.0:
+            self.wheel.call_later(delay, lambda: _attempt(1))
+        else:
+            _attempt(1)
+
+        return future
+
+    async def _run(
+        self,
+        name: str,
+        func: Callable[[], Awaitable[Any]],
+        attempts: int,
+        expire: float,
+        future: asyncio.Future,
+        again: Callable[[int], None],
+    ) -> None:
+        res = None
+        try:
+            res = await func()
+            err = getattr(res, "err", None)
+        except Exception as _err:
+            err = _err
+
+        self.record(name, err)
+
+        if future.done():
+            return
+        if err is None or not is_transient(err) or attempts >= self.max_attempts:
+            future.set_result(res)
+            return
+
+        delay = self.backoff * 2 ** (attempts - 1)
+        if time.monotonic() + delay > expire:
+            self.expired += 1
+            LOG().warning(f"Give up {name} after deadline. attempts={attempts} err={err}")
+            future.set_result(res)
+            return
+
+        self.wheel.call_later(delay, lambda: again(attempts + 1))
+
+    def record(self, name: str, err: Exception | None) -> None:
+        """
+        记录一次尝试的结果
+
+        Args:
+            name (str): 操作名
+            err (Exception | None): 尝试的错误 成功时为None
+        """
+
+        if err is None:
+            code = 0
+        elif (code := getattr(err, "code", 0)) == 0:
+            code = -1
+        self.outcomes[name, code] += 1
+
+    async def join(self) -> None:
+        """
+        等待所有已提交的操作得到最终结果 包括在时间轮中等待重试的操作
+        """
+
+        # asyncio.wait在自身被取消时不会取消所等待的操作
+        while self._futures or self._tasks:
+            await asyncio.wait({*self._futures, *self._tasks})
+
+
+_scheduler: RetryScheduler | None = None
+
+
+def get_retry_scheduler() -> RetryScheduler:
+    """
+    获取全局的重试调度器
+
+    Returns:
+        RetryScheduler
+    """
+
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = RetryScheduler()
+    return _scheduler
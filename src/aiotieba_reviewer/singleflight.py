@@ -0,0 +1,281 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+from typing import Any
+
+import aiotieba as tb
+from aiotieba import get_logger as LOG
+
+from .client import wrap_client
+from .metrics import MetricFamily, add_collector
+from .proxy import ClientProxy
+
+COALESCE_METHODS = frozenset(
+    {
+        "get_threads",
+        "get_posts",
+        "get_comments",
+        "get_homepage",
+        "get_user_info",
+        "tieba_uid2user_info",
+        "get_portrait",
+        "get_image",
+        "get_image_bytes",
+        "get_fid",
+        "get_fname",
+    }
+)
+CACHE_METHODS = frozenset(
+    {
+        "get_homepage",
+        "get_user_info",
+        "tieba_uid2user_info",
+        "get_portrait",
+        "get_image",
+        "get_image_bytes",
+        "get_fid",
+        "get_fname",
+    }
+)
+
+
+class MethodStat:
+    """
+    单个方法的去重统计
+
+    Attributes:
+        calls (int): 总调用次数
+        coalesced (int): 合并到进行中请求的次数
+        cache_hits (int): 命中结果缓存的次数
+    """
+
+    __slots__ = ["calls", "coalesced", "cache_hits"]
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.coalesced = 0
+        self.cache_hits = 0
+
+    def __repr__(self) -> str:
+        return str(
+            {
+                "calls": self.calls,
+                "coalesced": self.coalesced,
+                "cache_hits": self.cache_hits,
+                "dedupe_ratio": self.dedupe_ratio,
+            }
+        )
+
+    @property
+    def requests(self) -> int:
+        """
+        实际发出的请求数
+        """
+
+        return self.calls - self.coalesced - self.cache_hits
+
+    @property
+    def dedupe_ratio(self) -> float:
+        """
+        被去重的调用占比
+        """
+
+        if self.calls:
+            return (self.coalesced + self.cache_hits) / self.calls
+        return 0.0
+
+
+class SingleFlight:
+    """
+    合并完全相同的进行中请求
+
+    以方法名与参数为键 相同键的并发调用共享同一个请求
+    可选地在其上叠加一层短时结果缓存
+
+    Args:
+        ttl (float, optional): 结果缓存的有效期 以秒为单位 0表示不缓存. Defaults to 0.0.
+        maxsize (int, optional): 结果缓存的最大条目数. Defaults to 1024.
+        methods (frozenset[str], optional): 参与合并的只读方法. Defaults to COALESCE_METHODS.
+        cache_methods (frozenset[str], optional): 参与结果缓存的方法. Defaults to CACHE_METHODS.
+
+    Attributes:
+        stats (dict[str, MethodStat]): 各方法的去重统计
+
+    Note:
+        仅缓存`err`为None的结果
+        `get_threads`等需要及时刷新的方法默认只合并不缓存
+    """
+
+    __slots__ = [
+        "ttl",
+        "maxsize",
+        "methods",
+        "cache_methods",
+        "stats",
+        "_inflight",
+        "_cache",
+    ]
+
+    def __init__(
+        self,
+        ttl: float = 0.0,
+        maxsize: int = 1024,
+        methods: frozenset[str] = COALESCE_METHODS,
+        cache_methods: frozenset[str] = CACHE_METHODS,
+    ) -> None:
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.methods = methods
+        self.cache_methods = cache_methods
+
+        self.stats: dict[str, MethodStat] = {}
+        self._inflight: dict[Hashable, asyncio.Task] = {}
+        self._cache: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+
+    def wrap(self, client: tb.Client) -> SingleFlightClient:
+        """
+        使用该实例代理一个客户端
+
+        Args:
+            client (tb.Client)
+
+        Returns:
+            SingleFlightClient
+        """
+
+        return SingleFlightClient(client, self)
+
+    async def call(self, name: str, method: Callable, args: tuple, kwargs: dict) -> Any:
+        """
+        经由去重层调用方法
+
+        Args:
+            name (str): 方法名
+            method (Callable): 实际调用的方法
+            args (tuple): 位置参数
+            kwargs (dict): 关键字参数
+
+        Returns:
+            Any: 方法的返回值
+        """
+
+        key = (name, args, frozenset(kwargs.items()))
+        try:
+            hash(key)
+        except TypeError:
+            return await method(*args, **kwargs)
+
+        if (stat := self.stats.get(name)) is None:
+            stat = self.stats[name] = MethodStat()
+        stat.calls += 1
+
+        if self.ttl and name in self.cache_methods and (entry := self._cache.get(key)) is not None:
+            expire, res = entry
+            if expire > time.monotonic():
+                stat.cache_hits += 1
+                self._cache.move_to_end(key)
+                return res
+            del self._cache[key]
+
+        if (task := self._inflight.get(key)) is not None:
+            stat.coalesced += 1
+        else:
+            task = asyncio.ensure_future(method(*args, **kwargs))
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._on_done(name, key, t))
+
+        # shield保证发起者被取消时 其他等待者仍能拿到结果
+        return await asyncio.shield(task)
+
+    def _on_done(self, name: str, key: Hashable, task: asyncio.Task) -> None:
+        del self._inflight[key]
+
+        if task.cancelled() or task.exception() is not None:
+            return
+        if not self.ttl or name not in self.cache_methods:
+            return
+
+        res = task.result()
+        if getattr(res, "err", None) is not None:
+            return
+
+        self._cache[key] = (time.monotonic() + self.ttl, res)
+        self._cache.move_to_end(key)
+        if len(self._cache) > self.maxsize:
+            self._cache.popitem(last=False)
+
+    def collect(self) -> list[MetricFamily]:
+        """
+        以指标的形式输出各方法的去重统计
+
+        Returns:
+            list[MetricFamily]
+        """
+
+        samples = []
+        for name, stat in sorted(self.stats.items()):
+            samples.append(("", {"method": name, "result": "request"}, stat.requests))
+            samples.append(("", {"method": name, "result": "coalesced"}, stat.coalesced))
+            samples.append(("", {"method": name, "result": "cache_hit"}, stat.cache_hits))
+        return [MetricFamily("singleflight_calls_total", "counter", "Client calls through the dedupe layer", samples)]
+
+    def report(self) -> None:
+        """
+        在日志中输出各方法的去重统计
+        """
+
+        for name, stat in sorted(self.stats.items()):
+            LOG().info(
+                f"SingleFlight {name} calls={stat.calls} requests={stat.requests} dedupe_ratio={stat.dedupe_ratio:.2%}"
+            )
+
+
+class SingleFlightClient(ClientProxy):
+    """
+    合并相同进行中请求的客户端代理
+
+    Args:
+        client (tb.Client): 被代理的客户端
+        singleflight (SingleFlight): 去重层
+    """
+
+    __slots__ = ["_singleflight"]
+
+    def __init__(self, client: tb.Client, singleflight: SingleFlight) -> None:
+        super().__init__(client)
+        self._singleflight = singleflight
+
+    def _wrap(self, name: str, method: Callable) -> Callable:
+        if name not in self._singleflight.methods:
+            return method
+
+        singleflight = self._singleflight
+
+        async def _(*args, **kwargs):
+            return await singleflight.call(name, method, args, kwargs)
+
+        return _
+
+
+def enable_singleflight(ttl: float = 0.0, maxsize: int = 1024) -> SingleFlight:
+    """
+    为`get_client`返回的客户端启用请求去重
+
+    Args:
+        ttl (float, optional): 结果缓存的有效期 以秒为单位 0表示不缓存. Defaults to 0.0.
+        maxsize (int, optional): 结果缓存的最大条目数. Defaults to 1024.
+
+    Returns:
+        SingleFlight: 可通过其`stats`查看各方法的去重比例
+
+    Note:
+        须在`set_BDUSS_key`之后调用
+    """
+
+    singleflight = SingleFlight(ttl, maxsize)
+    wrap_client(singleflight.wrap)
+    add_collector(singleflight.collect)
+    return singleflight
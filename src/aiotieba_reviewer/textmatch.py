@@ -0,0 +1,395 @@
+from __future__ import annotations
+
+import re
+import re._constants as sre_constants
+import re._parser as sre_parse
+import unicodedata
+from collections.abc import Hashable, Iterable
+
+# 常见的形近字符 键为被替换的字符 值为替换后的字符 在NFKC与casefold之后应用
+CONFUSABLES: dict[str, str] = {
+    # 西里尔字母
+    "а": "a",
+    "в": "b",
+    "с": "c",
+    "е": "e",
+    "һ": "h",
+    "і": "i",
+    "ј": "j",
+    "к": "k",
+    "м": "m",
+    "н": "h",
+    "о": "o",
+    "р": "p",
+    "ѕ": "s",
+    "т": "t",
+    "у": "y",
+    "х": "x",
+    # 希腊字母
+    "α": "a",
+    "β": "b",
+    "ε": "e",
+    "ι": "i",
+    "κ": "k",
+    "ν": "v",
+    "ο": "o",
+    "ρ": "p",
+    "τ": "t",
+    "υ": "u",
+    "χ": "x",
+    # 数字与中文
+    "〇": "0",
+    "○": "0",
+    "壹": "1",
+    "贰": "2",
+    "叁": "3",
+    "肆": "4",
+    "伍": "5",
+    "陆": "6",
+    "柒": "7",
+    "捌": "8",
+    "玖": "9",
+    "➕": "+",
+    "薇": "微",
+    "徽": "微",
+    # 零宽字符
+    "\u200b": "",
+    "\u200c": "",
+    "\u200d": "",
+    "\u2060": "",
+    "\ufeff": "",
+}
+
+
+class _Regex:
+    __slots__ = ["rule_id", "pattern", "atom"]
+
+    def __init__(self, rule_id: Hashable, pattern: re.Pattern, atom: str) -> None:
+        self.rule_id = rule_id
+        self.pattern = pattern
+        self.atom = atom
+
+
+def _literals(pattern: re.Pattern) -> tuple[list[str] | None, str]:
+    """
+    分析正则表达式的结构
+
+    Args:
+        pattern (re.Pattern)
+
+    Returns:
+        tuple[list[str] | None, str]: 若表达式等价于若干字面量的选择则返回这些字面量 否则为None
+            以及表达式的任意匹配都必须包含的最长字面量 不存在时为空字符串
+    """
+
+    if pattern.flags & re.VERBOSE:
+        return None, ""
+    try:
+        parsed = list(sre_parse.parse(pattern.pattern, pattern.flags))
+    except (re.error, RecursionError):
+        return None, ""
+
+    def _run(items) -> str | None:
+        if all(op is sre_constants.LITERAL for op, _ in items):
+            return "".join(chr(av) for _, av in items)
+        return None
+
+    if (literal := _run(parsed)) is not None:
+        return [literal], literal
+    if len(parsed) == 1 and parsed[0][0] is sre_constants.BRANCH:
+        branches = [_run(list(branch)) for branch in parsed[0][1][1]]
+        if all(b is not None for b in branches):
+            return branches, ""
+
+    # 顶层序列中连续的字面量是任意匹配都必须包含的
+    atom = run = ""
+    for op, av in parsed:
+        if op is sre_constants.LITERAL:
+            run += chr(av)
+            if len(run) > len(atom):
+                atom = run
+        else:
+            run = ""
+    return None, atom
+
+
+_GLOBAL_FLAGS = re.compile(r"^\(\?[aiLmsux]+\)")
+_GROUP_REF = re.compile(r"\\[1-9]|\(\?P=|\(\?\(")
+_SCOPED_FLAGS = {re.IGNORECASE: "i", re.MULTILINE: "m", re.DOTALL: "s"}
+
+
+def _combine(patterns: list[re.Pattern]) -> re.Pattern | None:
+    """
+    将正则表达式合并为一个选择 合并后的表达式匹配当且仅当至少一个原表达式匹配
+
+    各分支使用非捕获组 捕获组会使sre无法从各分支的首字符集合中提取前缀 整体慢一个数量级
+
+    Returns:
+        re.Pattern | None: 存在无法合并的表达式时为None
+    """
+
+    parts = []
+    for pattern in patterns:
+        source = pattern.pattern
+        # 引用组号的表达式在合并后组号会改变
+        if not isinstance(source, str) or pattern.flags & re.VERBOSE or _GROUP_REF.search(source):
+            return None
+        source = _GLOBAL_FLAGS.sub("", source)
+        flags = "".join(c for f, c in _SCOPED_FLAGS.items() if pattern.flags & f)
+        parts.append(f"(?{flags}:{source})" if flags else f"(?:{source})")
+
+    try:
+        return re.compile("|".join(parts))
+    except re.error:
+        return None
+
+
+class TextMatcher:
+    """
+    编译后的多模式文本匹配器
+
+    关键词与可展开为关键词的正则表达式被合并为一个Aho-Corasick自动机 对文本只扫描一遍
+    其余的正则表达式若含有必需的字面量 则仅在自动机扫描到该字面量后才被执行
+    不含必需字面量的正则表达式被合并为一个选择 整体不匹配时无需逐一执行
+    在规范化后的文本上 匹配结果与逐条执行re.search一致
+
+    文本与关键词在匹配前均经过NFKC 大小写折叠与形近字符替换 全角字符因此与半角字符等价
+
+    Args:
+        normalize (bool, optional): 是否规范化文本与关键词. Defaults to True.
+        confusables (dict[str, str], optional): 额外的形近字符替换表 与CONFUSABLES合并. Defaults to None.
+
+    Note:
+        正则表达式作用于规范化后的文本 因此应当以小写半角的形式书写
+        含有大写或全角字符且未设置re.IGNORECASE的字面量表达式不会被展开为关键词 其匹配结果仍与re.search一致
+        规则可在任意时刻添加 新规则在下一次匹配前自动编译
+    """
+
+    __slots__ = [
+        "normalize_text",
+        "_table",
+        "_multi",
+        "_keywords",
+        "_regexes",
+        "_goto",
+        "_fail",
+        "_out",
+        "_combined",
+        "_atomless",
+        "_dirty",
+    ]
+
+    def __init__(self, normalize: bool = True, confusables: dict[str, str] | None = None) -> None:
+        self.normalize_text = normalize
+
+        table = dict(CONFUSABLES)
+        if confusables:
+            table.update(confusables)
+        self._table = str.maketrans({k: v for k, v in table.items() if len(k) == 1})
+        self._multi = [(k, v) for k, v in table.items() if len(k) > 1]
+
+        self._keywords: dict[str, set[Hashable]] = {}
+        self._regexes: list[_Regex] = []
+
+        self._goto: list[dict[str, int]] = []
+        self._fail: list[int] = []
+        self._out: list[tuple] = []
+        self._combined: re.Pattern | None = None
+        self._atomless: list[_Regex] = []
+        self._dirty = True
+
+    def __len__(self) -> int:
+        rule_ids = set()
+        for ids in self._keywords.values():
+            rule_ids.update(ids)
+        rule_ids.update(r.rule_id for r in self._regexes)
+        return len(rule_ids)
+
+    def normalize(self, text: str) -> str:
+        """
+        规范化文本
+
+        Args:
+            text (str)
+
+        Returns:
+            str: 经过NFKC 大小写折叠与形近字符替换的文本
+        """
+
+        if not self.normalize_text:
+            return text
+        text = unicodedata.normalize("NFKC", text).casefold().translate(self._table)
+        for src, dst in self._multi:
+            if src in text:
+                text = text.replace(src, dst)
+        return text
+
+    def add_keyword(self, rule_id: Hashable, *keywords: str) -> None:
+        """
+        添加关键词规则
+
+        Args:
+            rule_id (Hashable): 规则标识 多个关键词可以共用同一个标识
+            *keywords (str): 关键词
+        """
+
+        for keyword in keywords:
+            if keyword := self.normalize(keyword):
+                self._keywords.setdefault(keyword, set()).add(rule_id)
+        self._dirty = True
+
+    def add_regex(self, rule_id: Hashable, pattern: str | re.Pattern, flags: int = 0) -> None:
+        """
+        添加正则表达式规则
+
+        Args:
+            rule_id (Hashable): 规则标识
+            pattern (str | re.Pattern): 正则表达式
+            flags (int, optional): 编译选项 pattern为str时有效. Defaults to 0.
+        """
+
+        if isinstance(pattern, str):
+            pattern = re.compile(pattern, flags)
+
+        # 正则表达式作用于规范化后的文本 而关键词会被规范化
+        # 因此仅当规范化不改变字面量时 两者的匹配结果才一致
+        ignorecase = bool(pattern.flags & re.IGNORECASE)
+        literals, atom = _literals(pattern)
+        if literals is not None and all(
+            self.normalize(lit) == (lit.lower() if ignorecase else lit) for lit in literals
+        ):
+            self.add_keyword(rule_id, *literals)
+            return
+
+        # 忽略大小写时必需的字面量在文本中以小写出现 否则原样出现
+        if ignorecase:
+            atom = atom.lower()
+            if self.normalize(atom) != atom:
+                atom = ""
+        self._regexes.append(_Regex(rule_id, pattern, atom))
+        self._dirty = True
+
+    def add_rules(self, rules: Iterable[tuple[Hashable, str]], *, regex: bool = False) -> None:
+        """
+        批量添加规则
+
+        Args:
+            rules (Iterable[tuple[Hashable, str]]): (规则标识, 关键词或正则表达式)
+            regex (bool, optional): 是否按正则表达式添加. Defaults to False.
+        """
+
+        for rule_id, rule in rules:
+            if regex:
+                self.add_regex(rule_id, rule)
+            else:
+                self.add_keyword(rule_id, rule)
+
+    def compile(self) -> None:
+        """
+        构建自动机与合并的正则表达式 匹配时会在需要时自动调用
+        """
+
+        goto: list[dict[str, int]] = [{}]
+        out: list[set] = [set()]
+
+        def _insert(word: str, item) -> None:
+            state = 0
+            for ch in word:
+                if (nxt := goto[state].get(ch)) is None:
+                    nxt = goto[state][ch] = len(goto)
+                    goto.append({})
+                    out.append(set())
+                state = nxt
+            out[state].add(item)
+
+        for keyword, rule_ids in self._keywords.items():
+            for rule_id in rule_ids:
+                _insert(keyword, rule_id)
+
+        atomless = []
+        for regex in self._regexes:
+            if regex.atom:
+                _insert(regex.atom, regex)
+            else:
+                atomless.append(regex)
+
+        # 按广度优先顺序计算失配指针 并将失配链上的输出合并到每个状态
+        fail = [0] * len(goto)
+        queue = list(goto[0].values())
+        for state in queue:
+            for ch, nxt in goto[state].items():
+                queue.append(nxt)
+                f = fail[state]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[nxt] = goto[f].get(ch, 0) if goto[f].get(ch) != nxt else 0
+                out[nxt] |= out[fail[nxt]]
+
+        self._goto = goto
+        self._fail = fail
+        self._out = [tuple(o) for o in out]
+        self._atomless = atomless
+        self._combined = _combine([r.pattern for r in atomless]) if atomless else None
+        self._dirty = False
+
+    def match(self, text: str) -> set[Hashable]:
+        """
+        找出与文本匹配的所有规则
+
+        Args:
+            text (str)
+
+        Returns:
+            set[Hashable]: 匹配的规则标识
+        """
+
+        if self._dirty:
+            self.compile()
+        text = self.normalize(text)
+
+        goto = self._goto
+        fail = self._fail
+        out = self._out
+        root = goto[0]
+
+        found = set()
+        state = 0
+        for ch in text:
+            if state:
+                while (nxt := goto[state].get(ch)) is None and state:
+                    state = fail[state]
+                if nxt is None:
+                    continue
+                state = nxt
+            elif (state := root.get(ch, 0)) == 0:
+                continue
+            if items := out[state]:
+                found.update(items)
+
+        rule_ids = set()
+        for item in found:
+            if isinstance(item, _Regex):
+                if item.rule_id not in rule_ids and item.pattern.search(text):
+                    rule_ids.add(item.rule_id)
+            else:
+                rule_ids.add(item)
+
+        if self._atomless and (self._combined is None or self._combined.search(text)):
+            for regex in self._atomless:
+                if regex.rule_id not in rule_ids and regex.pattern.search(text):
+                    rule_ids.add(regex.rule_id)
+
+        return rule_ids
+
+    def search(self, text: str) -> bool:
+        """
+        文本是否与任意规则匹配
+
+        Args:
+            text (str)
+
+        Returns:
+            bool
+        """
+
+        return bool(self.match(text))
@@ -0,0 +1,353 @@
+from __future__ import annotations
+
+import contextlib
+import time
+from collections.abc import Callable
+from contextvars import ContextVar
+from typing import Any
+
+import aiotieba as tb
+from aiotieba import get_logger as LOG
+
+from .perf_stat import aperf_stat
+from .proxy import ClientProxy
+
+TypeSpanExporter = Callable[["Span"], None]
+
+_current_span: ContextVar[Span | None] = ContextVar("span", default=None)
+_NULL_CONTEXT = contextlib.nullcontext()
+
+
+class Span:
+    """
+    一段计时区间
+
+    Attributes:
+        name (str): 阶段名 如threads.producer client.get_posts
+        attrs (dict[str, Any]): 附加属性 如tid pid
+        start_ns (int): 开始时刻 基于time.perf_counter_ns
+        end_ns (int): 结束时刻 未结束时为0
+        children (list[Span]): 子区间
+    """
+
+    __slots__ = ["name", "attrs", "start_ns", "end_ns", "children"]
+
+    def __init__(self, name: str, attrs: dict[str, Any]) -> None:
+        self.name = name
+        self.attrs = attrs
+        self.start_ns = time.perf_counter_ns()
+        self.end_ns = 0
+        self.children: list[Span] = []
+
+    @property
+    def duration(self) -> float:
+        """
+        耗时
+
+        Note:
+            单位为毫秒
+        """
+
+        return (self.end_ns - self.start_ns) / 1e6
+
+    def to_dict(self) -> dict[str, Any]:
+        """
+        转换为可被json序列化的字典
+
+        Returns:
+            dict[str, Any]
+        """
+
+        return {
+            "name": self.name,
+            "attrs": self.attrs,
+            "start_ns": self.start_ns,
+            "duration": self.duration,
+            "children": [child.to_dict() for child in self.children],
+        }
+
+    def format(self, max_depth: int = 0) -> str:
+        """
+        格式化为缩进的树状文本
+
+        Args:
+            max_depth (int, optional): 最大展开深度 0表示不限制. Defaults to 0.
+
+        Returns:
+            str
+        """
+
+        lines = []
+
+        def _format(span: Span, depth: int) -> None:
+            attrs = " ".join(f"{k}={v}" for k, v in span.attrs.items())
+            lines.append(f"{'  ' * depth}{span.name} {span.duration:.3f}ms {attrs}".rstrip())
+            if max_depth and depth + 1 >= max_depth:
+                return
+            for child in span.children:
+                _format(child, depth + 1)
+
+        _format(self, 0)
+        return "\n".join(lines)
+
+
+class StageStat:
+    """
+    单个阶段的累计耗时
+
+    Attributes:
+        count (int): 次数
+        total_ns (int): 总耗时 单位为纳秒
+        max_ns (int): 最大耗时 单位为纳秒
+        recent (aperf_stat): 最近一段时间的耗时分布
+    """
+
+    __slots__ = ["count", "total_ns", "max_ns", "recent"]
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.total_ns = 0
+        self.max_ns = 0
+        self.recent = aperf_stat()
+
+    def add(self, duration_ns: int) -> None:
+        self.recent.record(duration_ns)
+        self.count += 1
+        self.total_ns += duration_ns
+        if duration_ns > self.max_ns:
+            self.max_ns = duration_ns
+
+    @property
+    def avg_time(self) -> float:
+        """
+        平均耗时
+
+        Note:
+            单位为毫秒
+        """
+
+        if self.count:
+            return self.total_ns / (1e6 * self.count)
+        return 0.0
+
+    def __repr__(self) -> str:
+        return str(
+            {
+                "count": self.count,
+                "total": self.total_ns / 1e6,
+                "avg": self.avg_time,
+                "max": self.max_ns / 1e6,
+            }
+        )
+
+
+class _SpanContext:
+    __slots__ = ["tracer", "span", "token", "is_root"]
+
+    def __init__(self, tracer: Tracer, span: Span) -> None:
+        self.tracer = tracer
+        self.span = span
+        self.token = None
+        self.is_root = False
+
+    def __enter__(self) -> Span:
+        span = self.span
+        parent = _current_span.get()
+        self.is_root = parent is None
+        # 仅在需要导出时建树 否则只做累计
+        if parent is not None and self.tracer.exporter is not None:
+            parent.children.append(span)
+        self.token = _current_span.set(span)
+        return span
+
+    def __exit__(self, exc_type=None, exc_val=None, exc_tb=None) -> None:
+        _current_span.reset(self.token)
+        self.tracer._finish(self.span, self.is_root)
+
+
+class Tracer:
+    """
+    分阶段计时
+
+    每个阶段对应一个Span 同一协程调用链以及由其派生的任务中的Span构成一棵树
+    每棵树的根结束时被交给exporter 同时按阶段名累计耗时 并按report_interval记录累计耗时报告
+    不含子区间的孤立区间 如后台任务中的单次数据库操作 不会被交给exporter
+
+    Args:
+        exporter (TypeSpanExporter, optional): 根区间结束时的回调. Defaults to None.
+        report_interval (float, optional): 记录累计耗时报告的最小间隔 以秒为单位 0表示不记录. Defaults to 60.0.
+
+    Attributes:
+        enabled (bool): 是否启用 未启用时span几乎没有开销
+        stats (dict[str, StageStat]): 各阶段的累计耗时
+    """
+
+    __slots__ = ["enabled", "exporter", "report_interval", "stats", "_last_report"]
+
+    def __init__(self, exporter: TypeSpanExporter | None = None, report_interval: float = 60.0) -> None:
+        self.enabled = False
+        self.exporter = exporter
+        self.report_interval = report_interval
+        self.stats: dict[str, StageStat] = {}
+        self._last_report = time.monotonic()
+
+    def span(self, name: str, **attrs) -> contextlib.AbstractContextManager[Span | None]:
+        """
+        创建一个计时区间
+
+        Args:
+            name (str): 阶段名
+            **attrs: 附加属性
+
+        Returns:
+            contextlib.AbstractContextManager[Span | None]: 未启用时进入后得到None
+        """
+
+        if not self.enabled:
+            return _NULL_CONTEXT
+        return _SpanContext(self, Span(name, attrs))
+
+    def _finish(self, span: Span, is_root: bool) -> None:
+        span.end_ns = time.perf_counter_ns()
+
+        if (stat := self.stats.get(span.name)) is None:
+            stat = self.stats[span.name] = StageStat()
+        stat.add(span.end_ns - span.start_ns)
+
+        if not is_root:
+            return
+
+        if self.exporter is not None and span.children:
+            try:
+                self.exporter(span)
+            except Exception as err:
+                LOG().warning(f"Failed to export span. err={err!r}")
+
+        if self.report_interval and time.monotonic() - self._last_report >= self.report_interval:
+            self._last_report = time.monotonic()
+            LOG().info(f"Stage latency:\n{self.report()}")
+
+    def report(self, limit: int = 20) -> str:
+        """
+        按总耗时降序输出各阶段的累计耗时
+
+        Args:
+            limit (int, optional): 最多输出的阶段数. Defaults to 20.
+
+        Returns:
+            str
+        """
+
+        stats = sorted(self.stats.items(), key=lambda item: item[1].total_ns, reverse=True)[:limit]
+        width = max((len(name) for name, _ in stats), default=0)
+        return "\n".join(
+            f"{name:<{width}} count={stat.count} total={stat.total_ns / 1e6:.1f}ms "
+            f"avg={stat.avg_time:.3f}ms max={stat.max_ns / 1e6:.3f}ms"
+            for name, stat in stats
+        )
+
+    def reset(self) -> None:
+        """
+        清空累计耗时
+        """
+
+        self.stats.clear()
+
+
+_tracer = Tracer()
+
+
+def get_tracer() -> Tracer:
+    """
+    获取全局的计时器
+
+    Returns:
+        Tracer
+    """
+
+    return _tracer
+
+
+def span(name: str, **attrs) -> contextlib.AbstractContextManager[Span | None]:
+    """
+    在全局计时器上创建一个计时区间
+
+    Args:
+        name (str): 阶段名
+        **attrs: 附加属性
+
+    Returns:
+        contextlib.AbstractContextManager[Span | None]
+    """
+
+    if not _tracer.enabled:
+        return _NULL_CONTEXT
+    return _SpanContext(_tracer, Span(name, attrs))
+
+
+def current_span() -> Span | None:
+    """
+    获取当前所在的计时区间
+
+    Returns:
+        Span | None
+    """
+
+    return _current_span.get()
+
+
+class TracedClient(ClientProxy):
+    """
+    为每个客户端方法调用创建计时区间的客户端代理
+    """
+
+    __slots__ = []
+
+    def _wrap(self, name: str, method: Callable) -> Callable:
+        if not name.startswith(("get_", "search_", "del_", "block", "unblock", "hide_")):
+            return method
+
+        span_name = f"client.{name}"
+
+        async def _(*args, **kwargs):
+            with span(span_name):
+                return await method(*args, **kwargs)
+
+        return _
+
+
+def enable_tracing(
+    exporter: TypeSpanExporter | None = None,
+    report_interval: float = 60.0,
+    trace_client: bool = True,
+) -> Tracer:
+    """
+    启用分阶段计时
+
+    Args:
+        exporter (TypeSpanExporter, optional): 每轮审查结束时接收该轮的根区间. Defaults to None.
+        report_interval (float, optional): 记录累计耗时报告的最小间隔 以秒为单位 0表示不记录. Defaults to 60.0.
+        trace_client (bool, optional): 是否为客户端方法调用计时. Defaults to True.
+
+    Returns:
+        Tracer
+
+    Note:
+        须在`set_BDUSS_key`之后调用
+        若启用了请求去重等其他客户端代理 应最后调用本函数 使计时包含排队与去重的耗时
+    """
+
+    from .client import wrap_client
+
+    _tracer.enabled = True
+    _tracer.exporter = exporter
+    _tracer.report_interval = report_interval
+
+    if trace_client:
+
+        def _wrap(client: tb.Client) -> TracedClient:
+            return TracedClient(client)
+
+        wrap_client(_wrap)
+
+    return _tracer